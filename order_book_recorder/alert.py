@@ -1,30 +1,26 @@
 import logging
 import datetime
-from asyncio import create_task
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
 
+from order_book_recorder.history import AlertHistory, AlertKind
 from order_book_recorder.notify import notify
 from order_book_recorder.opportunity import Opportunity
 
 
 logger = logging.getLogger(__name__)
 
-#: List of ended Alert instances
-past_alerts = []
-
-#: Alert key -> Alert instance mappings
-active_alerts = {}
-
 
 ALERT_TEXT = """
     Market: {a.market}
     Depth: {a.depth} {a.base_token}
     Buy at: {a.buy_exchange} {a.buy_price} {a.quote_token}
-    Sell at: {a.sell_exchange} {a.sell_price} {a.quote_token}
+    Sell at: {a.sell_route} {a.sell_price} {a.quote_token}
     Arb opportunity: {a.diff} {a.quote_token}
     Profitability: {a.profitability}
     Potential profit: {a.potential_profit} {a.quote_token}
+    Optimal size after fees: {a.optimal_quantity} {a.base_token}
+    Profit at optimal size: {a.optimal_profit} {a.quote_token}
     Started: {a.started}
     Ended: {a.friendly_ended}
     Profitability at end: {a.friendly_profitability_at_end}
@@ -58,6 +54,8 @@ class Alert:
     ended: Optional[datetime.datetime] = None
     profitability_at_end: Optional[float] = None
 
+    kind: AlertKind = AlertKind.market
+
     @property
     def key(self):
         return f"{self.market} @{self.depth}"
@@ -78,6 +76,11 @@ class Alert:
     def sell_exchange(self) -> str:
         return self.max_opportunity.sell_exchange
 
+    @property
+    def sell_route(self) -> str:
+        """Sell exchange, followed by the conversions back for cross currency alerts."""
+        return self.max_opportunity.route
+
     @property
     def buy_price(self) -> str:
         return f"{self.max_opportunity.buy_price:,.2f}"
@@ -98,6 +101,18 @@ class Alert:
     def potential_profit(self):
         return f"{self.max_opportunity.diff * self.max_opportunity.quantity:,.2f}"
 
+    @property
+    def optimal_quantity(self) -> str:
+        if self.max_opportunity.optimal_quantity is None:
+            return "---"
+        return f"{self.max_opportunity.optimal_quantity:,.4f}"
+
+    @property
+    def optimal_profit(self) -> str:
+        if self.max_opportunity.optimal_profit is None:
+            return "---"
+        return f"{self.max_opportunity.optimal_profit:,.2f}"
+
     @property
     def duration(self) -> str:
         if not self.ended:
@@ -111,7 +126,7 @@ class Alert:
 
     @property
     def friendly_profitability_at_end(self):
-        return f"{self.profitability_at_end * 100:,.5f}%" if self.profitability_at_end else "---"
+        return f"{self.profitability_at_end * 100:,.5f}%" if self.profitability_at_end is not None else "---"
 
     def output_nicely(self):
         return ALERT_TEXT.format(a=self)
@@ -120,8 +135,8 @@ class Alert:
 async def send_message(title, formatted):
     """Send alert message to various enabled channels (Telegram)"""
     logger.info("%s: %s", title, formatted)
-    # Immediately return and don't wait asyncio success
-    create_task(notify(title, formatted))
+    # Queued, bursts of alerts are merged to digests
+    await notify(title, formatted)
 
 
 async def notify_started(a: Alert):
@@ -139,89 +154,86 @@ async def notify_upgraded(a: Alert):
     await send_message("🔥 Opportunity upgraded", formatted)
 
 
-async def update_alerts(all_opportunities: Dict[str, Dict[float, List[Opportunity]]], alert_threshold, retrigger_threshold):
-    """When the arbitrage opportunity exceeds a threshold, then fire up an alert.
+class AlertBook:
+    """Alert state machine with one slot per market and depth.
 
-    :param opportunities: Current opportunities
+    A slot holds the active alert of its market and depth, or None.
+    Alerts are created only when an opportunity starts,
+    so a cycle where nothing changes does not allocate.
     """
 
-    triggered = []
-    triggered_markets = set()
-
-    market_final_profitabilities = {}
-
-    # Write out top opportunities for each market and depth on each cycle
-    for market, depths in all_opportunities.items():
-        depth_opportunities: List[Opportunity]
-        for depth, depth_opportunities in depths.items():
-            for opportunity in depth_opportunities:
-                if opportunity.profit_without_fees >= alert_threshold:
-                    # Generate an alert
-                    alert = Alert(
-                        market=market,
-                        depth=depth,
-                        started=datetime.datetime.utcnow(),
-                        original_opportunity=opportunity,
-                        max_opportunity=opportunity,
-                    )
-
-                    triggered.append(alert)
-                    triggered_markets.add(alert.key)
-
-                key = f"{market} @{depth}"
-                market_final_profitabilities[key] = max(market_final_profitabilities.get(market, -1000), opportunity.profit_without_fees)
-
-    # Close old alerts
-    to_delete = []
-    for key, alert in active_alerts.items():
-        if key not in triggered_markets:
-            alert.ended = datetime.datetime.utcnow()
-            alert.profitability_at_end = market_final_profitabilities[key]
-            past_alerts.append(alert)
-            await notify_ended(alert)
-            to_delete.append(key)
-
-    # Do not modify dict during iteration
-    for key in to_delete:
-        del active_alerts[key]
-
-    # Check which markets trigger alerts on this round
-    # Because we might get multiple opportunites per exchanges
-    # only notify the max opportunity - largest spread between buy and sell
-    notify_active = {}
-    notify_upgrade = {}
-
-    # See if we need to upgrade our alerts for higher profitability
-    for alert in triggered:
-        key = alert.key
-
-        existing_alert = active_alerts.get(key)
-        if not existing_alert:
-            # First notification for this market
-            prior_alert_this_round = notify_active.get(key)
-            if not prior_alert_this_round:
-                notify_active[key] = alert
-            else:
-                # Get weakest and strongest exchange
-                notify_active[key] = notify_active[key] if notify_active[key].profitability > alert.profitability else alert
-        else:
-            # This market has been notified already for this window
-            # see if we need to upgrade the alert
-            if alert.max_opportunity.profit_without_fees - existing_alert.max_opportunity.profit_without_fees > retrigger_threshold:
-                prior_alert_this_round = notify_upgrade.get(key)
-                if not prior_alert_this_round:
-                    notify_upgrade[key] = alert
-                else:
-                    # Get weakest and strongest exchange
-                    notify_upgrade[key] = notify_upgrade[key] if notify_upgrade[key].profitability > alert.profitability else alert
-
-    # Send notifications
-    for alert in notify_active.values():
-        active_alerts[alert.key] = alert
-        await notify_started(alert)
-
-    for alert in notify_upgrade.values():
-        active_alerts[alert.key].max_opportunity = alert.max_opportunity
-        await notify_upgraded(alert)
+    def __init__(self, alert_threshold: float, retrigger_threshold: float, market_depths: Optional[Dict[str, Iterable[float]]] = None, history: Optional[AlertHistory] = None, kind: AlertKind = AlertKind.market):
+        """
 
+        :param alert_threshold: Start an alert when profitability is at or above this
+        :param retrigger_threshold: Upgrade an active alert when profitability grows more than this
+        :param market_depths: market -> depth levels to preallocate slots for
+        :param history: Where ended alerts go, by default only the recent ones are kept in memory
+        :param kind: Kind of the alerts this book creates, books of different kinds can share a history
+        """
+        self.alert_threshold = alert_threshold
+        self.retrigger_threshold = retrigger_threshold
+        self.kind = kind
 
+        #: market -> depth -> active alert or None
+        self.slots: Dict[str, Dict[float, Optional[Alert]]] = {}
+        for market, depths in (market_depths or {}).items():
+            self.slots[market] = {depth: None for depth in depths}
+
+        #: Ended alerts
+        self.history = history if history is not None else AlertHistory()
+
+    @property
+    def active_alerts(self) -> Dict[str, Alert]:
+        """Alert key -> Alert instance mappings"""
+        return {a.key: a for depths in self.slots.values() for a in depths.values() if a is not None}
+
+    async def update(self, all_opportunities: Dict[str, Dict[float, List[Opportunity]]], now: Optional[datetime.datetime] = None):
+        """Start, upgrade and end alerts.
+
+        Only the best opportunity of each market and depth is considered.
+        Markets missing from `all_opportunities` keep their alerts.
+
+        :param all_opportunities: market -> depth -> opportunities, ranked from the best to worst
+        :param now: Timestamp for started and ended alerts, replays use the recorded time
+        """
+
+        if now is None:
+            now = datetime.datetime.utcnow()
+
+        alert_threshold = self.alert_threshold
+        retrigger_threshold = self.retrigger_threshold
+
+        for market, depths in all_opportunities.items():
+            market_slots = self.slots.get(market)
+            if market_slots is None:
+                market_slots = self.slots[market] = {}
+
+            depth_opportunities: List[Opportunity]
+            for depth, depth_opportunities in depths.items():
+                best = depth_opportunities[0] if depth_opportunities else None
+                alert = market_slots.get(depth)
+
+                if alert is None:
+                    if best is not None and best.profit_without_fees >= alert_threshold:
+                        alert = Alert(
+                            market=market,
+                            depth=depth,
+                            started=now,
+                            original_opportunity=best,
+                            max_opportunity=best,
+                            kind=self.kind,
+                        )
+                        market_slots[depth] = alert
+                        await notify_started(alert)
+
+                elif best is None or best.profit_without_fees < alert_threshold:
+                    alert.ended = now
+                    alert.profitability_at_end = best.profit_without_fees if best is not None else None
+                    market_slots[depth] = None
+                    self.history.append(alert)
+                    await notify_ended(alert)
+
+                elif best.profit_without_fees - alert.max_opportunity.profit_without_fees > retrigger_threshold:
+                    alert.max_opportunity = best
+                    await notify_upgraded(alert)
@@ -0,0 +1,51 @@
+"""Capture order books received by watchers for replay.py."""
+import json
+import time
+from typing import Iterable
+
+
+class BookCapture:
+    """Write order books received by watchers to a JSONL file.
+
+    The first line describes the watchers, each following line is one order book update.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.out = open(path, "wt")
+        self.books = 0
+
+    def write_header(self, watchers: list):
+        header = {
+            "type": "watchers",
+            "watchers": [{"exchange": w.exchange_name, "market": w.market, "depth_levels": w.depth_levels} for w in watchers],
+        }
+        self.out.write(json.dumps(header) + "\n")
+
+    def write(self, watcher):
+        book = watcher.orderbook
+        record = {
+            "type": "book",
+            "received_at": time.time(),
+            "exchange": watcher.exchange_name,
+            "market": watcher.market,
+            "nonce": book.get("nonce"),
+            "timestamp": book.get("timestamp"),
+            "asks": book["asks"],
+            "bids": book["bids"],
+        }
+        self.out.write(json.dumps(record) + "\n")
+        self.books += 1
+
+    def close(self):
+        self.out.close()
+
+
+def read_capture(path: str) -> Iterable[dict]:
+    """Read a capture file line by line.
+
+    :return: The header first, then order book records
+    """
+    with open(path, "rt") as inp:
+        for line in inp:
+            yield json.loads(line)
@@ -0,0 +1,277 @@
+"""Local memory-mapped columnar order book depth recorder.
+
+An alternative to the Redis Timeseries recorder that does not need a server.
+
+Samples are appended to fixed-size segments. Each segment has one file per column:
+
+- `segment-000000.timestamp.i8`: UNIX timestamps as milliseconds, int64
+
+- `segment-000000.series.u4`: series id, uint32
+
+- `segment-000000.price.f8`: price, float64
+
+`index.i8` holds the number of rows written to each segment
+and `series.json` maps series ids to (exchange, market, side, depth).
+
+The writer fills the columns first and bumps the row count in the index after that,
+so other processes can map the files with :py:class:`ColumnarReader` and read them
+zero-copy while the tracker is running.
+"""
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from order_book_recorder import config
+from order_book_recorder.side import Side
+from order_book_recorder.utils import to_async
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Rows per segment, 20 MB of column files per segment
+SEGMENT_ROWS = 1_048_576
+
+#: Segment slots in the index file
+MAX_SEGMENTS = 65_536
+
+COLUMN_DTYPES = {
+    "timestamp": np.int64,
+    "series": np.uint32,
+    "price": np.float64,
+}
+
+COLUMN_SUFFIXES = {
+    "timestamp": "i8",
+    "series": "u4",
+    "price": "f8",
+}
+
+# All writes go through a single thread, so appends are never interleaved
+columnar_thread_pool = ThreadPoolExecutor(max_workers=1)
+
+_writer: Optional["ColumnarWriter"] = None
+
+# In-process counter of samples we have written
+columnar_updates = 0
+
+
+def get_column_path(path: str, segment: int, column: str) -> str:
+    return os.path.join(path, f"segment-{segment:06d}.{column}.{COLUMN_SUFFIXES[column]}")
+
+
+def open_index(path: str, mode: str) -> np.memmap:
+    """Map the per-segment row counts."""
+    return np.memmap(os.path.join(path, "index.i8"), dtype=np.int64, mode=mode, shape=(MAX_SEGMENTS,))
+
+
+class ColumnarWriter:
+    """Append depth samples to memory-mapped column files."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        index_path = os.path.join(path, "index.i8")
+        self.index = open_index(path, "r+" if os.path.exists(index_path) else "w+")
+
+        #: (exchange, market, side, depth) -> series id
+        self.series_ids: Dict[Tuple[str, str, Side, float], int] = {}
+        self.series: List[dict] = []
+        self.load_series()
+
+        # Continue the last segment with data
+        used = np.flatnonzero(self.index)
+        self.segment = int(used[-1]) if len(used) else 0
+        self.columns = self.open_segment(self.segment)
+
+        self.lock = threading.Lock()
+
+    def load_series(self):
+        series_path = os.path.join(self.path, "series.json")
+        if os.path.exists(series_path):
+            with open(series_path, "rt") as inp:
+                self.series = json.load(inp)["series"]
+            for s in self.series:
+                self.series_ids[(s["exchange"], s["market"], Side(s["side"]), s["depth"])] = s["id"]
+
+    def save_series(self):
+        """Atomically replace the series map, so readers never see a half written file."""
+        series_path = os.path.join(self.path, "series.json")
+        temp_path = series_path + ".tmp"
+        with open(temp_path, "wt") as out:
+            json.dump({"series": self.series}, out)
+        os.replace(temp_path, series_path)
+
+    def open_segment(self, segment: int) -> Dict[str, np.memmap]:
+        assert segment < MAX_SEGMENTS, "Columnar recorder index is full"
+        columns = {}
+        for column, dtype in COLUMN_DTYPES.items():
+            column_path = get_column_path(self.path, segment, column)
+            mode = "r+" if os.path.exists(column_path) else "w+"
+            columns[column] = np.memmap(column_path, dtype=dtype, mode=mode, shape=(SEGMENT_ROWS,))
+        return columns
+
+    def register(self, exchange: str, market: str, side: Side, depth: float) -> int:
+        """Get a series id, adding a new series if needed."""
+        with self.lock:
+            series_id = self.series_ids.get((exchange, market, side, depth))
+            if series_id is None:
+                series_id = len(self.series)
+                self.series.append({
+                    "id": series_id,
+                    "exchange": exchange,
+                    "market": market,
+                    "side": side.value,
+                    "depth": depth,
+                })
+                self.series_ids[(exchange, market, side, depth)] = series_id
+                self.save_series()
+            return series_id
+
+    def get_series_id(self, exchange: str, market: str, side: Side, depth: float) -> int:
+        series_id = self.series_ids.get((exchange, market, side, depth))
+        if series_id is None:
+            series_id = self.register(exchange, market, side, depth)
+        return series_id
+
+    def append(self, timestamp_ms: int, series_ids: List[int], prices: List[float]):
+        """Append samples of one tick."""
+        series_ids = np.asarray(series_ids, dtype=np.uint32)
+        prices = np.asarray(prices, dtype=np.float64)
+
+        written = 0
+        while written < len(prices):
+            count = int(self.index[self.segment])
+            if count >= SEGMENT_ROWS:
+                self.segment += 1
+                self.columns = self.open_segment(self.segment)
+                continue
+
+            chunk = min(SEGMENT_ROWS - count, len(prices) - written)
+            end = count + chunk
+            self.columns["timestamp"][count:end] = timestamp_ms
+            self.columns["series"][count:end] = series_ids[written:written + chunk]
+            self.columns["price"][count:end] = prices[written:written + chunk]
+
+            # Publish the rows to readers only after the data is in place
+            self.index[self.segment] = end
+            written += chunk
+
+
+class ColumnarReader:
+    """Read recorded depth samples zero-copy, also while the tracker is writing."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index = open_index(path, "r")
+
+    def get_series(self) -> List[dict]:
+        """Series id -> (exchange, market, side, depth) descriptions."""
+        with open(os.path.join(self.path, "series.json"), "rt") as inp:
+            return json.load(inp)["series"]
+
+    def get_segments(self) -> List[int]:
+        """Segments with data."""
+        return np.flatnonzero(self.index).tolist()
+
+    def read_segment(self, segment: int) -> Dict[str, np.ndarray]:
+        """Map the written rows of one segment.
+
+        :return: column name -> read-only array view of the memory-mapped file
+        """
+        count = int(self.index[segment])
+        columns = {}
+        for column, dtype in COLUMN_DTYPES.items():
+            data = np.memmap(get_column_path(self.path, segment, column), dtype=dtype, mode="r")
+            columns[column] = data[:count]
+        return columns
+
+    def read_series(self, series_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Get all samples of one series.
+
+        :return: (timestamps, prices)
+        """
+        timestamps = []
+        prices = []
+        for segment in self.get_segments():
+            columns = self.read_segment(segment)
+            mask = columns["series"] == series_id
+            timestamps.append(columns["timestamp"][mask])
+            prices.append(columns["price"][mask])
+
+        if not timestamps:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        return np.concatenate(timestamps), np.concatenate(prices)
+
+
+def is_enabled():
+    return config.RECORDER_BACKEND == "columnar"
+
+
+def init_recorder(path: str) -> ColumnarWriter:
+    global _writer
+    if _writer:
+        logger.info("Columnar recorder already initialised")
+        return _writer
+
+    logger.info("Opening columnar recorder at %s", path)
+    _writer = ColumnarWriter(path)
+    return _writer
+
+
+def get_writer() -> ColumnarWriter:
+    assert _writer
+    return _writer
+
+
+def register_watchers(watchers: list):
+    """Create series for all depths of the watchers at the startup.
+
+    :param watchers: List of :py:class:`order_book_recorder.watcher.Watcher`
+    """
+    writer = get_writer()
+    for w in watchers:
+        for depth in w.depth_levels:
+            writer.register(w.exchange_name, w.market, Side.ask, depth)
+            writer.register(w.exchange_name, w.market, Side.bid, depth)
+
+
+def format_stats() -> str:
+    return f"depth records written {columnar_updates}"
+
+
+@to_async(executor=columnar_thread_pool)
+def record_depths(timestamp_ms: int, depth_data: List[dict]):
+    """Write multiple depths to the column files.
+
+    Takes the same records as the Redis recorder.
+    """
+
+    global columnar_updates
+
+    assert is_enabled(), "Columnar recording is not turned on"
+
+    writer = get_writer()
+
+    series_ids = []
+    prices = []
+    for r in depth_data:
+        # See Watcher.get_depth_record()
+        exchange_name = r["exchange_name"]
+        market = r["market"]
+        for depth, price in r["ask_levels"].items():
+            series_ids.append(writer.get_series_id(exchange_name, market, Side.ask, depth))
+            prices.append(price)
+        for depth, price in r["bid_levels"].items():
+            series_ids.append(writer.get_series_id(exchange_name, market, Side.bid, depth))
+            prices.append(price)
+
+    writer.append(timestamp_ms, series_ids, prices)
+    columnar_updates += len(prices)
@@ -1,9 +1,9 @@
 import os
 import logging
+from typing import List, Optional
 
-import ccxt
+import ccxt.async_support
 import ccxtpro
-from ccxtpro.base.exchange import Exchange as ProExchange
 
 
 logger = logging.getLogger(__name__)
@@ -22,6 +22,9 @@ ETH_DEPTHS = [0.5]
 # BTC_DEPTHS = [0.04]
 # ETH_DEPTHS = [0.5]
 
+# Converting between the fiat currencies, depth levels paired with the crypto levels above
+EUR_DEPTHS = [2000]
+
 MARKETS = ["BTC/GBP", "ETH/GBP", "BTC/EUR", "ETH/EUR"]
 
 MARKET_DEPTHS = {
@@ -31,6 +34,17 @@ MARKET_DEPTHS = {
     "ETH/EUR": ETH_DEPTHS,
 }
 
+# Watched only to price the fiat conversions of the cross currency search,
+# no same market alerts, depth recording or price board rows
+CONVERSION_MARKETS = ["EUR/GBP"]
+
+CONVERSION_MARKET_DEPTHS = {
+    "EUR/GBP": EUR_DEPTHS,
+}
+
+# Look for arbitrage across these quote currencies, see currencygraph.py
+FIAT_CURRENCIES = ["EUR", "GBP"]
+
 # Raise alert if the profitability is more than 15 BPS
 # ALERT_THRESHOLD = 0.0018
 ALERT_THRESHOLD = 0.0018
@@ -39,10 +53,88 @@ ALERT_THRESHOLD = 0.0018
 # Retrigger alert for every 5 BPS move to higher arb
 RETRIGGER_THRESHOLD = 0.0005
 
+# How many best opportunities per market and depth we evaluate in detail,
+# on the top of all opportunities above ALERT_THRESHOLD
+OPPORTUNITY_TOP_K = 2
+
+# Taker fees of the exchanges, used to find the most profitable trade size of an opportunity.
+# Entry level fees from the exchange fee schedules, check your own account tier.
+TAKER_FEES = {
+    "Huobi": 0.002,
+    "Kraken": 0.0026,
+    "FTX": 0.0007,
+    "Bitfinex": 0.002,
+    "Bitstamp": 0.005,
+    "Gemini": 0.0035,
+    "Coinbase": 0.005,
+    "Exmo": 0.003,
+}
+
+# How many top levels of each order book side sharding workers send to the main process with the depth levels.
+# Optimal trade sizes and liquidity queries in the main process see only these levels.
+SHARD_BOOK_LEVELS = 20
+
+# How many ended alerts to keep in memory
+ALERT_HISTORY_SIZE = 1000
+
+# SQLite database where all ended alerts are written, see history.py. Not written if not set.
+ALERT_HISTORY_PATH = os.environ.get("ALERT_HISTORY_PATH")
+
+# How often to write a snapshot to the opportunity stream, seconds, see stream.py
+STREAM_INTERVAL = 1.0
+
+# Rotate the opportunity stream file when it grows over this size
+STREAM_MAX_BYTES = 100 * 1024 * 1024
+
+# How many rotated opportunity stream files to keep
+STREAM_BACKUP_COUNT = 5
+
+# How many snapshots can wait for the opportunity stream writer before they are dropped
+STREAM_QUEUE_SIZE = 100
+
+# Live dashboard frames per second
+DASHBOARD_FPS = 4
+
+# Publish current depth prices in this shared memory block for other processes, see priceboard.py
+PRICE_BOARD_NAME = os.environ.get("PRICE_BOARD_NAME")
+
+# Serve pipeline latency histograms for Prometheus at http://127.0.0.1:METRICS_PORT/metrics
+METRICS_PORT = int(os.environ["METRICS_PORT"]) if os.environ.get("METRICS_PORT") else None
+
 TELEGRAM_CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID")
 
 TELEGRAM_API_KEY = os.environ.get("TELEGRAM_API_KEY")
 
+# Bot API server, point to a local stand-in for testing
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")
+
+# Telegram allows 20 messages per minute to a group
+TELEGRAM_RATE = 20 / 60
+TELEGRAM_BURST = 3
+
+# Merge queued Telegram messages to one digest when this many are waiting
+TELEGRAM_QUEUE_SIZE = 20
+
+
+# Fastest and slowest we poll one market of a REST-only exchange, seconds
+REST_MIN_POLL_INTERVAL = 2.0
+REST_MAX_POLL_INTERVAL = 30.0
+
+
+# Where to write order book depths: redis or columnar
+RECORDER_BACKEND = os.environ.get("RECORDER_BACKEND", "redis")
+
+# Directory for the columnar recorder memory-mapped files
+COLUMNAR_RECORDER_PATH = os.environ.get("COLUMNAR_RECORDER_PATH", "depth-data")
+
+# Write depth records in a background task
+RECORDER_BG_WRITES = True
+
+# How many ticks can wait for background write before the overflow policy kicks in
+RECORDER_QUEUE_SIZE = 10
+
+# block, drop_oldest or coalesce, see recordqueue.OverflowPolicy
+RECORDER_OVERFLOW_POLICY = os.environ.get("RECORDER_OVERFLOW_POLICY", "coalesce")
 
 if os.environ.get("REDIS_HOST"):
     REDIS_CONFIG = {
@@ -55,34 +147,33 @@ if os.environ.get("REDIS_HOST"):
     if os.environ.get("REDIS_PASSWORD"):
         REDIS_CONFIG["password"] = os.environ["REDIS_PASSWORD"]
 
-    # Fire and forget Redis io
-    REDIS_BG_WRITES = True
-
 else:
     REDIS_CONFIG = None
 
 
-async def setup_exchanges():
-    exchanges = {
-        "Huobi": ccxtpro.huobi({'enableRateLimit': True}),
-        "Kraken": ccxtpro.kraken({'enableRateLimit': True}),
-        "FTX": ccxtpro.ftx({'enableRateLimit': True}),
-        "Bitfinex": ccxtpro.bitfinex({'enableRateLimit': True}),
-        "Bitstamp": ccxtpro.bitstamp({'enableRateLimit': True}),
-        "Gemini": ccxt.gemini({'enableRateLimit': True}),
-        "Coinbase": ccxtpro.coinbasepro({'enableRateLimit': True}),
-        "Exmo": ccxt.exmo({'enableRateLimit': True}),
-    }
+# Exchange name -> CCXT exchange constructor
+EXCHANGE_FACTORIES = {
+    "Huobi": lambda: ccxtpro.huobi({'enableRateLimit': True}),
+    "Kraken": lambda: ccxtpro.kraken({'enableRateLimit': True}),
+    "FTX": lambda: ccxtpro.ftx({'enableRateLimit': True}),
+    "Bitfinex": lambda: ccxtpro.bitfinex({'enableRateLimit': True}),
+    "Bitstamp": lambda: ccxtpro.bitstamp({'enableRateLimit': True}),
+    # REST only, throttled by polling.RestPoller
+    "Gemini": lambda: ccxt.async_support.gemini({'enableRateLimit': False}),
+    "Coinbase": lambda: ccxtpro.coinbasepro({'enableRateLimit': True}),
+    "Exmo": lambda: ccxt.async_support.exmo({'enableRateLimit': False}),
+}
 
-    for name, xchg in exchanges.items():
 
-        if isinstance(xchg, ProExchange):
-            # CCXT Pro
-            logger.info("Loading markets for %s %s", name, xchg)
-            await xchg.load_markets()
-        else:
-            # CCXT blocking API
-            logger.info("Calling blocking API for %s %s", name, xchg)
-            xchg.load_markets()
+async def setup_exchanges(names: Optional[List[str]] = None):
+    """Create exchanges and load their markets.
+
+    :param names: Only set up these exchanges, used by sharding workers
+    """
+    exchanges = {name: factory() for name, factory in EXCHANGE_FACTORIES.items() if names is None or name in names}
+
+    for name, xchg in exchanges.items():
+        logger.info("Loading markets for %s %s", name, xchg)
+        await xchg.load_markets()
 
     return exchanges
\ No newline at end of file
@@ -0,0 +1,351 @@
+"""Find arbitrage across quote currencies with negative cycle detection.
+
+Buying BTC with GBP on one exchange and selling it for EUR on another
+is profitable if converting the EUR back to GBP leaves more GBP than we started with.
+Trades like this are cycles in a graph where currencies are nodes and trades are edges
+weighted by the negative logarithm of their exchange rate.
+A cycle with a negative total weight multiplies the money going around it,
+and Bellman-Ford finds these cycles.
+
+- Crypto currencies are split by the fiat currency they were bought with, e.g. ``BTC@GBP``,
+  and can only be sold for another fiat currency. Round trips within one market are
+  left to :py:class:`order_book_recorder.opportunity.OpportunityEvaluator`.
+
+- Fiat currencies are connected by conversion markets like EUR/GBP, watched like any other market.
+  Both directions of a conversion come from the exchange with the tightest spread,
+  so converting back and forth always loses money.
+
+- Edge prices are the depth prices of the watchers, so every leg of a cycle can trade the watched depth.
+
+Edges are updated in place when a watcher gets new depth levels,
+and cycles are searched again only for graphs that changed.
+"""
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from order_book_recorder.opportunity import Opportunity
+from order_book_recorder.side import Side
+
+
+#: Ignore cycles that make less than this in log space, rounding errors
+EPSILON = 1e-12
+
+
+class Leg:
+    """One trade in the graph, the best offer of the exchanges trading it."""
+
+    __slots__ = ("exchange_name", "market", "side", "price", "rate", "weight")
+
+    def __init__(self, exchange_name: str, market: str, side: Side, price: float, rate: float):
+        self.exchange_name = exchange_name
+        self.market = market
+
+        #: Order book side we trade against, ask when buying the base currency, bid when selling it
+        self.side = side
+
+        #: Depth price in the market quote currency
+        self.price = price
+
+        #: How much of the target currency we get for one unit of the source currency
+        self.rate = rate
+
+        self.weight = -math.log(rate)
+
+    def __repr__(self):
+        return f"Leg({self.exchange_name!r}, {self.market!r}, {self.side!r}, {self.price!r}, {self.rate!r})"
+
+    def to_dict(self) -> dict:
+        """JSON friendly description of the trade, for the alert history and the opportunity stream."""
+        return {"exchange": self.exchange_name, "market": self.market, "side": self.side.value, "price": self.price}
+
+
+#: (from node, to node, leg)
+Edge = Tuple[str, str, Leg]
+
+
+class CrossCurrencyOpportunity(Opportunity):
+    """Buy a coin in one market and sell it back to the same currency through other markets.
+
+    ``sell_exchange`` is where the coin is sold, the conversions back are in ``legs``.
+    """
+
+    __slots__ = ("legs",)
+
+    def __init__(self, market: str, quantity: float, sell_price: float, legs: List[Leg]):
+        """
+
+        :param market: Market where we buy the coin
+        :param quantity: Depth level of the market
+        :param sell_price: What the rest of the legs give back for one coin, in the quote currency of the market
+        :param legs: The trades of the cycle, buying the coin first and selling it second
+        """
+        super().__init__(market, legs[0].exchange_name, legs[1].exchange_name, quantity, legs[0].price, sell_price)
+        self.legs = legs
+
+    @property
+    def route(self) -> str:
+        """Where we sell and convert back, e.g. Bitstamp BTC/EUR, Kraken EUR/GBP"""
+        return ", ".join(f"{leg.exchange_name} {leg.market}" for leg in self.legs[1:])
+
+    def __repr__(self):
+        return f"CrossCurrencyOpportunity(market={self.market!r}, quantity={self.quantity!r}, sell_price={self.sell_price!r}, legs={self.legs!r})"
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return super().__eq__(other) and [leg.to_dict() for leg in self.legs] == [leg.to_dict() for leg in other.legs]
+
+    __hash__ = None
+
+
+class CurrencyGraph:
+    """Exchange rate graph of all watched markets at one depth each."""
+
+    def __init__(self, market_depths: Dict[str, float], fiat_currencies: Iterable[str]):
+        """
+
+        :param market_depths: market -> depth level the edge prices are taken at
+        :param fiat_currencies: Quote currencies, e.g. EUR and GBP
+        """
+        self.market_depths = market_depths
+        self.fiat_currencies = set(fiat_currencies)
+
+        #: Markets where we buy a crypto currency with fiat
+        self.buy_markets: List[str] = []
+
+        #: Markets where we convert between fiat currencies
+        self.conversion_markets: List[str] = []
+
+        #: market -> (from node, to node, buy) edges priced by the market
+        self.market_edges: Dict[str, List[Tuple[str, str, bool]]] = {}
+
+        for market in market_depths:
+            base, quote = market.split("/")
+            if quote not in self.fiat_currencies:
+                continue
+
+            if base in self.fiat_currencies:
+                # Sell the base at bid, buy it back at ask
+                self.conversion_markets.append(market)
+                self.market_edges[market] = [(base, quote, False), (quote, base, True)]
+            else:
+                # Buy with this fiat, sell for any other fiat
+                self.buy_markets.append(market)
+                edges = [(quote, f"{base}@{quote}", True)]
+                edges += [(f"{base}@{other}", quote, False) for other in sorted(self.fiat_currencies) if other != quote]
+                self.market_edges[market] = edges
+
+        self.nodes = sorted(set(node for edges in self.market_edges.values() for u, v, buy in edges for node in (u, v)))
+
+        #: (from node, to node) -> (exchange, market) -> leg offered by the exchange
+        self.candidates: Dict[Tuple[str, str], Dict[Tuple[str, str], Leg]] = defaultdict(dict)
+
+        #: conversion market -> exchange -> (ask, bid)
+        self.conversion_quotes: Dict[str, Dict[str, Tuple[float, float]]] = defaultdict(dict)
+
+        #: (from node, to node) -> best leg
+        self.edges: Dict[Tuple[str, str], Leg] = {}
+
+        #: Edges changed since the last cycle search
+        self.dirty = True
+
+    def set_edge(self, u: str, v: str, leg: Optional[Leg]):
+        if leg is None:
+            if self.edges.pop((u, v), None) is not None:
+                self.dirty = True
+        elif self.edges.get((u, v)) is not leg:
+            self.edges[(u, v)] = leg
+            self.dirty = True
+
+    def update(self, exchange_name: str, market: str, ask_levels: Dict[float, float], bid_levels: Dict[float, float]):
+        """Update the edges priced by one watcher.
+
+        Only the edges of the market are touched, the best exchange is picked again for those.
+
+        :param ask_levels: [quantity target, price] map
+        :param bid_levels: [quantity target, price] map
+        """
+        edges = self.market_edges.get(market)
+        if not edges:
+            return
+
+        depth = self.market_depths[market]
+        ask = ask_levels.get(depth)
+        bid = bid_levels.get(depth)
+
+        if market in self.conversion_markets:
+            self.update_conversion(exchange_name, market, ask, bid)
+            return
+
+        for u, v, buy in edges:
+            price = ask if buy else bid
+            candidates = self.candidates[(u, v)]
+            if price:
+                candidates[(exchange_name, market)] = Leg(exchange_name, market, Side.ask if buy else Side.bid, price, 1 / price if buy else price)
+            else:
+                # Exchange does not have data for the depth
+                candidates.pop((exchange_name, market), None)
+
+            self.set_edge(u, v, max(candidates.values(), key=lambda leg: leg.rate, default=None))
+
+    def update_conversion(self, exchange_name: str, market: str, ask: Optional[float], bid: Optional[float]):
+        quotes = self.conversion_quotes[market]
+        if ask and bid:
+            quotes[exchange_name] = (ask, bid)
+        else:
+            quotes.pop(exchange_name, None)
+
+        (sell_u, sell_v, _), (buy_u, buy_v, _) = self.market_edges[market]
+
+        if not quotes:
+            self.set_edge(sell_u, sell_v, None)
+            self.set_edge(buy_u, buy_v, None)
+            return
+
+        best_exchange, (best_ask, best_bid) = min(quotes.items(), key=lambda item: item[1][0] / item[1][1])
+
+        # Keep the legs if the best quote did not change
+        current = self.edges.get((sell_u, sell_v))
+        if current and current.exchange_name == best_exchange and current.price == best_bid and self.edges[(buy_u, buy_v)].price == best_ask:
+            return
+
+        self.set_edge(sell_u, sell_v, Leg(best_exchange, market, Side.bid, best_bid, best_bid))
+        self.set_edge(buy_u, buy_v, Leg(best_exchange, market, Side.ask, best_ask, 1 / best_ask))
+
+    def find_negative_cycle(self, source: str) -> Optional[List[Edge]]:
+        """Run Bellman-Ford from a node.
+
+        :return: Edges of a negative cycle reachable from the source, or None
+        """
+        dist = {node: math.inf for node in self.nodes}
+        dist[source] = 0.0
+        predecessor: Dict[str, str] = {}
+        edges = list(self.edges.items())
+
+        for i in range(len(self.nodes) - 1):
+            relaxed = False
+            for (u, v), leg in edges:
+                candidate = dist[u] + leg.weight
+                if candidate < dist[v] - EPSILON:
+                    dist[v] = candidate
+                    predecessor[v] = u
+                    relaxed = True
+            if not relaxed:
+                return None
+
+        for (u, v), leg in edges:
+            if dist[u] + leg.weight < dist[v] - EPSILON:
+                predecessor[v] = u
+
+                # Walk back far enough to be on the cycle
+                node = v
+                for i in range(len(self.nodes)):
+                    node = predecessor[node]
+
+                cycle_nodes = [node]
+                current = predecessor[node]
+                while current != node:
+                    cycle_nodes.append(current)
+                    current = predecessor[current]
+                cycle_nodes.reverse()
+
+                return [(a, b, self.edges[(a, b)]) for a, b in zip(cycle_nodes, cycle_nodes[1:] + cycle_nodes[:1])]
+
+        return None
+
+    def find_cycles(self) -> List[List[Edge]]:
+        """Find profitable cycles, at most one reachable from each fiat currency."""
+        cycles = []
+        seen = set()
+        for source in sorted(self.fiat_currencies):
+            if source not in self.nodes:
+                continue
+            cycle = self.find_negative_cycle(source)
+            if cycle:
+                key = frozenset((u, v) for u, v, leg in cycle)
+                if key not in seen:
+                    seen.add(key)
+                    cycles.append(cycle)
+        self.dirty = False
+        return cycles
+
+    def cycle_to_opportunity(self, cycle: List[Edge]) -> Optional[CrossCurrencyOpportunity]:
+        """Describe a cycle as buying a crypto currency and selling it through the rest of the cycle.
+
+        The sell price is what the rest of the cycle gives back, in the currency we bought with.
+
+        :return: Opportunity or None if the cycle does not buy a crypto currency
+        """
+        starts = [idx for idx, (u, v, leg) in enumerate(cycle) if u in self.fiat_currencies and v not in self.fiat_currencies]
+        if not starts:
+            return None
+
+        # Start from the same leg every time, so the alert stays with the same market
+        start = min(starts, key=lambda idx: cycle[idx][2].market)
+        cycle = cycle[start:] + cycle[:start]
+
+        buy = cycle[0][2]
+        gain = 1.0
+        for u, v, leg in cycle:
+            gain *= leg.rate
+
+        return CrossCurrencyOpportunity(
+            market=buy.market,
+            quantity=self.market_depths[buy.market],
+            sell_price=buy.price * gain,
+            legs=[leg for u, v, leg in cycle],
+        )
+
+
+class CrossCurrencyEvaluator:
+    """Keep currency graphs for each depth level and search them for cycles when they change.
+
+    Depth levels of different markets are paired by their index, see ``config.MARKET_DEPTHS``.
+    Has the same interface as :py:class:`order_book_recorder.opportunity.OpportunityEvaluator`.
+    """
+
+    def __init__(self, market_depths: Dict[str, List[float]], fiat_currencies: Iterable[str]):
+        """
+
+        :param market_depths: market -> watched depth levels
+        :param fiat_currencies: Quote currencies, e.g. EUR and GBP
+        """
+        depth_count = max([len(depths) for depths in market_depths.values()] or [0])
+        self.graphs = [
+            CurrencyGraph({market: depths[idx] for market, depths in market_depths.items() if idx < len(depths)}, fiat_currencies)
+            for idx in range(depth_count)
+        ]
+
+        #: market -> depth -> ranked opportunities, buying from the market, from the last evaluation
+        self.opportunities: Dict[str, Dict[float, List[Opportunity]]] = {}
+        for graph in self.graphs:
+            for market in graph.buy_markets:
+                self.opportunities.setdefault(market, {})[graph.market_depths[market]] = []
+
+    def update_prices(self, market: str, exchange_name: str, ask_levels: Dict[float, float], bid_levels: Dict[float, float]):
+        for graph in self.graphs:
+            graph.update(exchange_name, market, ask_levels, bid_levels)
+
+    def evaluate(self) -> Dict[str, Dict[float, List[Opportunity]]]:
+        """Search the changed graphs for cycles.
+
+        :return: market -> depth -> ranked opportunities, empty lists for markets without profitable cycles
+        """
+        for graph in self.graphs:
+            if not graph.dirty:
+                continue
+
+            found: Dict[str, List[Opportunity]] = defaultdict(list)
+            for cycle in graph.find_cycles():
+                opportunity = graph.cycle_to_opportunity(cycle)
+                if opportunity:
+                    found[opportunity.market].append(opportunity)
+
+            for market in graph.buy_markets:
+                depth = graph.market_depths[market]
+                ranked = sorted(found.get(market, []), key=lambda o: o.profit_without_fees, reverse=True)
+                # Replace, do not modify, the depth map of the market, like OpportunityEvaluator
+                self.opportunities[market] = {**self.opportunities[market], depth: ranked}
+
+        return self.opportunities
@@ -0,0 +1,107 @@
+"""Live Rich dashboard of prices, opportunities and log output."""
+import asyncio
+from typing import Dict, List, Tuple
+
+from rich.layout import Layout
+from rich.live import Live
+from rich.table import Table
+
+from order_book_recorder.logtable import BufferedOutputHandler, refresh_log_messages
+from order_book_recorder.opportunity import Opportunity, OpportunityEvaluator
+from order_book_recorder.pricetable import PriceTable
+from order_book_recorder.watcher import Watcher
+
+
+class OpportunityTable:
+    """Rich table of the best opportunities for each market and depth.
+
+    Rows are formatted again only for the markets that were re-evaluated since the last render.
+    """
+
+    def __init__(self, top_n=2):
+        """
+
+        :param top_n: How many opportunities to show per market and depth
+        """
+        self.top_n = top_n
+
+        #: market -> opportunities the rows were formatted from
+        self.sources: Dict[str, Dict[float, List[Opportunity]]] = {}
+
+        #: market -> formatted rows
+        self.rows: Dict[str, List[Tuple[str, ...]]] = {}
+
+    def format_rows(self, market: str, depths: Dict[float, List[Opportunity]]) -> List[Tuple[str, ...]]:
+        base, quote = market.split("/")
+        rows = []
+        for depth, depth_opportunities in depths.items():
+            for o in depth_opportunities[:self.top_n]:
+                rows.append((
+                    market,
+                    f"{depth} {base}",
+                    f"{o.buy_exchange} {o.buy_price:,.2f}",
+                    f"{o.sell_exchange} {o.sell_price:,.2f}",
+                    f"{o.profit_without_fees * 100:,.5f}%",
+                    f"{o.diff:,.2f} {quote}",
+                ))
+        return rows
+
+    def render(self, opportunities: Dict[str, Dict[float, List[Opportunity]]]) -> Table:
+        table = Table()
+        table.add_column("Market")
+        table.add_column("Depth")
+        table.add_column("Buy")
+        table.add_column("Sell")
+        table.add_column("Profitability")
+        table.add_column("Diff")
+
+        for market, depths in opportunities.items():
+            # The evaluator replaces the depth map of a market when it re-evaluates it
+            if self.sources.get(market) is not depths:
+                self.sources[market] = depths
+                self.rows[market] = self.format_rows(market, depths)
+
+            for row in self.rows[market]:
+                table.add_row(*row)
+
+        return table
+
+
+class Dashboard:
+    """Render the dashboard in its own task at a fixed frame rate.
+
+    Frames are built on the event loop from the current state, so they are consistent.
+    The terminal output is done by the Rich Live refresh thread,
+    so a slow terminal does not hold up market processing.
+    """
+
+    def __init__(self, exchange_names: List[str], markets: List[str], watchers_by_market: Dict[str, Dict[str, Watcher]], evaluator: OpportunityEvaluator, log_handler: BufferedOutputHandler):
+        self.evaluator = evaluator
+        self.log_handler = log_handler
+        self.price_table = PriceTable(exchange_names, markets, watchers_by_market)
+        self.opportunity_table = OpportunityTable()
+
+    def render(self) -> Layout:
+        layout = Layout()
+
+        layout.split_row(
+            Layout(name="left"),
+            Layout(name="right"),
+        )
+
+        layout["left"].split_column(
+            Layout(self.price_table.render(), name="top"),
+            Layout(self.opportunity_table.render(self.evaluator.opportunities), name="bottom"),
+        )
+
+        layout["right"].update(refresh_log_messages(self.log_handler))
+        return layout
+
+    async def run(self, live: Live, fps: float):
+        """Keep updating the live display.
+
+        :param fps: Frames per second
+        """
+        while True:
+            live.update(self.render())
+            await asyncio.sleep(1 / fps)
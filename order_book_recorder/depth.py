@@ -1,8 +1,10 @@
 """Calculate orderbook price depths"""
 import logging
 import enum
-from typing import List, Tuple
+import itertools
+from typing import List, Optional, Tuple
 
+import numpy as np
 
 from .side import Side
 
@@ -10,12 +12,54 @@ from .side import Side
 logger = logging.getLogger(__name__)
 
 
+#: How many order book levels we convert to NumPy arrays on the first try
+INITIAL_HEAD_SIZE = 32
+
+#: Up to this many targets a Python walk of the book beats the NumPy engine,
+#: whatever the book depth, see scripts/benchmark-depth.py.
+#: The NumPy conversion costs ~20 µs even for a short head of the book.
+WALK_MAX_TARGETS = 256
+
+
+def orders_to_array(orders: list) -> Tuple[np.ndarray, np.ndarray]:
+    """Turn (price, quantity) levels to price and quantity arrays.
+
+    :param orders: (price, quantity) tuples from the exchange order book, must not be empty
+
+    :return: (prices, quantities)
+    """
+    # CCXT structure, some exchanges give extra columns after (price, quantity)
+    width = len(orders[0])
+    flat = np.fromiter(itertools.chain.from_iterable(orders), dtype=np.float64, count=width * len(orders))
+    book = flat.reshape(-1, width)
+    return book[:, 0], book[:, 1]
+
+
+def cumulate_orders(orders: list) -> Tuple[np.ndarray, np.ndarray]:
+    """Turn (price, quantity) levels to cumulative quantity and cumulative notional arrays.
+
+    :param orders: (price, quantity) tuples from the exchange order book, must not be empty
+
+    :return: (cumulated quantity, cumulated notional)
+    """
+    prices, quantities = orders_to_array(orders)
+    return np.cumsum(quantities), np.cumsum(prices * quantities)
+
+
 def calculate_price_at_depths(orders: list, side: Side, target_levels: List[float]) -> Tuple[bool, dict, float]:
     """Get price in the order book at certain depths.
 
     You may or may not get all target depths matched, depending how deep your order book sample is
     (limit in CCXT parley). Or the order book might not have enough liquidity in the first place.
 
+    The price for a target is the average price of all order book levels
+    consumed until the cumulative quantity reaches the target,
+    including the full quantity of the last consumed level.
+
+    The configured markets watch one or a few shallow targets, and those are resolved
+    by walking the book in Python. Only for hundreds of targets the levels are turned
+    to cumulative quantity and cumulative notional NumPy arrays and all targets are looked up at once with `searchsorted`.
+
     :param orders: (price, quantity) tuples from the exchange order book
 
     :param side: Are we looking to buy or sell the base token
@@ -24,15 +68,244 @@ def calculate_price_at_depths(orders: list, side: Side, target_levels: List[floa
 
     :return: (success, Map[quantity target, price], max depth reached)
     """
+    success, reached_levels, max_level, level_count = calculate_depth_profile(orders, side, target_levels)
+    return success, reached_levels, max_level
+
+
+def calculate_depth_profile(orders: list, side: Side, target_levels: List[float]) -> Tuple[bool, dict, float, int]:
+    """Same as :py:func:`calculate_price_at_depths`, but also tell how many levels affect the result.
+
+    :return: (success, Map[quantity target, price], max depth reached, number of top levels consumed)
+    """
+
+    if len(orders) == 0:
+        return len(target_levels) == 0, {}, 0, 0
+
+    if 0 < len(target_levels) <= WALK_MAX_TARGETS:
+        return walk_depth_profile(orders, target_levels)
+
+    return search_depth_profile(orders, target_levels)
+
+
+def walk_depth_profile(orders: list, target_levels: List[float]) -> Tuple[bool, dict, float, int]:
+    """Resolve the targets by walking the book level by level, shallowest target first.
+
+    Stops at the level where the deepest target is reached, so for shallow targets only the top of the book is touched.
+
+    :param orders: (price, quantity) tuples from the exchange order book, must not be empty
+    :param target_levels: Must not be empty
+
+    :return: See :py:func:`calculate_depth_profile`
+    """
+    targets = sorted(target_levels)
+    target_count = len(targets)
+    next_target = 0
+    prices = {}
+
+    cumulated_inventory = 0.0
+    cumulated_volume = 0.0
+
+    for level_count, order in enumerate(orders, start=1):
+        # CCXT structure
+        price = order[0]
+        quantity = order[1]
+
+        cumulated_inventory += quantity
+        cumulated_volume += price * quantity
+
+        while cumulated_inventory >= targets[next_target]:
+            prices[targets[next_target]] = cumulated_volume / cumulated_inventory
+            next_target += 1
+            if next_target == target_count:
+                return True, {target: prices[target] for target in target_levels}, cumulated_inventory, level_count
+
+    # Any level in the book might change the result
+    return False, {target: prices[target] for target in target_levels if target in prices}, cumulated_inventory, len(orders)
+
+
+def search_depth_profile(orders: list, target_levels: List[float]) -> Tuple[bool, dict, float, int]:
+    """Resolve the targets with NumPy `searchsorted` over cumulative arrays of the book.
+
+    :param orders: (price, quantity) tuples from the exchange order book, must not be empty
+
+    :return: See :py:func:`calculate_depth_profile`
+    """
+
+    deepest_target = max(target_levels, default=0)
+
+    # Most of the time the targets are reached at the top of the book,
+    # so convert only the head of the book and look deeper if needed
+    head_size = INITIAL_HEAD_SIZE
+    while True:
+        cumulated_inventory, cumulated_volume = cumulate_orders(orders[:head_size])
+        if cumulated_inventory[-1] >= deepest_target or head_size >= len(orders):
+            break
+        head_size *= 4
+
+    targets = np.asarray(target_levels, dtype=np.float64)
+
+    # First level where the cumulated inventory reaches the target
+    indices = np.searchsorted(cumulated_inventory, targets, side="left")
+    reached = indices < len(cumulated_inventory)
+
+    reached_indices = indices[reached]
+    avg_purchase_prices = cumulated_volume[reached_indices] / cumulated_inventory[reached_indices]
+
+    reached_levels = dict(zip(targets[reached].tolist(), avg_purchase_prices.tolist()))
+
+    success = bool(reached.all())
+
+    if success and len(reached_indices) > 0:
+        # We do not need to look deeper than the deepest target
+        level_count = int(reached_indices.max()) + 1
+    else:
+        # Any level in the book might change the result
+        level_count = len(orders)
+
+    max_level = float(cumulated_inventory[min(level_count, len(cumulated_inventory)) - 1])
+
+    return success, reached_levels, max_level, level_count
+
+
+class IncrementalDepth:
+    """Keep the depth prices of one order book side up to date.
+
+    Only the top levels of the book that were consumed to reach the deepest target can change the result.
+    We keep a copy of those levels and skip the recomputation if an update did not touch them.
+    """
+
+    def __init__(self, side: Side, target_levels: List[float]):
+        self.side = side
+        self.target_levels = target_levels
+
+        #: [quantity target, price] map from the last recomputation
+        self.levels = {}
+        self.success = False
+        self.max_level = 0
+
+        #: Copy of the top levels the last result depends on
+        self.head: Optional[list] = None
+
+        #: The last result depends on the whole book, not only on its head
+        self.needs_whole_book = True
+
+        self.recomputations = 0
+        self.skipped_recomputations = 0
+
+    def is_unchanged(self, orders: list) -> bool:
+        """Did the watched head of the book stay the same since the last recomputation."""
+        if self.head is None:
+            return False
+
+        if self.needs_whole_book and len(orders) != len(self.head):
+            return False
+
+        return orders[:len(self.head)] == self.head
+
+    def skip(self):
+        """Count a recomputation we did not need to do."""
+        self.skipped_recomputations += 1
+
+    def update(self, orders: list) -> bool:
+        """Recompute depth prices if the watched part of the book changed.
+
+        :param orders: (price, quantity) tuples from the exchange order book
+
+        :return: True if the depths were recomputed
+        """
+        if self.is_unchanged(orders):
+            self.skip()
+            return False
+
+        self.success, self.levels, self.max_level, level_count = calculate_depth_profile(orders, self.side, self.target_levels)
+        self.needs_whole_book = level_count == len(orders)
+
+        # Exchange clients may update the levels in place, so take a copy
+        self.head = [list(order) for order in orders[:level_count]]
+
+        self.recomputations += 1
+        return True
+
+
+class LiquidityIndex:
+    """Cumulative quantity and notional of a whole order book side.
+
+    Built once from a book and then answers depth and price impact queries with a binary search,
+    without walking the book again.
+
+    Unlike the watched depth levels, which include the full quantity of the last consumed level,
+    queries fill the last level only partially, so they give the exact average price for any quantity.
+    """
+
+    def __init__(self, orders: list, side: Side):
+        """
+
+        :param orders: (price, quantity) tuples from the exchange order book, best price first
+        :param side: Which side of the book the orders are
+        """
+        self.side = side
+
+        if len(orders) > 0:
+            self.prices, quantities = orders_to_array(orders)
+            self.cumulated_quantity = np.cumsum(quantities)
+            self.cumulated_notional = np.cumsum(self.prices * quantities)
+        else:
+            self.prices = self.cumulated_quantity = self.cumulated_notional = np.zeros(0)
+
+        # Prices in ascending order for searchsorted, bids are best (highest) first
+        self.sorted_prices = self.prices if side == Side.ask else -self.prices
+
+    @property
+    def total_quantity(self) -> float:
+        """How much the book has on this side."""
+        return float(self.cumulated_quantity[-1]) if len(self.cumulated_quantity) else 0.0
+
+    def price_at_quantity(self, quantity: float) -> Optional[float]:
+        """Get the average price of trading a quantity against the book.
+
+        :param quantity: Base token quantity e.g. 0.37 BTC
+
+        :return: Average price, or None if the book does not have enough liquidity
+        """
+        if quantity <= 0:
+            return float(self.prices[0]) if len(self.prices) else None
+
+        # First level where the cumulated quantity reaches the target
+        idx = int(np.searchsorted(self.cumulated_quantity, quantity, side="left"))
+        if idx == len(self.cumulated_quantity):
+            return None
+
+        # Take only the needed part of the last level
+        unused = float(self.cumulated_quantity[idx]) - quantity
+        notional = float(self.cumulated_notional[idx]) - unused * float(self.prices[idx])
+        return notional / quantity
+
+    def quantity_at_price(self, price: float) -> float:
+        """Get how much can be traded before the price moves past a limit.
+
+        :param price: Limit price, the highest price to buy at on the ask side, the lowest price to sell at on the bid side
+
+        :return: Base token quantity of the levels at or better than the limit price
+        """
+        limit = price if self.side == Side.ask else -price
+        count = int(np.searchsorted(self.sorted_prices, limit, side="right"))
+        return float(self.cumulated_quantity[count - 1]) if count else 0.0
+
+
+def calculate_price_at_depths_python(orders: list, side: Side, target_levels: List[float]) -> Tuple[bool, dict, float]:
+    """Pure Python reference implementation of :py:func:`calculate_price_at_depths`.
+
+    Walks the order book level by level. Kept around for benchmarking and cross-checking the NumPy engine.
+    """
 
     reached_levels = {}
-    unreached_targets = target_levels.copy()
+    unreached_targets = list(target_levels)
 
     cumulated_inventory = 0
     cumulated_volume = 0
 
     # Assume orders are the top order (best price) first
-    for idx, order in enumerate(orders):
+    for order in orders:
 
         # CCXT structure
         price = order[0]
@@ -44,21 +317,18 @@ def calculate_price_at_depths(orders: list, side: Side, target_levels: List[floa
 
         avg_purchase_price = cumulated_volume / cumulated_inventory
 
-        # logger.info("Order #%d, side %s, avg price %f, cum quantity %f", idx, side.value, avg_purchase_price, cumulated_inventory)
-
-        for idx, target in enumerate(unreached_targets):
-            # Are we looking orders price going up or price going down
-            reached_target = cumulated_inventory >= target
-            if reached_target:
+        # Do not modify the list during iteration
+        still_unreached = []
+        for target in unreached_targets:
+            if cumulated_inventory >= target:
                 reached_levels[target] = avg_purchase_price
-                del unreached_targets[idx]
+            else:
+                still_unreached.append(target)
+        unreached_targets = still_unreached
 
         if len(unreached_targets) == 0:
             break
 
     max_level = cumulated_inventory
 
-    # if len(unreached_targets) > 0:
-    #    logger.warning("Unreachable %s", unreached_targets)
-
     return len(unreached_targets) == 0, reached_levels, max_level
@@ -0,0 +1,304 @@
+"""Bounded alert history with an on-disk SQLite spill.
+
+Recent ended alerts are kept in memory in a ring buffer.
+All ended alerts are appended to a SQLite database that can be queried
+without loading the history to memory. The tracker writes the database
+in a background thread, so commits do not block the main loop.
+
+Opportunity counts and durations per market:
+
+    python order_book_recorder/history.py alert-history.sqlite
+
+per exchange pair of one market:
+
+    python order_book_recorder/history.py alert-history.sqlite --group-by pair --market BTC/EUR
+"""
+import datetime
+import enum
+import json
+import logging
+import queue
+import sqlite3
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, TYPE_CHECKING
+
+import typer
+
+if TYPE_CHECKING:
+    # Avoid a circular import, alert.py imports this module
+    from order_book_recorder.alert import Alert
+
+
+logger = logging.getLogger(__name__)
+
+#: How many recent alerts to keep in memory
+DEFAULT_HISTORY_SIZE = 1000
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    market TEXT NOT NULL,
+    depth REAL NOT NULL,
+    buy_exchange TEXT NOT NULL,
+    sell_exchange TEXT NOT NULL,
+    buy_price REAL NOT NULL,
+    sell_price REAL NOT NULL,
+    profitability REAL NOT NULL,
+    profitability_at_end REAL,
+    started REAL NOT NULL,
+    ended REAL NOT NULL,
+    kind TEXT NOT NULL DEFAULT 'market',
+    legs TEXT
+);
+CREATE INDEX IF NOT EXISTS alerts_market ON alerts (market, depth);
+CREATE INDEX IF NOT EXISTS alerts_pair ON alerts (buy_exchange, sell_exchange);
+CREATE INDEX IF NOT EXISTS alerts_started ON alerts (started);
+"""
+
+INSERT = (
+    "INSERT INTO alerts (market, depth, buy_exchange, sell_exchange, buy_price, sell_price, profitability, profitability_at_end, started, ended, kind, legs) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+class AlertKind(enum.Enum):
+    """What kind of opportunity an alert is about."""
+
+    #: Buy and sell in the same market on different exchanges
+    market = "market"
+
+    #: Buy in one quote currency and sell in another, see currencygraph.py
+    cross_currency = "cross_currency"
+
+
+class GroupBy(enum.Enum):
+    """How to group alert summaries."""
+
+    market = "market"
+
+    #: Market, buy exchange and sell exchange
+    pair = "pair"
+
+
+@dataclass
+class AlertSummary:
+    """Opportunity statistics of one market or exchange pair."""
+
+    kind: AlertKind
+    market: str
+    buy_exchange: Optional[str]
+    sell_exchange: Optional[str]
+    count: int
+
+    #: Seconds
+    total_duration: float
+    average_duration: float
+    max_duration: float
+
+    max_profitability: float
+
+
+def to_timestamp(dt: datetime.datetime) -> float:
+    """Alerts use naive UTC datetimes."""
+    return dt.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def alert_to_row(alert: "Alert") -> tuple:
+    """Get the column values of an ended alert, in the order of :py:data:`INSERT`."""
+    opportunity = alert.max_opportunity
+    return (
+        alert.market,
+        alert.depth,
+        opportunity.buy_exchange,
+        opportunity.sell_exchange,
+        opportunity.buy_price,
+        opportunity.sell_price,
+        opportunity.profit_without_fees,
+        alert.profitability_at_end,
+        to_timestamp(alert.started),
+        to_timestamp(alert.ended),
+        alert.kind.value,
+        # Cross currency trades as JSON, [{"exchange": ..., "market": ..., "side": ..., "price": ...}]
+        json.dumps([leg.to_dict() for leg in opportunity.legs]) if opportunity.legs else None,
+    )
+
+
+class AlertStore:
+    """Append-only SQLite store of ended alerts.
+
+    Writes are synchronous until :py:meth:`start` is called,
+    after that they are queued to a writer thread that commits them in batches.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        # Written by the writer thread, summarised by the thread that created the store
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+        # Databases written before alerts had a kind and legs
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(alerts)")]
+        with self.connection:
+            if "kind" not in columns:
+                self.connection.execute("ALTER TABLE alerts ADD COLUMN kind TEXT NOT NULL DEFAULT 'market'")
+            if "legs" not in columns:
+                self.connection.execute("ALTER TABLE alerts ADD COLUMN legs TEXT")
+
+        # Alerts are rare compared to order book updates, so the queue is not bounded and nothing is dropped
+        self.queue = queue.SimpleQueue()
+        self.thread: Optional[threading.Thread] = None
+
+        self.written = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="Alert history", daemon=True)
+        self.thread.start()
+
+    def write(self, alert: "Alert"):
+        row = alert_to_row(alert)
+        if self.thread:
+            self.queue.put(row)
+        else:
+            self.write_rows([row])
+
+    def write_rows(self, rows: List[tuple]):
+        with self.connection:
+            self.connection.executemany(INSERT, rows)
+        self.written += len(rows)
+
+    def run(self):
+        while True:
+            rows = [self.queue.get()]
+
+            # Commit everything that queued up during the previous commit at once
+            while not self.queue.empty():
+                rows.append(self.queue.get())
+
+            stop = None in rows
+            rows = [row for row in rows if row is not None]
+
+            try:
+                if rows:
+                    self.write_rows(rows)
+            except Exception as e:
+                logger.exception(e)
+
+            if stop:
+                break
+
+    def summarise(self, group_by: GroupBy = GroupBy.market, market: Optional[str] = None, since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None, kind: Optional[AlertKind] = None) -> List[AlertSummary]:
+        """Get opportunity counts and durations.
+
+        Aggregation is done by SQLite, so the history is never loaded to memory.
+        Alerts of different kinds are never summarised together.
+
+        :param market: Only include this market, for cross currency alerts the market where we buy
+        :param kind: Only include alerts of this kind
+        :param since: Only include alerts started at or after this, naive UTC
+        :param until: Only include alerts started before this, naive UTC
+        :return: Summaries, the most common first
+        """
+        conditions = []
+        params = []
+
+        if market:
+            conditions.append("market = ?")
+            params.append(market)
+
+        if kind:
+            conditions.append("kind = ?")
+            params.append(kind.value)
+
+        if since:
+            conditions.append("started >= ?")
+            params.append(to_timestamp(since))
+
+        if until:
+            conditions.append("started < ?")
+            params.append(to_timestamp(until))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        if group_by == GroupBy.pair:
+            columns = group_columns = "kind, market, buy_exchange, sell_exchange"
+        else:
+            columns = "kind, market, NULL, NULL"
+            group_columns = "kind, market"
+
+        query = f"""
+            SELECT {columns}, COUNT(*), SUM(ended - started), AVG(ended - started), MAX(ended - started), MAX(profitability)
+            FROM alerts
+            {where}
+            GROUP BY {group_columns}
+            ORDER BY COUNT(*) DESC, {group_columns}
+        """
+
+        return [AlertSummary(AlertKind(row[0]), *row[1:]) for row in self.connection.execute(query, params)]
+
+    def close(self):
+        """Write the queued alerts and close the database."""
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        self.connection.close()
+
+
+class AlertHistory:
+    """Ring buffer of recently ended alerts, optionally spilled to an :py:class:`AlertStore`."""
+
+    def __init__(self, max_size: Optional[int] = DEFAULT_HISTORY_SIZE, store: Optional[AlertStore] = None):
+        """
+
+        :param max_size: How many alerts to keep in memory, or None for all
+        :param store: Where to write all ended alerts
+        """
+        self.recent = deque(maxlen=max_size)
+        self.store = store
+
+        #: Ended alerts since the start, including the ones dropped from memory
+        self.total = 0
+
+    def append(self, alert: "Alert"):
+        self.recent.append(alert)
+        self.total += 1
+        if self.store:
+            self.store.write(alert)
+
+    def __iter__(self) -> Iterator["Alert"]:
+        return iter(self.recent)
+
+    def __len__(self) -> int:
+        return len(self.recent)
+
+
+def parse_time(value: Optional[str]) -> Optional[datetime.datetime]:
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+def main(database: str, group_by: GroupBy = GroupBy.market, market: str = None, since: str = None, until: str = None, kind: AlertKind = None):
+    """Print opportunity counts and durations.
+
+    Times are ISO 8601 in UTC, e.g. 2021-11-01 or 2021-11-01T12:00.
+    """
+    store = AlertStore(database)
+    summaries = store.summarise(group_by, market, parse_time(since), parse_time(until), kind)
+    store.close()
+
+    for s in summaries:
+        name = f"{s.market} buy {s.buy_exchange} sell {s.sell_exchange}" if group_by == GroupBy.pair else s.market
+        if s.kind == AlertKind.cross_currency:
+            name += " (cross currency)"
+        print(f"{name:50} {s.count:6} opportunities, "
+              f"total {datetime.timedelta(seconds=round(s.total_duration))}, "
+              f"average {s.average_duration:8.1f} s, "
+              f"max {s.max_duration:8.1f} s, "
+              f"max profitability {s.max_profitability * 100:,.5f}%")
+
+
+if __name__ == "__main__":
+    typer.run(main)
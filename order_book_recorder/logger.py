@@ -1,9 +1,17 @@
+import atexit
 import logging
+import queue
 from logging import Logger
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
 
 import coloredlogs
 
 
+#: Writes the log records of this process to the console and the log file
+listener: Optional[QueueListener] = None
+
+
 def setup_logging(log_level=logging.INFO, log_filename=None) -> Logger:
     """Setup root logger and quiet some levels."""
     logger = logging.getLogger()
@@ -44,4 +52,35 @@ def setup_logging(log_level=logging.INFO, log_filename=None) -> Logger:
         handler.setFormatter(formatter)
         logger.addHandler(handler)
 
+    start_listener(logger)
+
     return logger
+
+
+def start_listener(logger: Logger):
+    """Move the handlers of a logger behind a queue.
+
+    The logger only puts records to the queue and a background thread
+    does the console and file writes, so logging never blocks the event loop.
+    """
+    global listener
+
+    stop_listener()
+
+    handlers = [h for h in logger.handlers if not isinstance(h, QueueHandler)]
+    log_queue = queue.SimpleQueue()
+    logger.handlers = [QueueHandler(log_queue)]
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+
+
+def stop_listener():
+    """Write out the queued records and stop the background thread."""
+    global listener
+    if listener:
+        listener.stop()
+        listener = None
+
+
+atexit.register(stop_listener)
@@ -1,45 +1,53 @@
 import logging
-from typing import List
+from collections import deque
+from typing import Deque, List
 
 from rich.table import Table
 
 
+#: How many log records the live dashboard keeps around
+DEFAULT_CAPACITY = 1000
+
+#: How many log messages the live dashboard shows
+DEFAULT_ROWS = 20
+
+
 class BufferedOutputHandler(logging.Handler):
-    """Keep log meessages in a memory buffer"""
+    """Keep the latest log records in a fixed size memory ring buffer.
 
-    def __init__(self, buffer):
-        logging.Handler.__init__(self)
-        self.buffer = buffer
+    Records are stored as is and formatted only when they are displayed,
+    so messages that scroll away before the next frame cost nothing.
+    Values passed as log message arguments must not be modified after logging.
+    """
 
-    def emit(self, record):
+    def __init__(self, capacity=DEFAULT_CAPACITY):
         """
-        Emit a record.
-
-        If a formatter is specified, it is used to format the record.
-        The record is then written to the stream with a trailing newline.  If
-        exception information is present, it is formatted using
-        traceback.print_exception and appended to the stream.  If the stream
-        has an 'encoding' attribute, it is used to determine how to do the
-        output to the stream.
+
+        :param capacity: How many records to keep, older records are dropped
         """
-        try:
-            msg = self.format(record)
-            self.buffer.append(msg)
-        except RecursionError:  # See issue 36272
-            raise
-        except Exception:
-            raise 
-            # self.handleError(record)
+        logging.Handler.__init__(self)
+        self.records: Deque[logging.LogRecord] = deque(maxlen=capacity)
 
+    def emit(self, record: logging.LogRecord):
+        # Called with the handler lock held
+        self.records.append(record)
 
-def refresh_log_messages(messages: List[str]) -> Table:
+    def tail(self, rows=DEFAULT_ROWS) -> List[str]:
+        """Format the latest records.
+
+        :return: Formatted messages, oldest first
+        """
+        with self.lock:
+            records = [self.records[-idx] for idx in range(min(rows, len(self.records)), 0, -1)]
+        return [self.format(r) for r in records]
+
+
+def refresh_log_messages(handler: BufferedOutputHandler, rows=DEFAULT_ROWS) -> Table:
     """Show log tail"""
     table = Table()
     table.add_column("Message")
 
-    messages = messages[-20:]
-
-    for msg in messages:
+    for msg in handler.tail(rows):
         table.add_row(msg)
 
     return table
@@ -3,169 +3,164 @@ import logging
 import time
 import asyncio
 from asyncio import create_task
-from collections import defaultdict
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
-from rich.layout import Layout
 
 import typer
 from rich.live import Live
 from rich.console import Console
 
-from order_book_recorder import telegram, recorder, config
-from order_book_recorder.alert import update_alerts
-from order_book_recorder.config import setup_exchanges, MARKETS, BTC_DEPTHS, ETH_DEPTHS, MARKET_DEPTHS, ALERT_THRESHOLD, \
-    RETRIGGER_THRESHOLD
-from order_book_recorder.logger import setup_logging
-from order_book_recorder.logtable import refresh_log_messages, BufferedOutputHandler
+from order_book_recorder import telegram, recorder, columnar, config, priceboard
+from order_book_recorder.alert import AlertBook
+from order_book_recorder.capture import BookCapture
+from order_book_recorder.currencygraph import CrossCurrencyEvaluator
+from order_book_recorder.dashboard import Dashboard
+from order_book_recorder.history import AlertHistory, AlertKind, AlertStore
+from order_book_recorder.config import setup_exchanges, MARKETS, MARKET_DEPTHS, ALERT_THRESHOLD, \
+    RETRIGGER_THRESHOLD, OPPORTUNITY_TOP_K
+from order_book_recorder.logger import setup_logging, stop_listener
+from order_book_recorder.metrics import latency_metrics, Stage, start_metrics_server
+from order_book_recorder.logtable import BufferedOutputHandler
 from order_book_recorder.notify import notify
-from order_book_recorder.opportunity import Opportunity, find_opportunities
-from order_book_recorder.pricetable import refresh_live
-from order_book_recorder.recorder import record_depths, redis_updates
-from order_book_recorder.watcher import Watcher
+from order_book_recorder.opportunity import Opportunity, OpportunityEvaluator
+from order_book_recorder.recordqueue import RecorderQueue, OverflowPolicy
+from order_book_recorder.runtime import WatcherRuntime, create_watchers
+from order_book_recorder.sharding import ShardedRuntime, assign_shards
+from order_book_recorder.stream import OpportunityStream
+from order_book_recorder.watcher import BookUpdate, Watcher
 
 
 logger: logging.Logger = None
 
 
-def update_opportunities(watchers: List[Watcher], measured_market_depths: Dict[str, List[float]]) -> Dict[str, Dict[str, List[Opportunity]]]:
-    """Update the available opportunities to arbitrage across markets in different depths."""
+def get_depth_recorder():
+    """Get the configured depth recorder backend module.
 
-    all_opportunities = defaultdict(dict)
+    Backends take the depth records from :py:meth:`Watcher.get_depth_record`.
 
-    # Build a map of markets and their deptjs
-    for market, depths in measured_market_depths.items():
+    :return: :py:mod:`recorder` (Redis), :py:mod:`columnar` or None if depth recording is disabled
+    """
+    for backend in (recorder, columnar):
+        if backend.is_enabled():
+            return backend
+    return None
 
-        # Get all exchanges connected to this pair
-        market_watchers = filter(lambda w: w.market == market, watchers)
 
-        market_watchers = list(market_watchers)
+def create_opportunity_evaluator(watchers_by_market: Dict[str, Dict[str, Watcher]], measured_market_depths: Dict[str, List[float]], conversion_market_depths: Optional[Dict[str, List[float]]] = None) -> OpportunityEvaluator:
+    """Set up opportunity matrices for all watched markets.
 
+    :param conversion_market_depths: Fiat conversion markets, only used by the cross currency search
+    """
+
+    market_exchanges = {}
+
+    # Build a map of markets and their exchanges
+    for market in measured_market_depths.keys():
+        market_watchers = watchers_by_market.get(market, {})
         assert len(market_watchers) > 0, f"Could not find watchers for the market {market}"
+        market_exchanges[market] = list(market_watchers.keys())
+
+    conversion_market_depths = conversion_market_depths or {}
+    graph_market_depths = {**measured_market_depths, **conversion_market_depths}
+    cross_currency = CrossCurrencyEvaluator(graph_market_depths, config.FIAT_CURRENCIES) if config.FIAT_CURRENCIES else None
 
-        # Analyse opportunity per depth
-        for depth in depths:
+    evaluator = OpportunityEvaluator(market_exchanges, measured_market_depths, OPPORTUNITY_TOP_K, ALERT_THRESHOLD, config.TAKER_FEES, cross_currency)
 
-            depth_asks = {}
-            depth_bids = {}
+    # Watchers might have data already
+    for market in graph_market_depths.keys():
+        for watcher in watchers_by_market.get(market, {}).values():
+            evaluator.update_prices(market, watcher.exchange_name, watcher.ask_levels, watcher.bid_levels, watcher.orderbook)
 
-            # Create depth tables
-            for watcher in market_watchers:
+    return evaluator
 
-                if depth in watcher.ask_levels:
-                    # Watcher might not have data available yet
-                    if depth in watcher.ask_levels:
-                        depth_asks[watcher.exchange_name] = watcher.ask_levels[depth]
-                    if depth in watcher.bid_levels:
-                        depth_bids[watcher.exchange_name] = watcher.bid_levels[depth]
 
-            # Find opportunities in this depth
-            opportunities = find_opportunities(market, depth, depth_asks, depth_bids)
+def update_opportunities(evaluator: OpportunityEvaluator, updated_watchers: List[Watcher]) -> Dict[str, Dict[str, List[Opportunity]]]:
+    """Update the available opportunities to arbitrage across markets in different depths.
 
-            # logger.info("Opportunities for %s %s: %s, asks %s, bids %s", market, depth, opportunities, depth_asks, depth_bids)
-            all_opportunities[market][depth] = opportunities
+    Only markets of the updated watchers are re-evaluated.
+    """
 
-    return all_opportunities
+    for watcher in updated_watchers:
+        evaluator.update_prices(watcher.market, watcher.exchange_name, watcher.ask_levels, watcher.bid_levels, watcher.orderbook)
 
+    return evaluator.evaluate()
 
-async def run_duty_cycle(watchers: List[Watcher]) -> Dict[str, Dict[str, List[Opportunity]]]:
-    """Get some exchange updates."""
 
-    # Retrigger watch on any exchange
-    for w in watchers:
-        if not w.is_task_pending():
-            w.create_task()
+async def run_duty_cycle(runtime: WatcherRuntime, evaluator: OpportunityEvaluator) -> Tuple[List[BookUpdate], Dict[str, Dict[str, List[Opportunity]]]]:
+    """Get some exchange updates.
 
-    # Collect tasks to watch
-    tasks = [w.task for w in watchers]
+    :return: (processed order book updates, opportunities)
+    """
 
     # Get triggered by websocket updates
-    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    updates = await runtime.wait_updates()
+
+    picked_up_at = time.time()
+
+    updated_watchers = []
 
-    for d in done:
+    # Go through updated order books
+    for u in updates:
+        w = u.watcher
+        latency_metrics.observe(Stage.wait_to_pickup, picked_up_at - u.received_at, w.exchange_name, w.market)
+
+        # Refresh the price
+        # logger.info(f"Refreshing {w.exchange_name}: {w.pair}")
+        started = time.perf_counter()
         try:
-            result = await d
+            if w.refresh_depths():
+                updated_watchers.append(w)
+                priceboard.write_watcher(w)
         except Exception as e:
-            raise RuntimeError(f"Error while processing exchange {d.get_name()}") from e
-
-    # Go through finished tasks
-    for w in watchers:
-        if w.is_done():
-            # Refresh the price
-            # logger.info(f"Refreshing {w.exchange_name}: {w.pair}")
-            try:
-                w.refresh_depths()
-            except Exception as e:
-                raise RuntimeError(f"Error while refreshing depth data for exchange {w.exchange_name}") from e
+            raise RuntimeError(f"Error while refreshing depth data for exchange {w.exchange_name}") from e
+        latency_metrics.observe(Stage.refresh_depths, time.perf_counter() - started, w.exchange_name, w.market)
 
-    # Update the opportunities
-    opportunities = update_opportunities(watchers, MARKET_DEPTHS)
+    # Update the opportunities of the markets that changed
+    started = time.perf_counter()
+    opportunities = update_opportunities(evaluator, updated_watchers)
+    latency_metrics.observe_updates(Stage.update_opportunities, time.perf_counter() - started, updates)
 
-    return opportunities
+    return updates, opportunities
 
 
-async def run_core_live(exchanges: dict, watchers: List[Watcher], watchers_by_market: Dict[str, Dict[str, Watcher]]):
+async def run_core_live(exchanges: dict, watchers: List[Watcher], watchers_by_market: Dict[str, Dict[str, Watcher]], runtime: WatcherRuntime, evaluator: OpportunityEvaluator):
     """Run the app with interactive Rich dashboard."""
 
-    captured_log: List[str] = []
-    live_log_handler = BufferedOutputHandler(captured_log)
+    live_log_handler = BufferedOutputHandler()
 
+    # The dashboard owns the terminal, the console output must not go there
+    stop_listener()
     logger.handlers.clear()
     logger.handlers.append(live_log_handler)
 
-    def draw_price_table():
-        table = refresh_live(exchanges, MARKETS, watchers_by_market)
-        return table
-
-    def draw_opportunity_table():
-        table = refresh_live(exchanges, MARKETS, watchers_by_market)
-        return table
-
-    def generate_log_panel():
-        table = refresh_log_messages(captured_log)
-        return table
-
-    layout = Layout()
-
-    layout.split_row(
-        Layout(name="left"),
-        Layout(name="right"),
-    )
-
-    layout["left"].split_column(
-        Layout(name="top"),
-        Layout(name="bottom"),
-    )
+    dashboard = Dashboard(list(exchanges.keys()), MARKETS, watchers_by_market, evaluator, live_log_handler)
 
     console = Console()
 
-    with Live(layout, console=console, screen=True, auto_refresh=False) as live:
-
-        last_update = time.time()
+    # The Live thread writes frames to the terminal, the dashboard task only builds them
+    with Live(dashboard.render(), console=console, screen=True, auto_refresh=True, refresh_per_second=config.DASHBOARD_FPS) as live:
 
-        layout["left"].update(draw_price_table())
-        layout["right"].update(generate_log_panel())
-        # live.update(generate_table(), refresh=True)
+        render_task = create_task(dashboard.run(live, config.DASHBOARD_FPS), name="Dashboard")
 
-        # Run the main loop
-        while True:
-
-            await run_duty_cycle(watchers)
+        try:
+            # Run the main loop
+            while True:
+                await run_duty_cycle(runtime, evaluator)
+        finally:
+            render_task.cancel()
 
-            if time.time() - last_update > 4.0:
-                layout["left"].update(draw_price_table())
-                layout["right"].update(generate_log_panel())
-                live.refresh()
-                last_update = time.time()
 
+async def run_core_logged(exchanges: list, watchers: List[Watcher], watchers_by_market: Dict[str, Dict[str, Watcher]], runtime: WatcherRuntime, evaluator: OpportunityEvaluator, stream_file: str = None):
+    """Run the app with raw console logging.
 
-async def run_core_logged(exchanges: list, watchers: List[Watcher], watchers_by_market: Dict[str, Dict[str, Watcher]]):
-    """Run the app with raw console logging."""
+    :param stream_file: Write prices and opportunities to this JSON-lines file instead of logging them
+    """
 
     log_update_delay = 3.0
-    redis_update_delay = 1.0
+    record_update_delay = 1.0
     last_log_update = 0
-    last_redis_update = 0
+    last_record_update = 0
+    last_stream_update = 0
 
     def log_opportunity(opportunity, market, depth, best):
         base, quote = market.split("/")
@@ -177,64 +172,134 @@ async def run_core_logged(exchanges: list, watchers: List[Watcher], watchers_by_
         sell_price = "{:,.2f}".format(best.sell_price)
         diff = "{:,.2f}".format(best.diff)
 
-        msg = f"{market} {opportunity} (@{depth:.4f} {base}) is {formatted_profitability:9} by buy {best.buy_exchange:10} {buy_price:10} - sell {best.sell_exchange:10} - {sell_price:10} ({diff} {quote})"
+        msg = f"{market} {opportunity} (@{depth:.4f} {base}) is {formatted_profitability:9} by buy {best.buy_exchange:10} {buy_price:10} - sell {best.route:10} - {sell_price:10} ({diff} {quote})"
         logger.info(msg)
 
-    while True:
-        all_opportunities = await run_duty_cycle(watchers)
-
-        await update_alerts(all_opportunities, ALERT_THRESHOLD, RETRIGGER_THRESHOLD)
-
-        # Regularly log the best opportunities to the logging output
-        if recorder.is_enabled():
-            if time.time() - redis_update_delay > last_redis_update:
-                timestamp_ms = int(time.time() * 1000)
-                depths = [w.get_depth_record() for w in watchers]
-                if config.REDIS_BG_WRITES:
-                    # Run the redis db updates in a thread pool, so they won't block the main thread
-                    # Fire and forget Redis IO sensitive task to write records to the database
-                    # https://stackoverflow.com/a/37345564/315168
-                    asyncio.ensure_future(record_depths(timestamp_ms, depths))
-                else:
-                    await record_depths(timestamp_ms, depths)
-                last_redis_update = time.time()
-
-        # Regularly log the best opportunities to the logging output
-        if time.time() - last_log_update > log_update_delay:
-
-            logger.info("Opportunities at %s, depth records written %d", datetime.datetime.utcnow(), recorder.redis_updates)
-
-            # Log out the prices
-            for market, market_watchers in watchers_by_market.items():
-                ticker_feed = [f"{market} --- "]
-                for name, w in market_watchers.items():
-                    ask_price = "{:,.2f}".format(w.ask_price) if w.ask_price else "---"
-                    bid_price = "{:,.2f}".format(w.bid_price) if w.bid_price else "---"
-                    ticker_feed.append(f"{name} A:{ask_price:10} B:{bid_price:10}")
-
-                logger.info(" ".join(ticker_feed))
-
-            # Write out top opportunities for each market and depth on each cycle
-            for market, depths in all_opportunities.items():
-                depth_opportunities: List[Opportunity]
-                for depth, depth_opportunities in depths.items():
-
-                    if len(depth_opportunities) == 0:
-                        # Still connecting to exchanges
-                        logger.warning("%s %s - not yet available opportunities", market, depth)
-                    else:
-                        best = depth_opportunities[0]
+    if config.ALERT_HISTORY_PATH:
+        alert_store = AlertStore(config.ALERT_HISTORY_PATH)
+        alert_store.start()
+    else:
+        alert_store = None
+    alert_book = AlertBook(ALERT_THRESHOLD, RETRIGGER_THRESHOLD, MARKET_DEPTHS, AlertHistory(config.ALERT_HISTORY_SIZE, alert_store))
+
+    # Cross currency opportunities are keyed by the market where we buy, so they need their own slots
+    cross_alert_book = AlertBook(ALERT_THRESHOLD, RETRIGGER_THRESHOLD, history=alert_book.history, kind=AlertKind.cross_currency)
 
-                        log_opportunity("#1", market, depth, best)
+    depth_recorder = get_depth_recorder()
 
-                        if len(depth_opportunities) >= 2:
-                            second_best = depth_opportunities[1]
-                            log_opportunity("#2", market, depth, second_best)
+    # Fiat conversion markets are not recorded
+    recorded_watchers = [w for w in watchers if w.market in MARKET_DEPTHS]
 
-            last_log_update = time.time()
+    if depth_recorder and config.RECORDER_BG_WRITES:
+        # Run the db updates in a background task, so they won't block the main loop
+        record_queue = RecorderQueue(depth_recorder.record_depths, config.RECORDER_QUEUE_SIZE, OverflowPolicy(config.RECORDER_OVERFLOW_POLICY))
+        record_queue.start()
+    else:
+        record_queue = None
 
+    if stream_file:
+        logger.info("Streaming opportunities to %s", stream_file)
+        stream = OpportunityStream(stream_file, config.STREAM_MAX_BYTES, config.STREAM_BACKUP_COUNT, config.STREAM_QUEUE_SIZE, config.OPPORTUNITY_TOP_K)
+        stream.start()
+    else:
+        stream = None
 
-async def run_core(live=True, log_filename=None):
+    try:
+        while True:
+            updates, all_opportunities = await run_duty_cycle(runtime, evaluator)
+
+            started = time.perf_counter()
+            await alert_book.update(all_opportunities)
+            await cross_alert_book.update(evaluator.cross_opportunities)
+            latency_metrics.observe_updates(Stage.update_alerts, time.perf_counter() - started, updates)
+
+            # Regularly log the best opportunities to the logging output
+            if depth_recorder:
+                if time.time() - record_update_delay > last_record_update:
+                    timestamp_ms = int(time.time() * 1000)
+                    depths = [w.get_depth_record() for w in recorded_watchers]
+                    if record_queue:
+                        started = time.perf_counter()
+                        await record_queue.put(timestamp_ms, depths)
+                        latency_metrics.observe(Stage.recorder_enqueue, time.perf_counter() - started)
+                    else:
+                        await depth_recorder.record_depths(timestamp_ms, depths)
+                    last_record_update = time.time()
+
+            if stream:
+                if time.time() - last_stream_update > config.STREAM_INTERVAL:
+                    stream.put(watchers, all_opportunities, cross_opportunities=evaluator.cross_opportunities)
+                    last_stream_update = time.time()
+
+            # Regularly log the best opportunities to the logging output
+            if time.time() - last_log_update > log_update_delay:
+
+                logger.info("Opportunities at %s", datetime.datetime.utcnow())
+
+                if depth_recorder:
+                    logger.info("Depth recorder %s", depth_recorder.format_stats())
+
+                if record_queue:
+                    logger.info("Depth recorder write %s", record_queue.stats)
+
+                if stream:
+                    # Prices and opportunities are in the stream
+                    logger.info("Opportunity stream %s", stream)
+                    last_log_update = time.time()
+                    continue
+
+                # Log out the prices
+                for market, market_watchers in watchers_by_market.items():
+                    ticker_feed = [f"{market} --- "]
+                    for name, w in market_watchers.items():
+                        ask_price = "{:,.2f}".format(w.ask_price) if w.ask_price else "---"
+                        bid_price = "{:,.2f}".format(w.bid_price) if w.bid_price else "---"
+                        ticker_feed.append(f"{name} A:{ask_price:10} B:{bid_price:10}")
+
+                    logger.info(" ".join(ticker_feed))
+
+                # Show how much depth work the incremental updates save us
+                recomputation_feed = ["Depth recomputations performed/skipped ---"]
+                for w in watchers:
+                    performed, skipped = w.get_depth_recomputation_stats()
+                    recomputation_feed.append(f"{w.exchange_name} {w.market}: {performed}/{skipped}")
+                logger.info(" ".join(recomputation_feed))
+
+                # Write out top opportunities for each market and depth on each cycle
+                for market, depths in all_opportunities.items():
+                    depth_opportunities: List[Opportunity]
+                    for depth, depth_opportunities in depths.items():
+
+                        if len(depth_opportunities) == 0:
+                            # Still connecting to exchanges
+                            logger.warning("%s %s - not yet available opportunities", market, depth)
+                        else:
+                            best = depth_opportunities[0]
+
+                            log_opportunity("#1", market, depth, best)
+
+                            if len(depth_opportunities) >= 2:
+                                second_best = depth_opportunities[1]
+                                log_opportunity("#2", market, depth, second_best)
+
+                # Buy in one fiat currency and sell in another
+                for market, depths in evaluator.cross_opportunities.items():
+                    for depth, depth_opportunities in depths.items():
+                        if depth_opportunities:
+                            log_opportunity("cross", market, depth, depth_opportunities[0])
+
+                last_log_update = time.time()
+    finally:
+        if record_queue:
+            # Flush the pending depth records
+            await record_queue.close()
+        if stream:
+            stream.close()
+        if alert_store:
+            alert_store.close()
+
+
+async def run_core(live=True, log_filename=None, capture_file=None, workers=0, stream_file=None):
 
     global logger
     logger = setup_logging(log_filename=log_filename)
@@ -243,13 +308,34 @@ async def run_core(live=True, log_filename=None):
     logger.info("Logging to %s", log_filename)
     logger.info("Telegram available: %s", telegram.is_enabled())
     logger.info("Redis available: %s", recorder.is_enabled())
+    logger.info("Columnar recorder available: %s", columnar.is_enabled())
 
     if recorder.is_enabled():
         # Test redis connection works
         recorder.init_connection(config.REDIS_CONFIG)
         recorder.test_connection()
 
-    exchanges = await setup_exchanges()
+    if columnar.is_enabled():
+        columnar.init_recorder(config.COLUMNAR_RECORDER_PATH)
+
+    if workers:
+        # Order books stay in the worker processes
+        assert not capture_file, "Order books cannot be captured when running with workers"
+
+        shards = assign_shards(list(config.EXCHANGE_FACTORIES.keys()), workers)
+        logger.info("Running exchanges in %d worker processes: %s", len(shards), shards)
+        logger.info("Workers send the top %d order book levels, optimal sizes and liquidity queries see only those", config.SHARD_BOOK_LEVELS)
+
+        # Keep the Rich dashboard clean from worker output
+        runtime = ShardedRuntime(shards, log_level=logging.WARNING if live else logging.INFO)
+        watchers, watchers_by_market = await runtime.connect()
+
+        # Exchange objects live in the workers
+        exchanges = {w.exchange_name: None for w in watchers}
+    else:
+        exchanges = await setup_exchanges()
+        watchers, watchers_by_market = create_watchers(exchanges)
+        runtime = WatcherRuntime(watchers)
 
     exchange_names = ", ".join(list(exchanges.keys()))
 
@@ -259,43 +345,68 @@ async def run_core(live=True, log_filename=None):
         Connected exchanges: {exchange_names}
         Profitability alert threshold: {alert_threshold * 100:,.5f}%\n"""
 
-    for market, depths in MARKET_DEPTHS.items():
+    for market, depths in {**MARKET_DEPTHS, **config.CONVERSION_MARKET_DEPTHS}.items():
         base_token = market.split("/")[0]
         msg += f"        Watching {market} markets at depths: {depths} {base_token}\n"
 
     await notify(f"⚡️ Arbitrage opportunity tracker starting", msg)
 
-    watchers = []
-
-    # market -> exchange -> Watcher lookup
-    watchers_by_market: Dict[str, Dict[str, Watcher]] = defaultdict(dict)
+    depth_recorder = get_depth_recorder()
+    if depth_recorder:
+        # Create missing timeseries before the first write
+        depth_recorder.register_watchers([w for w in watchers if w.market in MARKET_DEPTHS])
+
+    if capture_file:
+        # Record all order books for replay.py
+        logger.info("Capturing order books to %s", capture_file)
+        capture = BookCapture(capture_file)
+        capture.write_header(watchers)
+        for w in watchers:
+            w.capture = capture
+    else:
+        capture = None
 
-    # Create first batch of the tasks
-    for exchange_name, exchange in exchanges.items():
-        for market in MARKETS:
-            if market in exchange.symbols:
-                logger.info("Starting to watch market %s: %s", exchange_name, market)
+    evaluator = create_opportunity_evaluator(watchers_by_market, MARKET_DEPTHS, config.CONVERSION_MARKET_DEPTHS)
 
-                if market.startswith("BTC"):
-                    depths = BTC_DEPTHS
-                elif market.startswith("ETH"):
-                    depths = ETH_DEPTHS
-                else:
-                    raise RuntimeError(f"Cannot handle market {market}")
+    if config.PRICE_BOARD_NAME:
+        priceboard.init_board(config.PRICE_BOARD_NAME, watchers, MARKET_DEPTHS)
 
-                watcher = Watcher(exchange_name, market, exchange, depths)
-                watchers.append(watcher)
-                watchers_by_market[market][exchange_name] = watcher
+    metrics_runner = None
+    if config.METRICS_PORT:
+        metrics_runner = await start_metrics_server(config.METRICS_PORT)
 
-    if live:
-        await run_core_live(exchanges, watchers, watchers_by_market)
-    else:
-        await run_core_logged(exchanges, watchers, watchers_by_market)
+    runtime.start()
 
+    try:
+        if live:
+            await run_core_live(exchanges, watchers, watchers_by_market, runtime, evaluator)
+        else:
+            await run_core_logged(exchanges, watchers, watchers_by_market, runtime, evaluator, stream_file)
+    finally:
+        await runtime.stop()
+        if capture:
+            capture.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        priceboard.close_board()
+        await telegram.close()
+        for exchange in exchanges.values():
+            if exchange:
+                await exchange.close()
+
+
+def main(live: bool = True, log_filename: str = None, capture_file: str = None, workers: int = 0, stream_file: str = None):
+    """
+
+    :param workers: Run exchange watchers in this many worker processes, 0 to run everything in one process.
+        The main process then gets only the top SHARD_BOOK_LEVELS levels of each order book for optimal sizes and liquidity queries.
+    :param stream_file: Write prices and opportunities as JSON lines to this file, only without live dashboard
+    """
+    if live and stream_file:
+        raise typer.BadParameter("The opportunity stream is written only with --no-live", param_hint="--stream-file")
 
-def main(live: bool = True, log_filename: str = None):
     try:
-        asyncio.get_event_loop().run_until_complete(run_core(live, log_filename))
+        asyncio.get_event_loop().run_until_complete(run_core(live, log_filename, capture_file, workers, stream_file))
     except Exception as e:
         # Make sure we get a crash reason in the logs
         if logger:
@@ -0,0 +1,129 @@
+"""Pipeline stage latency histograms exported in Prometheus text format.
+
+Cheap enough to keep on in production: an observation is a dictionary lookup
+and a bisect over fixed buckets.
+"""
+import enum
+import logging
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import web
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Upper bounds of the latency buckets, seconds
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+METRIC_NAME = "order_book_stage_latency_seconds"
+
+
+class Stage(enum.Enum):
+    """Pipeline stages we measure."""
+
+    # From the exchange update arriving to the evaluator picking it up
+    wait_to_pickup = "wait_to_pickup"
+
+    refresh_depths = "refresh_depths"
+
+    update_opportunities = "update_opportunities"
+
+    update_alerts = "update_alerts"
+
+    # Putting a tick to the depth recorder
+    recorder_enqueue = "recorder_enqueue"
+
+
+class Histogram:
+    """Fixed bucket histogram."""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        # The last bucket is +Inf
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class LatencyMetrics:
+    """Stage latency histograms per exchange and market."""
+
+    def __init__(self):
+        #: (stage, exchange, market) -> histogram
+        self.histograms: Dict[Tuple[Stage, Optional[str], Optional[str]], Histogram] = {}
+
+    def observe(self, stage: Stage, seconds: float, exchange: Optional[str] = None, market: Optional[str] = None):
+        key = (stage, exchange, market)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+    def observe_updates(self, stage: Stage, seconds: float, updates: Iterable):
+        """Record a stage that processed several order book updates at once.
+
+        Each update waited for the whole stage, so the latency is recorded for all of them.
+
+        :param updates: :py:class:`order_book_recorder.watcher.BookUpdate` events
+        """
+        for u in updates:
+            self.observe(stage, seconds, u.watcher.exchange_name, u.watcher.market)
+
+    def format_prometheus(self) -> str:
+        """Export histograms in Prometheus text exposition format."""
+        lines: List[str] = [
+            f"# HELP {METRIC_NAME} Order book update pipeline stage latency",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+
+        for (stage, exchange, market), histogram in self.histograms.items():
+            labels = [f'stage="{stage.value}"']
+            if exchange is not None:
+                labels.append(f'exchange="{escape_label(exchange)}"')
+            if market is not None:
+                labels.append(f'market="{escape_label(market)}"')
+            label_str = ",".join(labels)
+
+            cumulated = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                cumulated += count
+                lines.append(f'{METRIC_NAME}_bucket{{{label_str},le="{bound}"}} {cumulated}')
+            lines.append(f'{METRIC_NAME}_bucket{{{label_str},le="+Inf"}} {histogram.count}')
+            lines.append(f'{METRIC_NAME}_sum{{{label_str}}} {histogram.sum}')
+            lines.append(f'{METRIC_NAME}_count{{{label_str}}} {histogram.count}')
+
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# In-process latency histograms
+latency_metrics = LatencyMetrics()
+
+
+async def start_metrics_server(port: int, host: str = "127.0.0.1") -> web.AppRunner:
+    """Serve the histograms at http://host:port/metrics for Prometheus scraping."""
+
+    async def handle_metrics(request):
+        return web.Response(text=latency_metrics.format_prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+
+    logger.info("Serving metrics at http://%s:%d/metrics", host, port)
+    return runner
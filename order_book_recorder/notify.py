@@ -2,7 +2,7 @@ from order_book_recorder import telegram
 
 
 async def notify(title, msg):
+    """Queue a notification, does not wait for it to be sent."""
     if telegram.is_enabled():
         # TODO Do fancy formatting later
-        msg = title + "\n" + msg
-        await telegram.send_message(msg)
\ No newline at end of file
+        telegram.send_message(title, msg)
@@ -1,58 +1,270 @@
 """Find trading opportunitiess in different depths."""
-from dataclasses import dataclass
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from order_book_recorder.sizing import calculate_optimal_size
+
+if TYPE_CHECKING:
+    # currencygraph creates Opportunity objects
+    from order_book_recorder.currencygraph import CrossCurrencyEvaluator
 
 
-@dataclass
 class Opportunity:
-    """Describe a found arbitrage opportunity."""
+    """Describe a found arbitrage opportunity.
+
+    Derived values are calculated once when the opportunity is created,
+    as they are read over and over again when ranking and alerting.
+    Slotted, as we create a lot of these on every evaluation.
+    """
+
+    __slots__ = ("market", "buy_exchange", "sell_exchange", "quantity", "buy_price", "sell_price", "profit_without_fees", "diff", "optimal_quantity", "optimal_profit")
+
+    def __init__(self, market: str, buy_exchange: str, sell_exchange: str, quantity: float, buy_price: float, sell_price: float, optimal_quantity: Optional[float] = None, optimal_profit: Optional[float] = None):
+        self.market = market
+        self.buy_exchange = buy_exchange
+        self.sell_exchange = sell_exchange
+
+        #: Market depth for this opportunity
+        self.quantity = quantity
+        self.buy_price = buy_price
+        self.sell_price = sell_price
 
-    market: str
-    buy_exchange: str
-    sell_exchange: str
+        #: Fiat arbitrage window
+        self.diff = sell_price - buy_price
 
-    #: Market depth for this opportunity
-    quantity: float
-    buy_price: float
-    sell_price: float
+        #: % arbitrage profit this trade would make
+        self.profit_without_fees = self.diff / buy_price
+
+        #: Base quantity that makes the most profit after taker fees, None if the order books were not available
+        self.optimal_quantity = optimal_quantity
+
+        #: Quote currency profit after taker fees when trading the optimal quantity
+        self.optimal_profit = optimal_profit
+
+    def __repr__(self):
+        return (f"Opportunity(market={self.market!r}, buy_exchange={self.buy_exchange!r}, sell_exchange={self.sell_exchange!r}, "
+                f"quantity={self.quantity!r}, buy_price={self.buy_price!r}, sell_price={self.sell_price!r}, "
+                f"optimal_quantity={self.optimal_quantity!r}, optimal_profit={self.optimal_profit!r})")
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return (self.market, self.buy_exchange, self.sell_exchange, self.quantity, self.buy_price, self.sell_price, self.optimal_quantity, self.optimal_profit) == \
+               (other.market, other.buy_exchange, other.sell_exchange, other.quantity, other.buy_price, other.sell_price, other.optimal_quantity, other.optimal_profit)
+
+    # Mutable, like the dataclass it replaced
+    __hash__ = None
+
+    #: Trades of a cross currency opportunity, None when buying and selling in the same market,
+    #: see :py:class:`order_book_recorder.currencygraph.CrossCurrencyOpportunity`
+    legs = None
 
     @property
-    def profit_without_fees(self) -> float:
-        """Get % arbitrage profit this trade would make"""
-        return (self.sell_price - self.buy_price) / self.buy_price
+    def route(self) -> str:
+        """Where we sell, for humans."""
+        return self.sell_exchange
+
+
+class OpportunityMatrix:
+    """Ask and bid prices of one market for each depth, indexed by exchange.
+
+    Profitability of every buy exchange × sell exchange pair is calculated in one vectorised step.
+    :py:class:`Opportunity` objects are only created for the pairs we are interested in,
+    and only those pairs are sized against the full order books.
+    """
+
+    def __init__(self, market: str, exchange_names: List[str], depths: List[float], taker_fees: Optional[Dict[str, float]] = None):
+        """
+
+        :param market: e.g. BTC/EUR
+        :param exchange_names: Exchanges trading this market
+        :param depths: Watched depth levels
+        :param taker_fees: exchange -> taker fee used for the optimal trade size, zero if not given
+        """
+        self.market = market
+        self.exchange_names = list(exchange_names)
+        self.exchange_index = {name: idx for idx, name in enumerate(self.exchange_names)}
+        self.depths = list(depths)
+
+        # (depth, exchange) price tables, NaN when an exchange does not have data for a depth
+        self.asks = np.full((len(self.depths), len(self.exchange_names)), np.nan)
+        self.bids = np.full((len(self.depths), len(self.exchange_names)), np.nan)
+
+        taker_fees = taker_fees or {}
+        self.fees = [taker_fees.get(name, 0.0) for name in self.exchange_names]
+
+        #: Latest order book of each exchange, None if not available
+        self.order_books: List[Optional[dict]] = [None] * len(self.exchange_names)
+
+    def update(self, exchange_name: str, ask_levels: Dict[float, float], bid_levels: Dict[float, float], order_book: Optional[dict] = None):
+        """Update prices of one exchange.
+
+        :param ask_levels: [quantity target, price] map
+        :param bid_levels: [quantity target, price] map
+        :param order_book: CCXT order book the levels were calculated from
+        """
+        idx = self.exchange_index[exchange_name]
+        self.order_books[idx] = order_book
+        for depth_idx, depth in enumerate(self.depths):
+            # Watcher might not have data available yet
+            self.asks[depth_idx, idx] = ask_levels.get(depth, np.nan)
+            self.bids[depth_idx, idx] = bid_levels.get(depth, np.nan)
+
+    def calculate_profitability(self) -> np.ndarray:
+        """Get profitability of buying at one exchange and selling at another.
+
+        :return: (depth, buy exchange, sell exchange) array, -inf for pairs without data
+        """
+        asks = self.asks[:, :, np.newaxis]
+        bids = self.bids[:, np.newaxis, :]
+        profitability = (bids - asks) / asks
+        profitability[np.isnan(profitability)] = -np.inf
+        return profitability
+
+    def calculate_optimal_size(self, ask_idx: int, bid_idx: int) -> Tuple[Optional[float], Optional[float]]:
+        """Size a trade buying at one exchange and selling at another.
+
+        :return: (base quantity, quote profit after fees), or (None, None) if an order book is not available
+        """
+        buy_book = self.order_books[ask_idx]
+        sell_book = self.order_books[bid_idx]
+        if buy_book is None or sell_book is None:
+            return None, None
+        return calculate_optimal_size(buy_book["asks"], sell_book["bids"], self.fees[ask_idx], self.fees[bid_idx])
+
+    def find_opportunities(self, top_k: Optional[int] = None, threshold: Optional[float] = None) -> Dict[float, List[Opportunity]]:
+        """Get opportunities for each depth level, ranked from the best to worst.
+
+        :param top_k: Always return this many best opportunities, or all opportunities if not given
+
+        :param threshold: Return all opportunities with profitability at or above this,
+            even if they do not fit in top k
+
+        :return: Map[depth, opportunities]
+        """
+        profitability = self.calculate_profitability()
+        exchange_count = len(self.exchange_names)
+
+        # The optimal size of a pair does not depend on the depth
+        sizes: Dict[Tuple[int, int], Tuple[Optional[float], Optional[float]]] = {}
+
+        result = {}
+        for depth_idx, depth in enumerate(self.depths):
+            flat = profitability[depth_idx].ravel()
+
+            # Stable sort keeps the ordering of equal pairs deterministic
+            order = np.argsort(-flat, kind="stable")
+
+            available = int(np.count_nonzero(flat > -np.inf))
+            count = available if top_k is None else min(top_k, available)
+            if threshold is not None:
+                count = max(count, int(np.count_nonzero(flat >= threshold)))
+
+            opportunities = []
+            for pair_idx in order[:count].tolist():
+                ask_idx, bid_idx = divmod(pair_idx, exchange_count)
+                size = sizes.get((ask_idx, bid_idx))
+                if size is None:
+                    size = sizes[(ask_idx, bid_idx)] = self.calculate_optimal_size(ask_idx, bid_idx)
+                optimal_quantity, optimal_profit = size
+                opportunities.append(Opportunity(
+                    market=self.market,
+                    buy_exchange=self.exchange_names[ask_idx],
+                    sell_exchange=self.exchange_names[bid_idx],
+                    buy_price=float(self.asks[depth_idx, ask_idx]),
+                    sell_price=float(self.bids[depth_idx, bid_idx]),
+                    quantity=depth,
+                    optimal_quantity=optimal_quantity,
+                    optimal_profit=optimal_profit,
+                ))
+
+            result[depth] = opportunities
+
+        return result
+
+
+class OpportunityEvaluator:
+    """Keep opportunity matrices for all markets and re-evaluate only the markets whose prices changed.
+
+    Clean markets keep their opportunities from the previous evaluation.
+    """
+
+    def __init__(self, market_exchanges: Dict[str, List[str]], market_depths: Dict[str, List[float]], top_k: Optional[int] = None, threshold: Optional[float] = None, taker_fees: Optional[Dict[str, float]] = None, cross_currency: Optional["CrossCurrencyEvaluator"] = None):
+        """
+
+        :param market_exchanges: market -> exchanges trading it
+        :param market_depths: market -> watched depth levels
+        :param top_k: See :py:meth:`OpportunityMatrix.find_opportunities`
+        :param threshold: See :py:meth:`OpportunityMatrix.find_opportunities`
+        :param taker_fees: exchange -> taker fee
+        :param cross_currency: Also look for arbitrage across quote currencies
+        """
+        self.top_k = top_k
+        self.threshold = threshold
+        self.cross_currency = cross_currency
+
+        self.matrices = {
+            market: OpportunityMatrix(market, exchange_names, market_depths[market], taker_fees)
+            for market, exchange_names in market_exchanges.items()
+        }
+
+        #: Markets with price updates since the last evaluation
+        self.dirty_markets = set(self.matrices.keys())
+
+        #: market -> depth -> ranked opportunities from the last evaluation
+        self.opportunities: Dict[str, Dict[float, List[Opportunity]]] = {market: {} for market in self.matrices}
+
+    def update_prices(self, market: str, exchange_name: str, ask_levels: Dict[float, float], bid_levels: Dict[float, float], order_book: Optional[dict] = None):
+        """Update prices of one exchange and mark its market to be re-evaluated.
+
+        :param order_book: See :py:meth:`OpportunityMatrix.update`
+        """
+        if market in self.matrices:
+            self.matrices[market].update(exchange_name, ask_levels, bid_levels, order_book)
+            self.dirty_markets.add(market)
+        if self.cross_currency:
+            self.cross_currency.update_prices(market, exchange_name, ask_levels, bid_levels)
+
+    def evaluate(self) -> Dict[str, Dict[float, List[Opportunity]]]:
+        """Re-evaluate dirty markets.
+
+        :return: market -> depth -> ranked opportunities for all markets
+        """
+        for market in self.dirty_markets:
+            self.opportunities[market] = self.matrices[market].find_opportunities(self.top_k, self.threshold)
+        self.dirty_markets.clear()
+
+        if self.cross_currency:
+            self.cross_currency.evaluate()
+
+        return self.opportunities
 
     @property
-    def diff(self) -> float:
-        """Fiat arbitrage window"""
-        return self.sell_price - self.buy_price
+    def cross_opportunities(self) -> Dict[str, Dict[float, List[Opportunity]]]:
+        """Cross currency opportunities from the last evaluation, keyed by the market where we buy.
 
+        :return: market -> depth -> ranked opportunities, empty if cross currency arbitrage is not enabled
+        """
+        return self.cross_currency.opportunities if self.cross_currency else {}
 
-def find_opportunities(market: str, depth_quantity: float, depth_asks: Dict[str, float], depth_bids: Dict[str, float]) -> List[Opportunity]:
-    """Get a list of opportunities, for each depth level, ranked from the best to high.
 
-    A wasteful way of computation to evaluate every opportunity there is.
+def find_opportunities(market: str, depth_quantity: float, depth_asks: Dict[str, float], depth_bids: Dict[str, float], top_k: Optional[int] = None, threshold: Optional[float] = None) -> List[Opportunity]:
+    """Get a list of opportunities, for each depth level, ranked from the best to high.
 
     :param depth_asks: (exchange, price) tuples of prices
     :param depth_bids: (exchange, price) tuples of prices
+    :param top_k: See :py:meth:`OpportunityMatrix.find_opportunities`
+    :param threshold: See :py:meth:`OpportunityMatrix.find_opportunities`
     :return:
     """
 
-    opportunities = []
-    for ask_exchange, ask_price in depth_asks.items():
-        for bid_exchange, bid_price in depth_bids.items():
-
-            o = Opportunity(
-                market=market,
-                buy_exchange=ask_exchange,
-                sell_exchange=bid_exchange,
-                buy_price=ask_price,
-                sell_price=bid_price,
-                quantity=depth_quantity,
-            )
-            opportunities.append(o)
-
-    opportunities.sort(key=lambda o: o.profit_without_fees, reverse=True)
-    return opportunities
-
+    exchange_names = list(dict.fromkeys(list(depth_asks.keys()) + list(depth_bids.keys())))
+    matrix = OpportunityMatrix(market, exchange_names, [depth_quantity])
 
+    for name in exchange_names:
+        ask_levels = {depth_quantity: depth_asks[name]} if name in depth_asks else {}
+        bid_levels = {depth_quantity: depth_bids[name]} if name in depth_bids else {}
+        matrix.update(name, ask_levels, bid_levels)
 
+    return matrix.find_opportunities(top_k, threshold)[depth_quantity]
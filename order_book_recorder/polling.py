@@ -0,0 +1,96 @@
+"""Poll order books from exchanges that do not have a websocket API.
+
+All markets of an exchange share one :py:class:`RestPoller`,
+so they share the rate limit of the exchange.
+"""
+import asyncio
+import logging
+import time
+
+from ccxt.base.errors import RateLimitExceeded, ExchangeNotAvailable, RequestTimeout
+
+from order_book_recorder.utils import TokenBucket
+
+
+logger = logging.getLogger(__name__)
+
+
+class RestPoller:
+    """Rate limited, non-blocking order book polling for one CCXT async_support exchange.
+
+    The poll interval adapts: it follows the response latency of the exchange,
+    backs off on rate limit errors and recovers back towards the minimum when the exchange is healthy.
+    """
+
+    def __init__(self, exchange_name: str, exchange, min_interval=2.0, max_interval=30.0, burst=2, tries=10):
+        """
+
+        :param exchange: CCXT async_support exchange, its rateLimit sets the rate of our token bucket
+        :param min_interval: Fastest we poll one market, seconds
+        :param max_interval: Slowest we poll one market after backing off, seconds
+        :param burst: How many requests we can do at once after being idle
+        :param tries: How many times to retry a rate limited request
+        """
+        self.exchange_name = exchange_name
+        self.exchange = exchange
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.tries = tries
+
+        # CCXT rateLimit is milliseconds between requests
+        self.bucket = TokenBucket(1000 / exchange.rateLimit, burst)
+
+        #: Current delay between polls of one market, seconds
+        self.interval = min_interval
+
+        #: Moving average of the response latency, seconds
+        self.latency = None
+
+    def on_response(self, latency: float):
+        """Move the interval towards a healthy pace."""
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        # Do not keep more than one request in flight per market when the exchange is slow
+        target = max(self.min_interval, 2 * self.latency)
+        self.interval = max(target, self.interval * 0.9)
+
+    def on_rate_limited(self):
+        self.interval = min(self.max_interval, self.interval * 2)
+        # Rate limits are per exchange, slow down all markets
+        self.bucket.drain(self.interval)
+
+    async def fetch_order_book(self, market: str, limit: int) -> dict:
+        """Fetch an order book once the rate limit allows.
+
+        Timeouts and outages return an empty order book, so the watcher keeps polling.
+        """
+        for attempt in range(self.tries):
+            await self.bucket.acquire()
+            started = time.monotonic()
+            try:
+                order_book = await self.exchange.fetch_order_book(market, limit=limit)
+                self.on_response(time.monotonic() - started)
+                return order_book
+            except RateLimitExceeded:
+                self.on_rate_limited()
+                logger.warning("Rate limit exceeded on %s, attempt %d, poll interval now %f", self.exchange_name, attempt + 1, self.interval)
+            except RequestTimeout:
+                # Gemini again
+                self.on_response(time.monotonic() - started)
+                logger.warning("Exchange timed out %s", self.exchange_name)
+                return {"asks": [], "bids": []}
+            except ExchangeNotAvailable:
+                # <head><title>502 Bad Gateway</title></head>
+                # ccxt.base.errors.ExchangeNotAvailable: gemini GET https://api.gemini.com/v1/book/btcgbp?limit_bids=100&limit_asks=100 502 Bad Gateway <html>
+                logger.warning("Exchange not available %s", self.exchange_name)
+                return {"asks": [], "bids": []}
+
+        raise RateLimitExceeded(f"{self.exchange_name} kept rate limiting {market}")
+
+    async def wait_next_poll(self, last_poll: float):
+        """Sleep until it is time to poll a market again.
+
+        :param last_poll: time.monotonic() of the previous poll of the market
+        """
+        delay = last_poll + self.interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
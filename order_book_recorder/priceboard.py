@@ -0,0 +1,267 @@
+"""Shared memory price board of the current depth prices.
+
+The main process writes the ask and bid prices of every exchange, market and depth
+to a shared memory block after each depth refresh. Other processes on the same host
+map the block with NumPy and read prices without copying or polling Redis.
+
+Layout of the shared memory block:
+
+- uint64 sequence number of the seqlock, odd while a write is in progress
+- uint64 length of the layout JSON
+- uint64 offset of the price array
+- layout JSON: exchanges, markets and depths of each market
+- float64 prices [exchange, market, side, depth], NaN when not available
+- float64 UNIX timestamps of the last update [exchange, market]
+
+Print the board from another process:
+
+    python order_book_recorder/priceboard.py order-book-prices
+"""
+import datetime
+import json
+import logging
+import time
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, List, Optional, TypeVar
+
+import numpy as np
+import typer
+
+from order_book_recorder.side import Side
+
+
+logger = logging.getLogger(__name__)
+
+
+T = TypeVar("T")
+
+
+#: Array data starts at a cache line boundary
+ALIGNMENT = 64
+
+#: Sequence number, layout length and data offset
+HEADER_SIZE = 24
+
+#: Side index in the price array
+SIDE_INDEX = {Side.ask: 0, Side.bid: 1}
+
+#: Seconds a reader retries before giving up, a write takes microseconds
+#: unless the writer died in the middle of it
+READ_TIMEOUT = 1.0
+
+
+@dataclass
+class PriceSnapshot:
+    """Consistent copy of the board."""
+
+    #: Sequence number of the copied version
+    sequence: int
+
+    #: [exchange, market, side, depth]
+    prices: np.ndarray
+
+    #: [exchange, market]
+    updated_at: np.ndarray
+
+
+class PriceBoard:
+    """Fixed layout price table in shared memory, protected by a seqlock.
+
+    There must be only one writer. Readers retry until they get a copy
+    that was not written in the meanwhile.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, layout: dict, data_offset: int, owner: bool):
+        self.shm = shm
+        self.layout = layout
+        self.owner = owner
+
+        self.exchanges: List[str] = layout["exchanges"]
+        self.markets: List[str] = layout["markets"]
+        self.depths: Dict[str, List[float]] = layout["depths"]
+
+        self.exchange_index = {name: idx for idx, name in enumerate(self.exchanges)}
+        self.market_index = {name: idx for idx, name in enumerate(self.markets)}
+        self.depth_index = {market: {depth: idx for idx, depth in enumerate(depths)} for market, depths in self.depths.items()}
+
+        max_depths = max([len(d) for d in self.depths.values()] or [1])
+        price_shape = (len(self.exchanges), len(self.markets), 2, max_depths)
+        timestamp_shape = (len(self.exchanges), len(self.markets))
+
+        offset = data_offset
+        self.sequence = np.ndarray((1,), dtype=np.uint64, buffer=shm.buf, offset=0)
+        self.prices = np.ndarray(price_shape, dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += self.prices.nbytes
+        self.updated_at = np.ndarray(timestamp_shape, dtype=np.float64, buffer=shm.buf, offset=offset)
+
+    @classmethod
+    def create(cls, name: str, exchanges: List[str], market_depths: Dict[str, List[float]]) -> "PriceBoard":
+        """Create the board. Replaces a board left behind by a crashed process.
+
+        :param market_depths: market -> depth levels
+        """
+        layout = {
+            "exchanges": list(exchanges),
+            "markets": list(market_depths.keys()),
+            "depths": {market: list(depths) for market, depths in market_depths.items()},
+        }
+
+        max_depths = max([len(d) for d in market_depths.values()] or [1])
+
+        layout_json = json.dumps(layout).encode("utf-8")
+        data_offset = (HEADER_SIZE + len(layout_json) + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+        size = data_offset + 8 * len(exchanges) * len(market_depths) * (2 * max_depths + 1)
+
+        try:
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+        np.ndarray((3,), dtype=np.uint64, buffer=shm.buf)[:] = [0, len(layout_json), data_offset]
+        shm.buf[HEADER_SIZE:HEADER_SIZE + len(layout_json)] = layout_json
+
+        board = cls(shm, layout, data_offset, owner=True)
+        board.prices[:] = np.nan
+        board.updated_at[:] = np.nan
+        return board
+
+    @classmethod
+    def attach(cls, name: str) -> "PriceBoard":
+        """Map an existing board for reading."""
+        shm = shared_memory.SharedMemory(name)
+
+        # Readers must not remove the board when they exit, https://bugs.python.org/issue39959
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+        header = np.ndarray((3,), dtype=np.uint64, buffer=shm.buf)
+        layout_length, data_offset = int(header[1]), int(header[2])
+        del header
+        layout = json.loads(bytes(shm.buf[HEADER_SIZE:HEADER_SIZE + layout_length]).decode("utf-8"))
+        return cls(shm, layout, data_offset, owner=False)
+
+    def write(self, exchange_name: str, market: str, ask_levels: Dict[float, float], bid_levels: Dict[float, float], timestamp: Optional[float] = None):
+        """Update prices of one exchange and market.
+
+        :param ask_levels: [quantity target, price] map
+        :param bid_levels: [quantity target, price] map
+        """
+        exchange_idx = self.exchange_index.get(exchange_name)
+        market_idx = self.market_index.get(market)
+        if exchange_idx is None or market_idx is None:
+            return
+
+        row = self.prices[exchange_idx, market_idx]
+        depth_index = self.depth_index[market]
+
+        # Odd sequence tells readers a write is in progress
+        self.sequence[0] += 1
+        for depth, idx in depth_index.items():
+            row[0, idx] = ask_levels.get(depth, np.nan)
+            row[1, idx] = bid_levels.get(depth, np.nan)
+        self.updated_at[exchange_idx, market_idx] = timestamp or time.time()
+        self.sequence[0] += 1
+
+    def write_watcher(self, watcher):
+        self.write(watcher.exchange_name, watcher.market, watcher.ask_levels, watcher.bid_levels)
+
+    def read_consistent(self, read: Callable[[], T], timeout: float = READ_TIMEOUT) -> T:
+        """Retry a read until no write overlapped it.
+
+        Yields the CPU between retries, so a writer in another process can finish.
+
+        :raise TimeoutError: If the board stayed in the middle of a write for the timeout,
+            e.g. the writer process died during a write
+        """
+        deadline = None
+        while True:
+            before = int(self.sequence[0])
+            if before % 2 == 0:
+                result = read()
+                if int(self.sequence[0]) == before:
+                    return result
+
+            if deadline is None:
+                deadline = time.monotonic() + timeout
+            elif time.monotonic() > deadline:
+                raise TimeoutError(f"Price board {self.shm.name} has been in the middle of a write for {timeout} s, sequence {before}")
+
+            time.sleep(0)
+
+    def read(self) -> PriceSnapshot:
+        """Copy the whole board consistently."""
+        return self.read_consistent(lambda: PriceSnapshot(int(self.sequence[0]), self.prices.copy(), self.updated_at.copy()))
+
+    def get_price(self, exchange_name: str, market: str, side: Side, depth: float) -> float:
+        """Read one price consistently.
+
+        :return: Price or NaN if the exchange does not have data for the depth
+        """
+        idx = (self.exchange_index[exchange_name], self.market_index[market], SIDE_INDEX[side], self.depth_index[market][depth])
+        return self.read_consistent(lambda: float(self.prices[idx]))
+
+    def close(self):
+        # NumPy views must go before the memory can be released
+        del self.sequence, self.prices, self.updated_at
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+#: Board written by this process
+board: Optional[PriceBoard] = None
+
+
+def is_enabled() -> bool:
+    return board is not None
+
+
+def init_board(name: str, watchers: list, market_depths: Dict[str, List[float]]):
+    """Create the board for the watched exchanges and markets."""
+    global board
+    exchanges = list(dict.fromkeys(w.exchange_name for w in watchers))
+    markets = set(w.market for w in watchers)
+    board = PriceBoard.create(name, exchanges, {market: depths for market, depths in market_depths.items() if market in markets})
+    logger.info("Writing prices to shared memory %s, %d bytes", name, board.shm.size)
+
+
+def write_watcher(watcher):
+    if board:
+        board.write_watcher(watcher)
+
+
+def close_board():
+    global board
+    if board:
+        board.close()
+        board = None
+
+
+def main(name: str):
+    """Print the current prices on a board."""
+    price_board = PriceBoard.attach(name)
+
+    started = time.perf_counter()
+    snapshot = price_board.read()
+    read_time = time.perf_counter() - started
+
+    now = time.time()
+    for market_idx, market in enumerate(price_board.markets):
+        for depth_idx, depth in enumerate(price_board.depths[market]):
+            print(f"{market} @{depth}")
+            for exchange_idx, exchange_name in enumerate(price_board.exchanges):
+                ask, bid = snapshot.prices[exchange_idx, market_idx, :, depth_idx]
+                updated_at = snapshot.updated_at[exchange_idx, market_idx]
+                age = f"{now - updated_at:.1f} s ago" if not np.isnan(updated_at) else "never"
+                print(f"    {exchange_name:12} ask {ask:12,.2f} bid {bid:12,.2f} updated {age}")
+
+    print(f"Read version {snapshot.sequence} at {datetime.datetime.utcnow()} in {read_time * 1_000_000:.1f} µs")
+    price_board.close()
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -1,41 +1,59 @@
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 
 from rich.table import Table
 
 from order_book_recorder.watcher import Watcher
 
 
-def refresh_live(exchanges: dict, markets: List[str], watchers_by_market: Dict[str, Dict[str, Watcher]]) -> Table:
-    """Make a Rich table that keeps displaying the exchange live prices"""
-    table = Table()
-    table.add_column("Exchange")
-    for market in markets:
-        table.add_column(market + " ask")
-        table.add_column("bid")
-        table.add_column("Spread BPS")
-
-    for exchange_name in exchanges.keys():
-        values = [exchange_name]
-        for market in markets:
-            watcher = watchers_by_market.get(market, {}).get(exchange_name, None)
-
-            if watcher is None:
-                values.append("N/A")
-                values.append("N/A")
-                values.append("N/A")
-                continue
-
-            if not watcher.has_data():
-                values.append("--")
-                values.append("--")
-                values.append("--")
-                continue
-
-            values.append(f"{watcher.ask_price}")
-            values.append(f"{watcher.bid_price}")
-            values.append(f"{watcher.get_spread() * 10000:,.2f}")
-
-        table.add_row(*values)
-
-    print(table)
-    return table
+class PriceTable:
+    """Rich table that keeps displaying the exchange live prices.
+
+    Cells are formatted again only for the watchers whose prices changed since the last render.
+    """
+
+    def __init__(self, exchange_names: List[str], markets: List[str], watchers_by_market: Dict[str, Dict[str, Watcher]]):
+        self.exchange_names = exchange_names
+        self.markets = markets
+        self.watchers_by_market = watchers_by_market
+
+        #: exchange -> row cells after the exchange name
+        self.cells: Dict[str, List[str]] = {name: ["N/A"] * (3 * len(markets)) for name in exchange_names}
+
+        #: (exchange, market) -> (ask price, bid price) the cells were formatted from
+        self.versions: Dict[Tuple[str, str], Optional[tuple]] = {}
+
+    def update_cells(self):
+        for exchange_name in self.exchange_names:
+            row = self.cells[exchange_name]
+            for market_idx, market in enumerate(self.markets):
+                watcher = self.watchers_by_market.get(market, {}).get(exchange_name, None)
+                version = (watcher.ask_price, watcher.bid_price) if watcher else None
+
+                key = (exchange_name, market)
+                if key in self.versions and self.versions[key] == version:
+                    continue
+                self.versions[key] = version
+
+                if watcher is None:
+                    values = ["N/A", "N/A", "N/A"]
+                elif not watcher.has_data():
+                    values = ["--", "--", "--"]
+                else:
+                    values = [f"{watcher.ask_price}", f"{watcher.bid_price}", f"{watcher.get_spread() * 10000:,.2f}"]
+
+                row[market_idx * 3:market_idx * 3 + 3] = values
+
+    def render(self) -> Table:
+        self.update_cells()
+
+        table = Table()
+        table.add_column("Exchange")
+        for market in self.markets:
+            table.add_column(market + " ask")
+            table.add_column("bid")
+            table.add_column("Spread BPS")
+
+        for exchange_name in self.exchange_names:
+            table.add_row(exchange_name, *self.cells[exchange_name])
+
+        return table
@@ -3,9 +3,11 @@
 
 import logging
 import socket
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
-from typing import Optional, List
+from dataclasses import dataclass
+from typing import List, Tuple, Dict
 
 # https://github.com/RedisTimeSeries/redistimeseries-py
 import redis
@@ -26,8 +28,47 @@ redis_thread_pool = ThreadPoolExecutor()
 # In-process counter of Redis writes we have done
 redis_updates = 0
 
+#: Redis Timeseries refuses to overwrite an existing sample
+DUPLICATE_SAMPLE_ERROR = 'TSDB: Error at upsert, update is not supported in BLOCK mode'
+
+
+@dataclass
+class BatchStats:
+    """Size and latency of the Redis write batches, so we can size the write interval."""
+
+    batches: int = 0
+    samples: int = 0
+
+    last_batch_size: int = 0
+
+    #: Seconds
+    last_batch_latency: float = 0.0
+    max_batch_latency: float = 0.0
+    total_batch_latency: float = 0.0
+
+    @property
+    def avg_batch_latency(self) -> float:
+        return self.total_batch_latency / self.batches if self.batches else 0.0
+
+    def record(self, size: int, latency: float):
+        self.batches += 1
+        self.samples += size
+        self.last_batch_size = size
+        self.last_batch_latency = latency
+        self.max_batch_latency = max(self.max_batch_latency, latency)
+        self.total_batch_latency += latency
+
+    def __str__(self):
+        return f"batches {self.batches}, last batch {self.last_batch_size} samples in {self.last_batch_latency * 1000:.1f} ms, " \
+               f"avg {self.avg_batch_latency * 1000:.1f} ms, max {self.max_batch_latency * 1000:.1f} ms"
+
+
+# In-process Redis write batch statistics
+batch_stats = BatchStats()
+
+
 def is_enabled():
-    return config.REDIS_CONFIG
+    return config.RECORDER_BACKEND == "redis" and config.REDIS_CONFIG
 
 
 def has_db():
@@ -66,69 +107,163 @@ def test_connection():
     rts.redis.lpush(f"recorder_connected_{host}", time.time())
 
 
+def format_stats() -> str:
+    return f"depth records written {redis_updates}, write {batch_stats}"
+
+
 def format_key(exchange: str, base_pair: str, quote_pair: str, side: Side, depth: float):
     """Get a key to used as the timeseries name."""
     return f"Orderbook depth: {exchange} {base_pair}-{quote_pair} {side.value} at {depth}"
 
 
-def init_time_series(exchange: str, base_pair: str, quote_pair: str, side: Side, depth: float):
-    key = format_key(exchange, base_pair, quote_pair, side, depth)
-    rts = get_client()
-    if not rts.redis.exists(key):
-        labels = {
-            "type": "orderbook_depth",
-            "exchange": exchange,
-            "base_pair": base_pair,
-            "quote_pair": quote_pair,
-            "side": side.value,
-            "depth": depth
-        }
-        logger.info(f"Created redis key {key}")
-        rts.create(key, labels=labels)
-
-
-def record_order_book_price(rts: Client, timestamp_ms: int, exchange: str, base_pair: str, quote_pair: str, side: Side, depth: float, value: float) -> Optional[dict]:
-    """Record order book state for later analysis.
-
-    Example for what is the price of a Bitcoin if buying Bitcoin with 1000 USD in Kucoin.
-    Value is the value of Bitcoin bought at the price.
-
-    :param timestamp_ms: Bot tick UNIX timestamp as milliseconds
-    :param exchange: "kucoin"
-    :param base_pair: "BTC"
-    :param quote_pair: "USDT"
-    :param side: "buy"
-    :param depth: Depth of the recording as quantity of base pair
-    :param reporter: "mikko"
-    :param value: 32,123
+def format_labels(exchange: str, base_pair: str, quote_pair: str, side: Side, depth: float) -> dict:
+    """Get labels of a timeseries for filtering with TS.MRANGE."""
+    return {
+        "type": "orderbook_depth",
+        "exchange": exchange,
+        "base_pair": base_pair,
+        "quote_pair": quote_pair,
+        "side": side.value,
+        "depth": depth
+    }
+
+
+class SeriesRegistry:
+    """Precomputed timeseries keys for every watched (exchange, market, side, depth).
+
+    Keys are formatted and checked to exist in Redis only once,
+    so the write path is a plain dictionary lookup.
+    Depth levels that were not registered at the startup are registered lazily.
+    """
+
+    def __init__(self):
+        #: (exchange, market, side, depth) -> timeseries key
+        self.keys: Dict[Tuple[str, str, Side, float], str] = {}
+
+        #: Timeseries key -> labels for series not yet created in Redis
+        self.pending: Dict[str, dict] = {}
+
+        # record_depths() runs in a thread pool
+        self.lock = threading.Lock()
+
+    def register(self, exchange: str, market: str, side: Side, depth: float) -> str:
+        """Add a new timeseries to be created in Redis."""
+        with self.lock:
+            key = self.keys.get((exchange, market, side, depth))
+            if key is None:
+                base_pair, quote_pair = market.split("/")
+                key = format_key(exchange, base_pair, quote_pair, side, depth)
+                self.pending[key] = format_labels(exchange, base_pair, quote_pair, side, depth)
+                self.keys[(exchange, market, side, depth)] = key
+            return key
+
+    def get_key(self, exchange: str, market: str, side: Side, depth: float) -> str:
+        """Get the timeseries key, registering it if needed."""
+        key = self.keys.get((exchange, market, side, depth))
+        if key is None:
+            key = self.register(exchange, market, side, depth)
+        return key
+
+    def has_pending(self) -> bool:
+        return len(self.pending) > 0
+
+    def create_pending(self, rts: Client):
+        """Create all registered timeseries missing from Redis.
+
+        One pipelined round trip for the existence checks and one for the creations.
+        """
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+
+        if not pending:
+            return
+
+        keys = list(pending.keys())
+
+        pipe = rts.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.exists(key)
+        exists = pipe.execute()
+
+        missing = [key for key, found in zip(keys, exists) if not found]
+        if not missing:
+            return
+
+        pipe = rts.pipeline(transaction=False)
+        for key in missing:
+            pipe.create(key, labels=pending[key])
+
+        for key, result in zip(missing, pipe.execute(raise_on_error=False)):
+            # Another thread might have created the key with TS.ADD in the meanwhile
+            if isinstance(result, redis.exceptions.ResponseError) and "already exists" not in str(result):
+                raise RuntimeError(f"Could not create timeseries {key}: {result}") from result
+
+        logger.info("Created %d redis keys", len(missing))
+
+
+# Keys of the timeseries we write
+series_registry = SeriesRegistry()
+
+
+def register_watchers(watchers: list):
+    """Create timeseries for all depths of the watchers at the startup.
+
+    :param watchers: List of :py:class:`order_book_recorder.watcher.Watcher`
+    """
+    for w in watchers:
+        for depth in w.depth_levels:
+            series_registry.register(w.exchange_name, w.market, Side.ask, depth)
+            series_registry.register(w.exchange_name, w.market, Side.bid, depth)
+
+    series_registry.create_pending(get_client())
+
+
+def record_order_book_prices(rts: Client, samples: List[Tuple[str, int, float]]) -> int:
+    """Record a batch of order book samples with a single TS.MADD round trip.
+
+    TS.MADD reports errors per sample, so a duplicate sample does not fail the whole batch.
+
+    :param samples: (key, timestamp_ms, value) tuples
+
+    :return: Number of samples written
     """
 
     global redis_updates
 
-    assert type(timestamp_ms) == int, "Got invalid timestamp: %s" % type(timestamp_ms)
-    assert type(value) == float, "Got invalid value: %s" % type(value)
+    if not samples:
+        return 0
+
+    started = time.perf_counter()
 
-    key = format_key(exchange, base_pair, quote_pair, side, depth)
+    results = rts.madd(samples)
 
-    try:
-        # Redis Timeseries expects timestamps as milliseconds
-        rts.add(key, timestamp_ms, value)
-        redis_updates += 1
+    written = 0
+    for (key, timestamp_ms, value), result in zip(samples, results):
+        if not isinstance(result, redis.exceptions.ResponseError):
+            written += 1
+            continue
 
-    except redis.exceptions.ResponseError as e:
-        if str(e) == 'TSDB: Error at upsert, update is not supported in BLOCK mode':
+        if str(result) == DUPLICATE_SAMPLE_ERROR:
             # Ignore duplicate keys
-            logger.exception(e)
-            return None
+            logger.warning("Duplicate sample %s at %d", key, timestamp_ms)
+        elif "key does not exist" in str(result):
+            # Unlike TS.ADD, TS.MADD does not create new time series
+            rts.add(key, timestamp_ms, value)
+            written += 1
+        else:
+            raise RuntimeError(f"Could not record {key}={value} at timestamp {timestamp_ms}: {result}") from result
 
-        #existing = rts.range(key, timestamp, timestamp)
-        raise RuntimeError(f"Could not record {key}={value} at timestamp {timestamp_ms}: {e}") from e
+    redis_updates += written
+    batch_stats.record(len(samples), time.perf_counter() - started)
+    return written
 
 
 @to_async(executor=redis_thread_pool)
 def record_depths(timestamp_ms: int, depth_data: List[dict]):
     """Write multiple depths to the Redis.
 
+    All samples of the tick are written in one batch.
     Run in a separate thread to not to block.
     """
 
@@ -136,14 +271,18 @@ def record_depths(timestamp_ms: int, depth_data: List[dict]):
 
     rts = get_client()
 
+    samples = []
     for r in depth_data:
         # See Watcher.get_depth_record()
         exchange_name = r["exchange_name"]
         market = r["market"]
-        base_pair, quote_pair = market.split("/")
         for depth, price in r["ask_levels"].items():
-            record_order_book_price(rts, timestamp_ms, exchange_name, base_pair, quote_pair, Side.ask, depth, price)
+            samples.append((series_registry.get_key(exchange_name, market, Side.ask, depth), timestamp_ms, price))
         for depth, price in r["bid_levels"].items():
-            record_order_book_price(rts, timestamp_ms, exchange_name, base_pair, quote_pair, Side.bid, depth, price)
+            samples.append((series_registry.get_key(exchange_name, market, Side.bid, depth), timestamp_ms, price))
 
+    if series_registry.has_pending():
+        # Depth levels added after the startup
+        series_registry.create_pending(rts)
 
+    record_order_book_prices(rts, samples)
@@ -0,0 +1,152 @@
+"""Bounded background queue for depth record writes.
+
+Keeps the main loop from piling up pending writes when the database slows down.
+"""
+import asyncio
+import enum
+import logging
+import time
+from asyncio import Queue, Task, create_task
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class OverflowPolicy(enum.Enum):
+    """What to do when the write queue is full."""
+
+    # Wait until the writer catches up
+    block = "block"
+
+    # Throw away the oldest queued tick
+    drop_oldest = "drop_oldest"
+
+    # Merge all queued ticks to one tick holding the latest record of each watcher
+    coalesce = "coalesce"
+
+
+@dataclass
+class DepthTick:
+    """Depth records of all watchers at one moment."""
+
+    timestamp_ms: int
+
+    #: See Watcher.get_depth_record()
+    depths: List[dict]
+
+    #: UNIX timestamp when the tick was queued
+    enqueued_at: float
+
+
+@dataclass
+class RecorderQueueStats:
+    """Recorder queue metrics."""
+
+    queue_depth: int = 0
+    written_ticks: int = 0
+    dropped_ticks: int = 0
+
+    #: Seconds between queuing a tick and finishing its write
+    last_write_lag: float = 0.0
+    max_write_lag: float = 0.0
+
+    def __str__(self):
+        return f"queue depth {self.queue_depth}, written {self.written_ticks}, dropped {self.dropped_ticks}, " \
+               f"write lag {self.last_write_lag * 1000:.1f} ms, max {self.max_write_lag * 1000:.1f} ms"
+
+
+def coalesce_ticks(ticks: List[DepthTick]) -> DepthTick:
+    """Merge ticks to one, keeping the latest record of each watcher.
+
+    :param ticks: Oldest first
+    """
+    latest = {}
+    for tick in ticks:
+        for record in tick.depths:
+            latest[(record["exchange_name"], record["market"])] = record
+
+    newest = ticks[-1]
+    return DepthTick(newest.timestamp_ms, list(latest.values()), ticks[0].enqueued_at)
+
+
+class RecorderQueue:
+    """Write depth records in a background task through a bounded queue."""
+
+    def __init__(self, writer: Callable[[int, List[dict]], Awaitable], max_size: int, policy: OverflowPolicy):
+        """
+
+        :param writer: Coroutine writing one tick, e.g. :py:func:`order_book_recorder.recorder.record_depths`
+        :param max_size: How many ticks can wait to be written
+        :param policy: What to do when the queue is full
+        """
+        assert max_size > 0, "The queue must be bounded"
+        self.writer = writer
+        self.max_size = max_size
+        self.policy = policy
+        self.stats = RecorderQueueStats()
+        self.queue: Optional[Queue] = None
+        self.task: Optional[Task] = None
+
+    def start(self):
+        """Start the writer task. Must be called inside the event loop."""
+        self.queue = Queue(maxsize=self.max_size)
+        self.task = create_task(self.run(), name="Recorder queue writer")
+
+    async def put(self, timestamp_ms: int, depths: List[dict]):
+        """Queue depth records of one tick for writing."""
+        tick = DepthTick(timestamp_ms, depths, time.time())
+
+        if self.policy == OverflowPolicy.block or not self.queue.full():
+            await self.queue.put(tick)
+        elif self.policy == OverflowPolicy.drop_oldest:
+            self.queue.get_nowait()
+            self.stats.dropped_ticks += 1
+            self.queue.put_nowait(tick)
+        elif self.policy == OverflowPolicy.coalesce:
+            ticks = []
+            while not self.queue.empty():
+                ticks.append(self.queue.get_nowait())
+            ticks.append(tick)
+            self.stats.dropped_ticks += len(ticks) - 1
+            self.queue.put_nowait(coalesce_ticks(ticks))
+        else:
+            raise RuntimeError(f"Unknown overflow policy {self.policy}")
+
+        self.stats.queue_depth = self.queue.qsize()
+
+    async def run(self):
+        """Write queued ticks until closed."""
+        while True:
+            tick = await self.queue.get()
+            self.stats.queue_depth = self.queue.qsize()
+
+            if tick is None:
+                # Closed
+                return
+
+            try:
+                await self.writer(tick.timestamp_ms, tick.depths)
+            except Exception as e:
+                # Keep recording even if one write fails
+                logger.error("Could not write depth tick at %d", tick.timestamp_ms)
+                logger.exception(e)
+                continue
+
+            lag = time.time() - tick.enqueued_at
+            self.stats.written_ticks += 1
+            self.stats.last_write_lag = lag
+            self.stats.max_write_lag = max(self.stats.max_write_lag, lag)
+
+    async def close(self):
+        """Write out all queued ticks and stop the writer task."""
+        if self.task is None:
+            return
+
+        if not self.task.done():
+            # The close marker is put after all queued ticks
+            await self.queue.put(None)
+
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
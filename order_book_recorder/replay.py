@@ -0,0 +1,128 @@
+"""Capture order books and replay them deterministically.
+
+Capture live order books to a JSONL file:
+
+    python order_book_recorder/main.py --no-live --capture-file capture.jsonl
+
+Replay them through depth calculation, opportunity evaluation and alerts, as fast as possible:
+
+    python order_book_recorder/replay.py capture.jsonl
+
+or at the recorded speed:
+
+    python order_book_recorder/replay.py capture.jsonl --speed 1.0
+"""
+import asyncio
+import datetime
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import typer
+
+from order_book_recorder import config
+from order_book_recorder.alert import Alert, AlertBook
+from order_book_recorder.capture import read_capture
+from order_book_recorder.history import AlertHistory, AlertKind
+from order_book_recorder.config import ALERT_THRESHOLD, RETRIGGER_THRESHOLD
+from order_book_recorder.logger import setup_logging
+from order_book_recorder.main import create_opportunity_evaluator, update_opportunities
+from order_book_recorder.watcher import Watcher
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReplayResult:
+    books: int
+    duration: float
+    alerts: List[Alert]
+
+    @property
+    def books_per_second(self) -> float:
+        return self.books / self.duration if self.duration else 0.0
+
+
+async def replay(path: str, speed: Optional[float] = None) -> ReplayResult:
+    """Feed captured order books through the evaluation path.
+
+    :param path: Capture JSONL file
+    :param speed: Multiplier of the recorded wall clock speed, or None to run as fast as possible
+    :return: All alerts raised during the replay, ended first
+    """
+
+    records = read_capture(path)
+
+    header = next(records)
+    assert header["type"] == "watchers", f"Not a capture file: {path}"
+
+    watchers: Dict[tuple, Watcher] = {}
+    watchers_by_market: Dict[str, Dict[str, Watcher]] = defaultdict(dict)
+    market_depths = {}
+    conversion_market_depths = {}
+    for w in header["watchers"]:
+        watcher = Watcher(w["exchange"], w["market"], None, w["depth_levels"])
+        watchers[(w["exchange"], w["market"])] = watcher
+        watchers_by_market[w["market"]][w["exchange"]] = watcher
+        if w["market"] in config.CONVERSION_MARKET_DEPTHS:
+            conversion_market_depths[w["market"]] = w["depth_levels"]
+        else:
+            market_depths[w["market"]] = w["depth_levels"]
+
+    evaluator = create_opportunity_evaluator(watchers_by_market, market_depths, conversion_market_depths)
+    # Keep all alerts, a replay is finite
+    alert_book = AlertBook(ALERT_THRESHOLD, RETRIGGER_THRESHOLD, market_depths, AlertHistory(max_size=None))
+    cross_alert_book = AlertBook(ALERT_THRESHOLD, RETRIGGER_THRESHOLD, history=alert_book.history, kind=AlertKind.cross_currency)
+
+    books = 0
+    first_received_at = None
+    started = time.perf_counter()
+
+    for record in records:
+        received_at = record["received_at"]
+
+        if speed:
+            if first_received_at is None:
+                first_received_at = received_at
+            delay = (received_at - first_received_at) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        watcher = watchers[(record["exchange"], record["market"])]
+        watcher.orderbook = record
+
+        updated_watchers = [watcher] if watcher.refresh_depths() else []
+        all_opportunities = update_opportunities(evaluator, updated_watchers)
+
+        # Use the recorded time, so alerts are the same on every run
+        now = datetime.datetime.utcfromtimestamp(received_at)
+        await alert_book.update(all_opportunities, now=now)
+        await cross_alert_book.update(evaluator.cross_opportunities, now=now)
+
+        books += 1
+
+    duration = time.perf_counter() - started
+
+    active_alerts = list(alert_book.active_alerts.values()) + list(cross_alert_book.active_alerts.values())
+    return ReplayResult(books, duration, list(alert_book.history) + active_alerts)
+
+
+def main(capture_file: str, speed: float = 0.0):
+    setup_logging()
+
+    # Never send replayed alerts to the Telegram group
+    config.TELEGRAM_API_KEY = None
+
+    result = asyncio.get_event_loop().run_until_complete(replay(capture_file, speed or None))
+
+    for a in result.alerts:
+        print(f"{a.key} buy {a.buy_exchange} {a.buy_price} sell {a.sell_exchange} {a.sell_price} profitability {a.profitability} started {a.started} ended {a.friendly_ended}")
+
+    print(f"Replayed {result.books} order books in {result.duration:.2f} s, {result.books_per_second:,.0f} books/s, {len(result.alerts)} alerts")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,94 @@
+"""Event driven runtime for exchange watchers."""
+import asyncio
+import logging
+from asyncio import Queue, Task, create_task
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from order_book_recorder import config
+from order_book_recorder.polling import RestPoller
+from order_book_recorder.watcher import BookUpdate, Watcher
+
+
+logger = logging.getLogger(__name__)
+
+
+def create_watchers(exchanges: dict) -> Tuple[List[Watcher], Dict[str, Dict[str, Watcher]]]:
+    """Create watchers for all watched markets the exchanges have.
+
+    :return: (watchers, market -> exchange -> watcher lookup)
+    """
+    watchers = []
+
+    # market -> exchange -> Watcher lookup
+    watchers_by_market: Dict[str, Dict[str, Watcher]] = defaultdict(dict)
+
+    for exchange_name, exchange in exchanges.items():
+
+        if hasattr(exchange, "watch_order_book"):
+            poller = None
+        else:
+            # All markets of a REST-only exchange share its rate limit
+            poller = RestPoller(exchange_name, exchange, config.REST_MIN_POLL_INTERVAL, config.REST_MAX_POLL_INTERVAL)
+
+        for market in config.MARKETS + config.CONVERSION_MARKETS:
+            if market in exchange.symbols:
+                logger.info("Starting to watch market %s: %s", exchange_name, market)
+
+                if market.startswith("BTC"):
+                    depths = config.BTC_DEPTHS
+                elif market.startswith("ETH"):
+                    depths = config.ETH_DEPTHS
+                elif market.startswith("EUR"):
+                    depths = config.EUR_DEPTHS
+                else:
+                    raise RuntimeError(f"Cannot handle market {market}")
+
+                watcher = Watcher(exchange_name, market, exchange, depths, poller)
+                watchers.append(watcher)
+                watchers_by_market[market][exchange_name] = watcher
+
+    return watchers, watchers_by_market
+
+
+class WatcherRuntime:
+    """Run a long-lived watch loop for each watcher and collect their order book updates.
+
+    Watchers push :py:class:`BookUpdate` events to a shared queue.
+    A single consumer picks them all up in one go, so bursts get coalesced.
+    """
+
+    def __init__(self, watchers: List[Watcher]):
+        self.watchers = watchers
+        self.updates: Optional[Queue] = None
+        self.tasks: List[Task] = []
+
+    def start(self):
+        """Start the watch loops. Must be called inside the event loop."""
+        self.updates = Queue()
+        for w in self.watchers:
+            task = create_task(w.run(self.updates), name=f"{w.exchange_name}: {w.market} watch loop")
+            self.tasks.append(task)
+
+    async def wait_updates(self) -> List[BookUpdate]:
+        """Wait until at least one order book has been updated.
+
+        :return: All updates queued since the last call, one per watcher
+        """
+        updates = [await self.updates.get()]
+        while not self.updates.empty():
+            updates.append(self.updates.get_nowait())
+
+        for u in updates:
+            u.watcher.update_pending = False
+            if u.error:
+                raise RuntimeError(f"Error while processing exchange {u.watcher.exchange_name}: {u.watcher.market}") from u.error
+
+        return updates
+
+    async def stop(self):
+        """Cancel all watch loops."""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
@@ -0,0 +1,330 @@
+"""Run exchange watchers in worker processes.
+
+Each worker process has its own event loop and watchers for a shard of the exchanges.
+Workers parse order books and calculate depths, and send the resulting depth levels
+to the coordinator process that evaluates opportunities and raises alerts.
+
+Whole order books stay in the workers. Only the top ``config.SHARD_BOOK_LEVELS`` levels
+of each side are sent along, so optimal trade sizes and liquidity queries in the coordinator
+see only the top of the book: a query deeper than that gets no answer.
+
+The coordinator mirrors the remote watchers with :py:class:`MirrorWatcher` objects,
+and :py:class:`ShardedRuntime` stands in for :py:class:`order_book_recorder.runtime.WatcherRuntime`,
+so the rest of the application does not know the difference.
+"""
+import asyncio
+import logging
+import multiprocessing
+import threading
+import traceback
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from order_book_recorder import config
+from order_book_recorder.logger import setup_logging
+from order_book_recorder.runtime import WatcherRuntime, create_watchers
+from order_book_recorder.watcher import BookUpdate, Watcher
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ShardReady:
+    """A worker has connected to its exchanges."""
+
+    shard_id: int
+
+    #: (exchange, market, depth levels) of the watchers of the worker
+    watchers: List[Tuple[str, str, List[float]]]
+
+
+@dataclass
+class LevelUpdate:
+    """New depth levels of one watcher, sent from a worker to the coordinator."""
+
+    exchange_name: str
+    market: str
+
+    #: UNIX timestamp when the order book arrived to the worker
+    received_at: float
+
+    ask_price: Optional[float]
+    bid_price: Optional[float]
+
+    #: [quantity target, price] maps
+    ask_levels: Dict[float, float]
+    bid_levels: Dict[float, float]
+
+    #: Copy of the top (price, quantity) levels of the order book
+    asks: List[list]
+    bids: List[list]
+
+    #: Order book version, see :py:meth:`Watcher.refresh_depths`
+    nonce: Optional[int]
+    timestamp: Optional[int]
+
+    #: Depth recomputations (performed, skipped) in the worker
+    recomputation_stats: Tuple[int, int]
+
+
+@dataclass
+class ShardError:
+    """A worker crashed."""
+
+    shard_id: int
+    error: str
+
+
+def assign_shards(exchange_names: List[str], worker_count: int) -> List[List[str]]:
+    """Split exchanges to workers round-robin."""
+    shards = [[] for i in range(min(worker_count, len(exchange_names)))]
+    for idx, name in enumerate(exchange_names):
+        shards[idx % len(shards)].append(name)
+    return shards
+
+
+async def run_worker(shard_id: int, exchange_names: List[str], out: multiprocessing.Queue, setup_exchanges: Callable):
+    exchanges = await setup_exchanges(exchange_names)
+    watchers, watchers_by_market = create_watchers(exchanges)
+
+    out.put(ShardReady(shard_id, [(w.exchange_name, w.market, w.depth_levels) for w in watchers]))
+
+    runtime = WatcherRuntime(watchers)
+    runtime.start()
+
+    book_levels = config.SHARD_BOOK_LEVELS
+
+    try:
+        while True:
+            updates = await runtime.wait_updates()
+
+            level_updates = []
+            for u in updates:
+                w = u.watcher
+                if w.refresh_depths():
+                    book = w.orderbook
+                    level_updates.append(LevelUpdate(
+                        w.exchange_name,
+                        w.market,
+                        u.received_at,
+                        w.ask_price,
+                        w.bid_price,
+                        w.ask_levels,
+                        w.bid_levels,
+                        # Exchange clients update the levels in place, so take a copy
+                        [list(order[:2]) for order in book["asks"][:book_levels]],
+                        [list(order[:2]) for order in book["bids"][:book_levels]],
+                        book.get("nonce"),
+                        book.get("timestamp"),
+                        w.get_depth_recomputation_stats(),
+                    ))
+
+            # One message per duty cycle
+            if level_updates:
+                out.put(level_updates)
+    finally:
+        await runtime.stop()
+        for exchange in exchanges.values():
+            await exchange.close()
+
+
+async def run_worker_until_stopped(shard_id: int, exchange_names: List[str], out: multiprocessing.Queue, setup_exchanges: Callable, stopping: multiprocessing.Event):
+    """Run the worker until the coordinator tells us to stop.
+
+    Killing a worker in the middle of writing to the queue would leave the queue unreadable,
+    so workers must exit cleanly.
+    """
+    worker = asyncio.ensure_future(run_worker(shard_id, exchange_names, out, setup_exchanges))
+
+    while not worker.done() and not stopping.is_set():
+        await asyncio.wait([worker], timeout=0.2)
+
+    if worker.done():
+        # Raise the crash reason
+        worker.result()
+    else:
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+
+def worker_main(shard_id: int, exchange_names: List[str], out: multiprocessing.Queue, setup_exchanges: Callable, stopping: multiprocessing.Event, log_level: int):
+    """Worker process entry point."""
+    setup_logging(log_level)
+    try:
+        asyncio.new_event_loop().run_until_complete(run_worker_until_stopped(shard_id, exchange_names, out, setup_exchanges, stopping))
+    except Exception as e:
+        logger.exception(e)
+        out.put(ShardError(shard_id, traceback.format_exc()))
+
+
+class MirrorWatcher(Watcher):
+    """Coordinator side copy of a watcher running in a worker process.
+
+    Depth levels are calculated by the worker, so there is nothing to refresh.
+    The order book holds only the top levels sent by the worker.
+    """
+
+    def __init__(self, exchange_name: str, pair: str, depth_levels: List[float]):
+        super().__init__(exchange_name, pair, None, depth_levels)
+
+        #: Depth recomputations (performed, skipped) reported by the worker
+        self.recomputation_stats = (0, 0)
+
+    def apply(self, update: LevelUpdate):
+        self.ask_price = update.ask_price
+        self.bid_price = update.bid_price
+        self.ask_levels = update.ask_levels
+        self.bid_levels = update.bid_levels
+        self.orderbook = {"asks": update.asks, "bids": update.bids, "nonce": update.nonce, "timestamp": update.timestamp}
+        self.recomputation_stats = update.recomputation_stats
+
+    def refresh_depths(self) -> bool:
+        return True
+
+    def get_depth_recomputation_stats(self) -> Tuple[int, int]:
+        return self.recomputation_stats
+
+
+class ShardedRuntime:
+    """Run watchers in worker processes and collect their depth level updates.
+
+    Has the same interface as :py:class:`order_book_recorder.runtime.WatcherRuntime`.
+    """
+
+    def __init__(self, shards: List[List[str]], setup_exchanges: Callable = config.setup_exchanges, log_level=logging.INFO):
+        """
+
+        :param shards: Exchange names for each worker, see :py:func:`assign_shards`
+        :param setup_exchanges: Creates the exchanges in a worker, must be picklable
+        :param log_level: Log level of the workers
+        """
+        self.shards = shards
+        self.setup_exchanges = setup_exchanges
+        self.log_level = log_level
+
+        # Workers must not inherit the event loop and sockets of the coordinator
+        self.context = multiprocessing.get_context("spawn")
+        self.queue = self.context.Queue()
+        self.stopping = self.context.Event()
+        self.processes = []
+
+        self.messages: Optional[asyncio.Queue] = None
+        self.reader: Optional[threading.Thread] = None
+
+        #: (exchange, market) -> mirror watcher
+        self.watchers: Dict[Tuple[str, str], MirrorWatcher] = {}
+
+        #: Depth level updates received from the workers, before coalescing
+        self.received = 0
+
+    def read_queue(self, loop: asyncio.AbstractEventLoop):
+        """Move messages from the worker processes to the event loop."""
+        while True:
+            msg = self.queue.get()
+            if msg is None:
+                break
+            loop.call_soon_threadsafe(self.messages.put_nowait, msg)
+
+    async def connect(self) -> Tuple[List[MirrorWatcher], Dict[str, Dict[str, MirrorWatcher]]]:
+        """Start the workers and wait until they have connected to their exchanges.
+
+        :return: (watchers, market -> exchange -> watcher lookup) mirroring the remote watchers
+        """
+        self.messages = asyncio.Queue()
+        self.reader = threading.Thread(target=self.read_queue, args=(asyncio.get_event_loop(),), name="Shard reader", daemon=True)
+        self.reader.start()
+
+        for shard_id, exchange_names in enumerate(self.shards):
+            process = self.context.Process(
+                target=worker_main,
+                args=(shard_id, exchange_names, self.queue, self.setup_exchanges, self.stopping, self.log_level),
+                name=f"Shard {shard_id}",
+                daemon=True)
+            process.start()
+            self.processes.append(process)
+
+        watchers_by_market: Dict[str, Dict[str, MirrorWatcher]] = defaultdict(dict)
+        ready = 0
+        while ready < len(self.shards):
+            msg = await self.messages.get()
+            if isinstance(msg, ShardError):
+                raise RuntimeError(f"Shard {msg.shard_id} crashed on startup:\n{msg.error}")
+            elif isinstance(msg, ShardReady):
+                for exchange_name, market, depth_levels in msg.watchers:
+                    watcher = MirrorWatcher(exchange_name, market, depth_levels)
+                    self.watchers[(exchange_name, market)] = watcher
+                    watchers_by_market[market][exchange_name] = watcher
+                ready += 1
+            else:
+                # A shard that got ready earlier is already sending levels,
+                # they are picked up when the evaluator is created
+                self.apply_levels(msg, {})
+
+        logger.info("%d shards ready with %d watchers", len(self.shards), len(self.watchers))
+
+        # Keep the exchange order of the config
+        exchange_order = {name: idx for idx, name in enumerate(config.EXCHANGE_FACTORIES)}
+        watchers = sorted(self.watchers.values(), key=lambda w: exchange_order.get(w.exchange_name, len(exchange_order)))
+        return watchers, watchers_by_market
+
+    def start(self):
+        """Workers are already running after :py:meth:`connect`."""
+
+    async def wait_updates(self) -> List[BookUpdate]:
+        """Wait until at least one worker has sent depth levels.
+
+        :return: All updates received since the last call, one per watcher
+        """
+        batches = [await self.messages.get()]
+        while not self.messages.empty():
+            batches.append(self.messages.get_nowait())
+
+        updates = {}
+        for batch in batches:
+            if isinstance(batch, ShardError):
+                raise RuntimeError(f"Shard {batch.shard_id} crashed:\n{batch.error}")
+
+            self.apply_levels(batch, updates)
+
+        return list(updates.values())
+
+    def apply_levels(self, batch: List[LevelUpdate], updates: Dict[MirrorWatcher, BookUpdate]):
+        """Update mirror watchers with a batch of levels from a worker.
+
+        :param updates: Collect updated watchers here
+        """
+        self.received += len(batch)
+        for level_update in batch:
+            watcher = self.watchers[(level_update.exchange_name, level_update.market)]
+            watcher.apply(level_update)
+            # The latest levels win, but report when the first of them arrived
+            if watcher not in updates:
+                updates[watcher] = BookUpdate(watcher, level_update.received_at)
+
+    async def stop(self, timeout=5.0):
+        """Stop the workers.
+
+        :param timeout: How long to wait for the workers to exit before killing them
+        """
+        self.stopping.set()
+
+        loop = asyncio.get_event_loop()
+        killed = False
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                logger.warning("Killing %s", process.name)
+                process.terminate()
+                process.join()
+                killed = True
+        self.processes = []
+
+        if self.reader:
+            # After a kill the queue might be left with a half written message,
+            # and the daemon reader thread stays blocked on it
+            if not killed:
+                self.queue.put(None)
+                await loop.run_in_executor(None, self.reader.join)
+            self.reader = None
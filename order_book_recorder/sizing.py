@@ -0,0 +1,57 @@
+"""Find the most profitable arbitrage trade size across two order books."""
+from typing import Tuple
+
+
+def calculate_optimal_size(asks: list, bids: list, buy_fee: float, sell_fee: float) -> Tuple[float, float]:
+    """Get the trade size that makes the most profit after taker fees.
+
+    Walks the ask book of the buy exchange and the bid book of the sell exchange together,
+    best levels first, in one O(n + m) pass. Each step trades the smaller of the two remaining level quantities.
+    The profit of the next unit only gets worse deeper in the books,
+    so the walk stops at the first step that would lose money.
+    Usually the books do not cross at all and the walk stops on the first step.
+
+    :param asks: (price, quantity) levels of the buy exchange, lowest first
+    :param bids: (price, quantity) levels of the sell exchange, highest first
+    :param buy_fee: Taker fee of the buy exchange, e.g. 0.0026 for 26 BPS
+    :param sell_fee: Taker fee of the sell exchange
+
+    :return: (base quantity, profit in quote currency after fees), (0, 0) if no size is profitable
+    """
+    buy_cost = 1 + buy_fee
+    sell_proceeds = 1 - sell_fee
+
+    ask_idx = bid_idx = 0
+    ask_count = len(asks)
+    bid_count = len(bids)
+
+    # What is left of the current levels after the previous steps
+    ask_left = asks[0][1] if ask_count else 0
+    bid_left = bids[0][1] if bid_count else 0
+
+    quantity = 0.0
+    profit = 0.0
+
+    while ask_idx < ask_count and bid_idx < bid_count:
+        unit_profit = bids[bid_idx][0] * sell_proceeds - asks[ask_idx][0] * buy_cost
+        if unit_profit <= 0:
+            break
+
+        step = min(ask_left, bid_left)
+        quantity += step
+        profit += step * unit_profit
+
+        ask_left -= step
+        bid_left -= step
+
+        if ask_left <= 0:
+            ask_idx += 1
+            if ask_idx < ask_count:
+                ask_left = asks[ask_idx][1]
+
+        if bid_left <= 0:
+            bid_idx += 1
+            if bid_idx < bid_count:
+                bid_left = bids[bid_idx][1]
+
+    return quantity, profit
@@ -0,0 +1,183 @@
+"""Structured JSON-lines stream of ticker prices and ranked opportunities.
+
+Each line is one snapshot:
+
+.. code-block:: json
+
+    {
+        "timestamp": 1636383600.123,
+        "tickers": [{"exchange": "Kraken", "market": "BTC/EUR", "ask": 57010.1, "bid": 57001.5}],
+        "opportunities": [{"kind": "market", "market": "BTC/EUR", "depth": 0.04, "rank": 1, "buy_exchange": "Kraken", "buy_price": 57012.3,
+                           "sell_exchange": "Bitstamp", "sell_price": 57050.0, "quantity": 0.04,
+                           "profit_without_fees": 0.00066, "diff": 37.7, "optimal_quantity": 0.12, "optimal_profit": 1.3, "legs": null}]
+    }
+
+Prices are written as exact floats, ``null`` when an exchange does not have data yet.
+
+``kind`` is ``market`` for opportunities within one market and ``cross_currency`` for
+the cross currency opportunities of :py:mod:`order_book_recorder.currencygraph`,
+whose market is the one where the coin is bought. Their ``legs`` list all trades of the cycle
+as ``{"exchange": "Kraken", "market": "EUR/GBP", "side": "bid", "price": 0.85}``.
+
+The main loop only takes references to the current prices and opportunities.
+Serialisation and file writes are done in a background thread.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from order_book_recorder.history import AlertKind
+from order_book_recorder.opportunity import Opportunity
+from order_book_recorder.watcher import Watcher
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Snapshot:
+    """Prices and opportunities at one moment, not yet serialised."""
+
+    timestamp: float
+
+    #: (exchange, market, ask price, bid price)
+    tickers: List[Tuple[str, str, Optional[float], Optional[float]]]
+
+    #: (kind, market, depth, best opportunities first)
+    opportunities: List[Tuple[AlertKind, str, float, List[Opportunity]]]
+
+
+def serialise_snapshot(snapshot: Snapshot) -> str:
+    """Convert a snapshot to a compact JSON line."""
+    tickers = [{"exchange": exchange_name, "market": market, "ask": ask, "bid": bid} for exchange_name, market, ask, bid in snapshot.tickers]
+
+    opportunities = []
+    for kind, market, depth, depth_opportunities in snapshot.opportunities:
+        for rank, o in enumerate(depth_opportunities, start=1):
+            opportunities.append({
+                "kind": kind.value,
+                "market": market,
+                "depth": depth,
+                "rank": rank,
+                "buy_exchange": o.buy_exchange,
+                "buy_price": o.buy_price,
+                "sell_exchange": o.sell_exchange,
+                "sell_price": o.sell_price,
+                "quantity": o.quantity,
+                "profit_without_fees": o.profit_without_fees,
+                "diff": o.diff,
+                "optimal_quantity": o.optimal_quantity,
+                "optimal_profit": o.optimal_profit,
+                "legs": [leg.to_dict() for leg in o.legs] if o.legs else None,
+            })
+
+    data = {"timestamp": snapshot.timestamp, "tickers": tickers, "opportunities": opportunities}
+    return json.dumps(data, separators=(",", ":")) + "\n"
+
+
+class OpportunityStream:
+    """Write snapshots to a rotating JSON-lines file in a background thread.
+
+    When the writer falls behind, new snapshots are dropped, so the main loop never waits.
+    """
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int, queue_size: int, top_n: int):
+        """
+
+        :param path: File to write, rotated files get .1, .2, ... suffix
+        :param max_bytes: Rotate the file when it grows over this size
+        :param backup_count: How many rotated files to keep
+        :param queue_size: How many snapshots can wait for the writer
+        :param top_n: How many opportunities to write per market and depth
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.top_n = top_n
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.file = None
+        self.thread: Optional[threading.Thread] = None
+
+        self.written = 0
+        self.dropped = 0
+
+    def start(self):
+        self.file = open(self.path, "at", encoding="utf-8")
+        self.thread = threading.Thread(target=self.run, name="Opportunity stream", daemon=True)
+        self.thread.start()
+
+    def put(self, watchers: List[Watcher], all_opportunities: Dict[str, Dict[float, List[Opportunity]]], timestamp: Optional[float] = None, cross_opportunities: Optional[Dict[str, Dict[float, List[Opportunity]]]] = None):
+        """Queue the current prices and opportunities for writing.
+
+        The evaluators replace opportunity lists instead of modifying them,
+        so the writer thread can read them later.
+
+        :param cross_opportunities: Cross currency opportunities, keyed by the market where we buy
+        """
+        opportunities = []
+        for kind, kind_opportunities in ((AlertKind.market, all_opportunities), (AlertKind.cross_currency, cross_opportunities or {})):
+            for market, depths in kind_opportunities.items():
+                for depth, depth_opportunities in depths.items():
+                    opportunities.append((kind, market, depth, depth_opportunities[:self.top_n]))
+
+        snapshot = Snapshot(
+            timestamp or time.time(),
+            [(w.exchange_name, w.market, w.ask_price, w.bid_price) for w in watchers],
+            opportunities,
+        )
+
+        try:
+            self.queue.put_nowait(snapshot)
+        except queue.Full:
+            self.dropped += 1
+
+    def rotate(self):
+        """Shift path -> path.1 -> path.2 ... and start a new file."""
+        self.file.close()
+        for idx in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{idx}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{idx + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "at", encoding="utf-8")
+
+    def run(self):
+        while True:
+            snapshot = self.queue.get()
+            if snapshot is None:
+                break
+
+            try:
+                line = serialise_snapshot(snapshot)
+                if self.file.tell() + len(line) > self.max_bytes and self.file.tell() > 0:
+                    self.rotate()
+                self.file.write(line)
+                self.written += 1
+
+                # Let consumers tailing the file see complete snapshots
+                if self.queue.empty():
+                    self.file.flush()
+            except Exception as e:
+                logger.exception(e)
+
+    def close(self):
+        """Write the queued snapshots and close the file."""
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def __str__(self):
+        return f"written {self.written}, dropped {self.dropped}"
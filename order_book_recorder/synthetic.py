@@ -0,0 +1,71 @@
+"""Synthetic order books for benchmarks.
+
+Sizes and prices are in the same ballpark as the BTC and ETH fiat markets we watch.
+"""
+import random
+from typing import Dict, List, Optional
+
+from order_book_recorder.watcher import Watcher
+
+
+#: Order book sizes we get from exchanges, see watch_order_book_limits in Watcher
+ORDER_BOOK_SIZES = [100, 200, 500]
+
+MID_PRICES = {
+    "BTC": 42_000.0,
+    "ETH": 2_750.0,
+    "EUR": 0.85,
+}
+
+
+def generate_side(levels: int, best_price: float, direction: int, rng: random.Random, tick_ratio=0.00001, max_quantity=0.05) -> list:
+    """Random (price, quantity) levels of one order book side, best price first.
+
+    :param direction: 1 for asks, -1 for bids
+    """
+    price = best_price
+    side = []
+    for i in range(levels):
+        side.append([price, rng.uniform(max_quantity / 100, max_quantity)])
+        price += direction * best_price * tick_ratio * rng.randint(1, 5)
+    return side
+
+
+def generate_order_book(levels: int, mid_price: float, rng: random.Random, spread=0.0005, nonce: Optional[int] = None) -> dict:
+    """Random CCXT order book.
+
+    :param spread: Relative distance between the best ask and the best bid
+    """
+    half_spread = mid_price * spread / 2
+    return {
+        "asks": generate_side(levels, mid_price + half_spread, 1, rng),
+        "bids": generate_side(levels, mid_price - half_spread, -1, rng),
+        "nonce": nonce,
+        "timestamp": None,
+    }
+
+
+def generate_target_levels(count: int, max_depth=0.5) -> List[float]:
+    """Evenly spaced depth levels up to max_depth of base token."""
+    return [max_depth * (i + 1) / count for i in range(count)]
+
+
+def generate_watchers(exchange_count: int, markets: List[str], depth_levels: List[float], levels: int, rng: random.Random) -> Dict[str, Dict[str, Watcher]]:
+    """Create watchers with random order books and their depths calculated.
+
+    Mid prices differ slightly between exchanges, so that some pairs are profitable.
+
+    :return: market -> exchange -> watcher
+    """
+    watchers_by_market = {}
+    for market in markets:
+        base = market.split("/")[0]
+        watchers_by_market[market] = {}
+        for i in range(exchange_count):
+            exchange_name = f"Exchange {i}"
+            watcher = Watcher(exchange_name, market, None, depth_levels)
+            mid_price = MID_PRICES.get(base, 100.0) * (1 + rng.gauss(0, 0.001))
+            watcher.orderbook = generate_order_book(levels, mid_price, rng, nonce=1)
+            watcher.refresh_depths()
+            watchers_by_market[market][exchange_name] = watcher
+    return watchers_by_market
@@ -1,44 +1,236 @@
 import asyncio
 import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Optional
 
 import aiohttp
 
 from order_book_recorder import config
+from order_book_recorder.utils import TokenBucket
 
 
 logger = logging.getLogger(__name__)
 
 
+#: Telegram refuses longer messages
+MAX_MESSAGE_LENGTH = 4096
+
+
 def is_enabled() -> bool:
     return config.TELEGRAM_CHAT_ID and config.TELEGRAM_API_KEY
 
 
-async def send_message(text, throttle_delay=3.0):
-    token = config.TELEGRAM_API_KEY
-    chat_id = config.TELEGRAM_CHAT_ID
+@dataclass
+class Message:
+    title: str
+    text: str
+
+    #: How many notifications were merged to this message
+    count: int = 1
+
+    #: How many notifications did not fit in this digest and are only counted
+    dropped: int = 0
+
+    def format(self) -> str:
+        text = self.title + "\n" + self.text
+        if self.dropped:
+            text += f"\n+{self.dropped} more"
+        return text
+
+
+def merge_messages(messages: List[Message], max_length=MAX_MESSAGE_LENGTH) -> Message:
+    """Merge queued notifications to one digest message.
+
+    Notifications that would make the digest longer than Telegram allows
+    are left out and summarised as "+N more" at the end.
+    """
+    total = sum(m.count + m.dropped for m in messages)
+    title = f"📋 {total} notifications"
+
+    # Leave room for the title and the "+N more" line
+    budget = max_length - len(title) - len(f"\n\n+{total} more")
+
+    parts = []
+    length = 0
+    count = 0
+    dropped = 0
+    for m in messages:
+        # Digests are not nested, their titles only tell the count
+        part = m.text if m.count > 1 else m.format()
+        dropped += m.dropped
+        if length + len(part) + 1 <= budget:
+            parts.append(part)
+            length += len(part) + 1
+            count += m.count
+        else:
+            dropped += m.count
+
+    return Message(title, "\n".join(parts), count, dropped)
+
+
+def truncate(text: str, max_length=MAX_MESSAGE_LENGTH) -> str:
+    if len(text) <= max_length:
+        return text
+    suffix = "\n..."
+    return text[:max_length - len(suffix)] + suffix
+
+
+class TelegramNotifier:
+    """Send messages to a Telegram chat in a background task.
+
+    Uses one pooled HTTP session and a token bucket matching the per-chat rate limits.
+    Messages that pile up while we wait for the rate limit are merged to one digest,
+    so the number of requests stays bounded however many alerts fire.
+    """
+
+    def __init__(self, api_url: str, token: str, chat_id: str, queue_size=20, rate=20 / 60, burst=3, attempts=5, timeout=10.0):
+        """
+
+        :param api_url: Telegram Bot API server, e.g. https://api.telegram.org, or a local stand-in
+        :param queue_size: Queued messages are merged to one when there are this many of them
+        :param rate: Messages per second
+        :param burst: How many messages we can send at once after being idle
+        :param attempts: How many times to retry a throttled message
+        :param timeout: Seconds to wait for one Telegram request
+        """
+        self.url = f"{api_url}/bot{token}/sendMessage"
+        self.chat_id = chat_id
+        self.queue_size = queue_size
+        self.bucket = TokenBucket(rate, burst)
+        self.attempts = attempts
+        self.timeout = timeout
+
+        self.pending = deque()
+        self.wakeup = asyncio.Event()
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.task: Optional[asyncio.Task] = None
+
+        #: Sent HTTP requests
+        self.sent = 0
+
+        #: Notifications that went out in a digest
+        self.merged = 0
+
+        #: Notifications left out of a full digest
+        self.dropped = 0
+
+        #: Notifications we failed to send
+        self.failed = 0
+
+    def start(self):
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=1), timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self.task = asyncio.get_event_loop().create_task(self.run())
+
+    def submit(self, title: str, text: str):
+        """Queue a message without waiting."""
+        if len(self.pending) >= self.queue_size:
+            digest = merge_messages(list(self.pending))
+            self.pending.clear()
+            self.pending.append(digest)
+
+        self.pending.append(Message(title, text))
+        self.wakeup.set()
+
+    async def run(self):
+        while True:
+            if not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+
+            await self.bucket.acquire()
+
+            # Everything that queued up while we were rate limited goes out in one message
+            if len(self.pending) == 1:
+                message = self.pending.popleft()
+            else:
+                message = merge_messages(list(self.pending))
+                self.pending.clear()
+
+            # Digests are also made in submit() when the queue fills up
+            if message.count > 1:
+                self.merged += message.count
+
+            if message.dropped:
+                logger.warning("Telegram digest full, left out %d notifications", message.dropped)
+                self.dropped += message.dropped
+
+            try:
+                await self.send(message)
+            except Exception as e:
+                # Keep the sender alive for the next messages
+                logger.exception(e)
+                self.failed += message.count
+
+    async def send(self, message: Message):
+        payload = {
+            "chat_id": self.chat_id,
+            "text": truncate(message.format()),
+        }
+
+        for attempt in range(self.attempts):
+            try:
+                async with self.session.post(self.url, json=payload) as resp:
+                    self.sent += 1
+                    if resp.status == 200:
+                        return
+                    elif resp.status == 429:
+                        try:
+                            data = await resp.json(content_type=None)
+                        except ValueError:
+                            # Throttled by a proxy in front of the Bot API
+                            data = {}
+                        retry_after = data.get("parameters", {}).get("retry_after", 3)
+                        logger.warning("Throttling Telegram for %s s, attempt %d", retry_after, attempt + 1)
+                        # Other messages must wait as well
+                        self.bucket.drain(retry_after)
+                        await asyncio.sleep(retry_after)
+                    else:
+                        logger.error("Got Telegram response %d: %s", resp.status, await resp.text())
+                        break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error("Could not reach Telegram: %r", e)
+                break
+
+        self.failed += message.count
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.session:
+            await self.session.close()
+
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    params = {
-       "chat_id": chat_id,
-       "text": text,
-    }
+#: Started on the first message
+notifier: Optional[TelegramNotifier] = None
 
-    attempts = 10
 
-    while attempts >= 0:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as resp:
-                if resp.status == 200:
-                    return
-                elif resp.status == 429:
-                    logger.warning("Throttling Telegram, attempts %d", attempts)
-                    attempts -= 1
-                    await asyncio.sleep(throttle_delay)
-                    continue
-                else:
-                    logger.error("Got Telegram response: %s", resp)
-                    raise RuntimeError(f"Bad HTTP response: {resp}")
+def get_notifier() -> TelegramNotifier:
+    global notifier
+    if not notifier:
+        notifier = TelegramNotifier(
+            config.TELEGRAM_API_URL,
+            config.TELEGRAM_API_KEY,
+            config.TELEGRAM_CHAT_ID,
+            queue_size=config.TELEGRAM_QUEUE_SIZE,
+            rate=config.TELEGRAM_RATE,
+            burst=config.TELEGRAM_BURST,
+        )
+        notifier.start()
+    return notifier
 
 
+def send_message(title: str, text: str):
+    """Queue a message to the Telegram chat."""
+    get_notifier().submit(title, text)
 
 
+async def close():
+    global notifier
+    if notifier:
+        await notifier.close()
+        notifier = None
@@ -5,6 +5,7 @@ Courtesy of https://stackoverflow.com/a/66352467/315168
 """
 
 import asyncio
+import time
 from concurrent.futures import ThreadPoolExecutor
 from functools import wraps, partial
 from typing import Union, Optional
@@ -29,6 +30,54 @@ class to_async:
 
         return wrapper
 
+class TokenBucket:
+    """Token bucket rate limiter for asyncio.
+
+    Tokens refill continuously at `rate` per second up to `capacity`,
+    so short bursts go through immediately and the long term rate stays bounded.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+
+        :param rate: Tokens per second
+        :param capacity: Maximum burst
+        """
+        assert rate > 0
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take tokens if they are available right now."""
+        self.refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def get_delay(self, tokens: float = 1) -> float:
+        """How many seconds until tokens are available."""
+        self.refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def drain(self, seconds: float):
+        """Take out tokens worth of seconds, e.g. when the remote tells us to back off."""
+        self.refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    async def acquire(self, tokens: float = 1):
+        """Wait until tokens are available and take them."""
+        while not self.try_acquire(tokens):
+            await asyncio.sleep(self.get_delay(tokens))
+
+
 #@to_async(executor=None)
 #def sync(*args, **kwargs):
 #    print(args, kwargs)
@@ -1,46 +1,62 @@
 import logging
 import time
-from asyncio import Task, create_task
-from typing import Optional, Dict, List, Union, Callable
-from concurrent.futures import ThreadPoolExecutor
-from ccxtpro.base.exchange import Exchange as ProExchange
-from ccxt.base.exchange import Exchange as SyncExchange
-from ccxt.base.errors import RateLimitExceeded, ExchangeNotAvailable, RequestTimeout
+from asyncio import Queue
+from dataclasses import dataclass
+from typing import Optional, Dict, List, Tuple
+from ccxt.async_support.base.exchange import Exchange as AsyncExchange
 
-from order_book_recorder.depth import Side, calculate_price_at_depths
-from order_book_recorder.utils import to_async
-
-# Create a thread pool where sync exchange APIs will be executed
-sync_exchange_thread_pool = ThreadPoolExecutor()
+from order_book_recorder.depth import Side, IncrementalDepth, LiquidityIndex
+from order_book_recorder.polling import RestPoller
 
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class BookUpdate:
+    """Tell the evaluator that the order book of a watcher has been updated."""
+
+    watcher: "Watcher"
+
+    #: UNIX timestamp when the order book update arrived
+    received_at: float
+
+    #: Set if the watch loop crashed
+    error: Optional[Exception] = None
+
+
 class Watcher:
 
     exchange_name: str
     market: str
-    exchange: Union[ProExchange, SyncExchange]
-    orderbook: dict
-    task: Optional[Task]
-    done: bool
+    exchange: AsyncExchange
+    orderbook: Optional[dict]
 
-    def __init__(self, exchange_name: str, pair: str, exchange, depth_levels: List[float]):
+    def __init__(self, exchange_name: str, pair: str, exchange, depth_levels: List[float], poller: Optional[RestPoller] = None):
         """
 
         :param exchange_name: Human readable name for this exchange
         :param pair: e.g. BTC/EUR
-        :param exchange: CCXT/CCXT Pro exchange object
+        :param exchange: CCXT Pro or CCXT async_support exchange object
         :param depth_levels: Watched depth levels
+        :param poller: Rate limiter shared by the markets of a REST-only exchange
         """
         self.exchange_name = exchange_name
         self.market = pair
         self.exchange = exchange
-        self.task = None
-        self.done = False
         self.depth_levels = depth_levels
-        self.task_count = 0
+
+        # We have told the evaluator about an update it has not picked up yet
+        self.update_pending = False
+
+        # Optional capture.BookCapture tap writing all received order books
+        self.capture = None
+
+        # Latest CCXT order book, None for watchers that only get depth levels
+        self.orderbook = None
+
+        # Side -> (order book version, liquidity index), built when first asked
+        self.liquidity_indexes: Dict[Side, Tuple[tuple, LiquidityIndex]] = {}
 
         self.ask_price = None
         self.bid_price = None
@@ -49,6 +65,13 @@ class Watcher:
         self.ask_levels = {}
         self.bid_levels = {}
 
+        # Recompute depths only when the watched head of the book changes
+        self.ask_depth = IncrementalDepth(Side.ask, depth_levels)
+        self.bid_depth = IncrementalDepth(Side.bid, depth_levels)
+
+        # (nonce, timestamp) of the last order book we calculated depths for
+        self.last_book_version = None
+
         # Hacky hack
         watch_order_book_limits = {
             "Bitfinex": 100,
@@ -59,90 +82,67 @@ class Watcher:
 
         self.order_book_limit = watch_limit
 
-        # Sync API throttling
-        self.min_fetch_delay = 2.0
-        self.last_fetch = 0
+        self.poller = poller
+
+        # time.monotonic() of the last REST poll
+        self.last_poll = 0.0
 
     async def start_watching(self) -> "WatchedExchange":
         """Options
 
-        - Sync API
-        - ASync API
+        - Websocket API
+        - REST API (Exmo, Gemini)
         """
 
         if hasattr(self.exchange, "watch_order_book"):
             # CCXT PRO
             self.orderbook = await self.watch_async()
         else:
-            # CCXT
-            # Sync (Exmo) or async API (Gemini)
-            self.orderbook = await self.watch_sync()
-        self.done = True
-        return self
+            # CCXT async_support
+            self.orderbook = await self.watch_rest()
 
-    async def watch_async(self):
-        return await self.exchange.watch_order_book(self.market, limit=self.order_book_limit)
+        if self.capture:
+            self.capture.write(self)
 
-    @to_async(executor=sync_exchange_thread_pool)
-    def watch_sync(self):
-        """Wrap a sync API in a thread pool execution."""
-        tries = 10
-        delay = 1.0
+        return self
 
-        needs_sleeping = self.min_fetch_delay - (time.time() - self.last_fetch)
-        if needs_sleeping > 0:
-            # logger.info("Adding some sleep for %s: %f", self.exchange_name, needs_sleeping)
-            time.sleep(needs_sleeping)
+    async def run(self, updates: Queue):
+        """Keep watching the order book and tell the evaluator about the updates.
 
-        while tries:
-            try:
-                order_book = self.exchange.fetch_order_book(self.market, limit=self.order_book_limit)
-                self.last_fetch = time.time()
-                return order_book
-            except RateLimitExceeded:
-                logger.warning("Rate limit exceeded on %s, tries %d, delay %s", self.exchange_name, tries, delay)
-                time.sleep(delay)
-                tries -= 1
-                delay *= 1.25
-            except RequestTimeout:
-                # Gemini again
-                logger.warning("Exchange timed out %s", self.exchange_name)
-                return {"asks": [], "bids": []}
-            except ExchangeNotAvailable:
-                # <head><title>502 Bad Gateway</title></head>
-                # ccxt.base.errors.ExchangeNotAvailable: gemini GET https://api.gemini.com/v1/book/btcgbp?limit_bids=100&limit_asks=100 502 Bad Gateway <html>
-                logger.warning("Exchange not available %s", self.exchange_name)
-                return {"asks": [], "bids": []}
-
-    def create_task(self):
-        self.done = False
-        self.task_count += 1
-        self.task = create_task(self.start_watching(), name=f"{self.exchange_name}: {self.market} task #{self.task_count}")
-        return self.task
-
-    def is_task_pending(self):
-        if self.task is None:
-            return False
-
-        if self.done:
-            return False
+        Only one update per watcher is queued at a time.
+        The evaluator reads the latest order book when it picks up the update,
+        so any updates in between are coalesced.
 
-        return True
+        :param updates: Queue of :py:class:`BookUpdate` events
+        """
+        while True:
+            try:
+                await self.start_watching()
+            except Exception as e:
+                updates.put_nowait(BookUpdate(self, time.time(), e))
+                return
 
-    def is_done(self):
-        if self.task is None:
-            return False
+            if not self.update_pending:
+                self.update_pending = True
+                updates.put_nowait(BookUpdate(self, time.time()))
 
-        if self.done:
-            return True
+    async def watch_async(self):
+        return await self.exchange.watch_order_book(self.market, limit=self.order_book_limit)
 
-        return False
+    async def watch_rest(self):
+        """Poll a REST API, sharing the rate limit with other markets of the exchange."""
+        await self.poller.wait_next_poll(self.last_poll)
+        self.last_poll = time.monotonic()
+        return await self.poller.fetch_order_book(self.market, limit=self.order_book_limit)
 
     def has_data(self):
         return self.ask_price is not None
 
-    def refresh_depths(self):
-        """Update exchange market depths"""
+    def refresh_depths(self) -> bool:
+        """Update exchange market depths
+
+        :return: True if ask or bid levels were recomputed
+        """
         #  BTC/GBP [42038.45, 0.083876] [42017.45, 0.03815124]
 
         if len(self.orderbook["asks"]) > 0:
@@ -152,14 +152,75 @@ class Watcher:
         if len(self.orderbook["bids"]) > 0:
             self.bid_price = self.orderbook["bids"][0][0]
 
-        ask_success, self.ask_levels, max_ask = calculate_price_at_depths(self.orderbook["asks"], Side.ask, self.depth_levels)
-        bid_success, self.bid_levels, max_bid = calculate_price_at_depths(self.orderbook["bids"], Side.bid, self.depth_levels)
+        # The exchange tells us this is the same order book version we already processed
+        book_version = (self.orderbook.get("nonce"), self.orderbook.get("timestamp"))
+        if book_version != (None, None) and book_version == self.last_book_version:
+            self.ask_depth.skip()
+            self.bid_depth.skip()
+            return False
+
+        self.last_book_version = book_version
+
+        ask_updated = self.ask_depth.update(self.orderbook["asks"])
+        if ask_updated:
+            self.ask_levels = self.ask_depth.levels
+            if not self.ask_depth.success:
+                logger.warning("Could not map out ask levels %s on %s %s, got max ask inventory %f", self.exchange_name, self.market, self.depth_levels, self.ask_depth.max_level)
+
+        bid_updated = self.bid_depth.update(self.orderbook["bids"])
+        if bid_updated:
+            self.bid_levels = self.bid_depth.levels
+            if not self.bid_depth.success:
+                logger.warning("Could not map out bid levels %s on %s %s, got max bid inventory %f", self.exchange_name, self.market, self.depth_levels, self.bid_depth.max_level)
 
-        if not ask_success:
-            logger.warning("Could not map out ask levels %s on %s %s, got max ask inventory %f", self.exchange_name, self.market, self.depth_levels, max_ask)
+        return ask_updated or bid_updated
 
-        if not bid_success:
-            logger.warning("Could not map out bid levels %s on %s %s, got max bid inventory %f", self.exchange_name, self.market, self.depth_levels, max_bid)
+    def get_liquidity_index(self, side: Side) -> Optional[LiquidityIndex]:
+        """Get the liquidity index of one side of the latest order book.
+
+        Exchange clients update the order book in place whenever a message arrives,
+        so the index is reused only while the book has the same (nonce, timestamp) version.
+        Books without a version get a new index on every call.
+
+        :return: Index or None if the watcher does not have an order book
+        """
+        if not self.orderbook:
+            return None
+
+        version = (self.orderbook.get("nonce"), self.orderbook.get("timestamp"))
+        cached = self.liquidity_indexes.get(side)
+        if cached and version != (None, None) and cached[0] == version:
+            return cached[1]
+
+        orders = self.orderbook["asks"] if side == Side.ask else self.orderbook["bids"]
+        index = LiquidityIndex(orders, side)
+        self.liquidity_indexes[side] = (version, index)
+        return index
+
+    def price_at_quantity(self, side: Side, quantity: float) -> Optional[float]:
+        """Get the average price of trading any quantity, see :py:meth:`LiquidityIndex.price_at_quantity`.
+
+        :return: Average price or None if not known
+        """
+        index = self.get_liquidity_index(side)
+        return index.price_at_quantity(quantity) if index else None
+
+    def quantity_at_price(self, side: Side, price: float) -> Optional[float]:
+        """Get how much can be traded up to a limit price, see :py:meth:`LiquidityIndex.quantity_at_price`.
+
+        :return: Base token quantity or None if not known
+        """
+        index = self.get_liquidity_index(side)
+        return index.quantity_at_price(price) if index else None
+
+    def get_depth_recomputation_stats(self) -> Tuple[int, int]:
+        """How many depth recomputations we have performed and skipped for both sides.
+
+        :return: (performed, skipped)
+        """
+        performed = self.ask_depth.recomputations + self.bid_depth.recomputations
+        skipped = self.ask_depth.skipped_recomputations + self.bid_depth.skipped_recomputations
+        return performed, skipped
 
     def get_spread(self):
         assert self.has_data()
@@ -0,0 +1,58 @@
+"""Benchmark the depth engines against the old pure Python order book walk.
+
+The configured depths of each market come first, as they are what the tracker runs,
+then targets spread across the whole book to find where the NumPy engine catches up with the walk.
+
+Run:
+
+    python scripts/benchmark-depth.py
+"""
+import random
+import timeit
+
+from order_book_recorder.config import MARKET_DEPTHS
+from order_book_recorder.depth import calculate_price_at_depths, calculate_price_at_depths_python, walk_depth_profile, search_depth_profile
+from order_book_recorder.side import Side
+from order_book_recorder.synthetic import ORDER_BOOK_SIZES, MID_PRICES, generate_side
+
+
+def benchmark(label: str, asks: list, targets: list, rounds=2000):
+    # All engines must agree
+    expected = calculate_price_at_depths_python(asks, Side.ask, targets)
+    assert calculate_price_at_depths(asks, Side.ask, targets) == expected
+    assert walk_depth_profile(asks, targets)[:3] == expected
+    assert search_depth_profile(asks, targets)[:3] == expected
+
+    walk_time = timeit.timeit(lambda: walk_depth_profile(asks, targets), number=rounds)
+    numpy_time = timeit.timeit(lambda: search_depth_profile(asks, targets), number=rounds)
+    python_time = timeit.timeit(lambda: calculate_price_at_depths_python(asks, Side.ask, targets), number=rounds)
+
+    print(f"{label:40}: "
+          f"walk {walk_time / rounds * 1_000_000:8.1f} µs, "
+          f"numpy {numpy_time / rounds * 1_000_000:8.1f} µs, "
+          f"old python {python_time / rounds * 1_000_000:8.1f} µs, "
+          f"numpy vs walk {walk_time / numpy_time:5.2f}x")
+
+
+def main():
+    rng = random.Random(1)
+
+    print("Configured depths")
+    for market, depths in MARKET_DEPTHS.items():
+        base = market.split("/")[0]
+        for levels in ORDER_BOOK_SIZES:
+            asks = generate_side(levels, MID_PRICES[base], 1, rng)
+            benchmark(f"{market} {depths} levels {levels:4}", asks, depths)
+
+    print("Targets spread to the bottom of the book")
+    for levels in ORDER_BOOK_SIZES + [2000]:
+        asks = generate_side(levels, MID_PRICES["BTC"], 1, rng)
+        total = sum(q for p, q in asks)
+
+        for depth_count in (1, 4, 16, 64, 256, 1024):
+            targets = [total * (i + 1) / (depth_count + 1) for i in range(depth_count)]
+            benchmark(f"Levels {levels:4} depths {depth_count:4}", asks, targets, rounds=200)
+
+
+if __name__ == "__main__":
+    main()
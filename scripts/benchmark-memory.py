@@ -0,0 +1,134 @@
+"""Memory and allocation benchmark for a full evaluation cycle.
+
+A cycle is what happens for one order book update: depth refresh, opportunity
+evaluation and alert update. Memory is traced with tracemalloc over synthetic order books.
+
+Also compares the size of the slotted Opportunity to the dataclass it replaced.
+
+Run:
+
+    python scripts/benchmark-memory.py
+"""
+import asyncio
+import logging
+import random
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+from order_book_recorder.alert import AlertBook
+from order_book_recorder.config import ALERT_THRESHOLD, RETRIGGER_THRESHOLD
+from order_book_recorder.main import create_opportunity_evaluator, update_opportunities
+from order_book_recorder.opportunity import Opportunity
+from order_book_recorder.synthetic import generate_order_book, generate_target_levels, generate_watchers
+
+
+MARKETS = ["BTC/GBP", "ETH/GBP", "BTC/EUR", "ETH/EUR"]
+
+
+@dataclass
+class DataclassOpportunity:
+    """The old Opportunity, for comparison."""
+
+    market: str
+    buy_exchange: str
+    sell_exchange: str
+    quantity: float
+    buy_price: float
+    sell_price: float
+
+    @property
+    def profit_without_fees(self) -> float:
+        return (self.sell_price - self.buy_price) / self.buy_price
+
+    @property
+    def diff(self) -> float:
+        return self.sell_price - self.buy_price
+
+
+def instance_size(o) -> int:
+    size = sys.getsizeof(o)
+    if hasattr(o, "__dict__"):
+        size += sys.getsizeof(o.__dict__)
+    return size
+
+
+def compare_opportunity_sizes():
+    args = ("BTC/EUR", "Exchange 0", "Exchange 1", 0.04, 42_000.0, 42_100.0)
+
+    for cls in (DataclassOpportunity, Opportunity):
+        count = 100_000
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        items = [cls(*args) for i in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        started = time.perf_counter()
+        for o in items:
+            o.profit_without_fees
+            o.diff
+        read_time = time.perf_counter() - started
+
+        print(f"{cls.__name__:22}: instance {instance_size(items[0]):4} bytes, "
+              f"traced {(after - before) / count:6.1f} bytes/instance, "
+              f"derived reads {read_time / count * 1_000_000_000:6.1f} ns/instance")
+
+
+async def benchmark_cycles(market_count: int, exchange_count: int, depth_count: int, cycles: int, rng: random.Random):
+    markets = MARKETS[:market_count]
+    depths = generate_target_levels(depth_count)
+    watchers_by_market = generate_watchers(exchange_count, markets, depths, 100, rng)
+    evaluator = create_opportunity_evaluator(watchers_by_market, {m: depths for m in markets})
+    watchers = [w for market_watchers in watchers_by_market.values() for w in market_watchers.values()]
+
+    # Generate books up front, so that only the evaluation allocations are traced
+    updates = []
+    for i in range(cycles):
+        w = rng.choice(watchers)
+        updates.append((w, generate_order_book(100, w.bid_price * (1 + rng.gauss(0, 0.002)), rng, nonce=i + 2)))
+
+    alert_book = AlertBook(ALERT_THRESHOLD, RETRIGGER_THRESHOLD, {m: depths for m in markets})
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    before = tracemalloc.take_snapshot()
+
+    for w, book in updates:
+        w.orderbook = book
+        updated_watchers = [w] if w.refresh_depths() else []
+        all_opportunities = update_opportunities(evaluator, updated_watchers)
+        await alert_book.update(all_opportunities)
+
+    current, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    # Allocations still alive after the run, mostly alerts and the latest opportunities
+    retained_blocks = sum(s.count_diff for s in after.compare_to(before, "filename") if s.count_diff > 0)
+
+    print(f"Markets {market_count} exchanges {exchange_count:2} depths {depth_count}: "
+          f"peak {(peak - baseline) / 1024:8.1f} KiB, "
+          f"retained {(current - baseline) / 1024:8.1f} KiB, "
+          f"retained blocks/cycle {retained_blocks / cycles:6.2f}")
+
+
+async def run_all(cycles: int):
+    rng = random.Random(1)
+    for market_count in (1, 4):
+        for exchange_count in (2, 8, 16):
+            for depth_count in (1, 4):
+                await benchmark_cycles(market_count, exchange_count, depth_count, cycles, rng)
+
+
+def main():
+    # Alerts log every start and end
+    logging.basicConfig(level=logging.WARNING)
+
+    compare_opportunity_sizes()
+    asyncio.get_event_loop().run_until_complete(run_all(1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Benchmark per-update overhead of the watcher runtime.
+
+Compares the old duty cycle, which rebuilt the task list and called
+asyncio.wait(FIRST_COMPLETED) over every watcher on each update,
+to the queue based WatcherRuntime.
+
+Exchanges are faked, so this measures only the scheduling overhead.
+
+Run:
+
+    python scripts/benchmark-runtime.py
+"""
+import asyncio
+import random
+import time
+
+from order_book_recorder.runtime import WatcherRuntime
+from order_book_recorder.watcher import Watcher
+
+
+class FakeExchange:
+    """Resolve watch_order_book() only when the benchmark pushes an update."""
+
+    def __init__(self):
+        self.future = None
+        self.book = {"asks": [[100.0, 1.0]], "bids": [[99.0, 1.0]]}
+
+    async def watch_order_book(self, market, limit=None):
+        self.future = asyncio.get_event_loop().create_future()
+        await self.future
+        return self.book
+
+    def push(self):
+        self.future.set_result(None)
+
+
+def create_watchers(count: int):
+    return [Watcher(f"Exchange {i}", "BTC/EUR", FakeExchange(), [0.04]) for i in range(count)]
+
+
+def push_random_update(watchers):
+    # All watchers are waiting for their next update at this point
+    random.choice(watchers).exchange.push()
+
+
+async def benchmark_wait_first_completed(watchers, updates: int) -> float:
+    """The old run_duty_cycle scheduling."""
+    tasks = {}
+    loop = asyncio.get_event_loop()
+
+    # Let all watchers to start waiting
+    for w in watchers:
+        tasks[w] = asyncio.create_task(w.start_watching())
+    await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    for i in range(updates):
+        for w in watchers:
+            if tasks[w].done():
+                tasks[w] = asyncio.create_task(w.start_watching())
+
+        loop.call_soon(push_random_update, watchers)
+
+        done, pending = await asyncio.wait(list(tasks.values()), return_when=asyncio.FIRST_COMPLETED)
+        for d in done:
+            await d
+
+        # Let the recreated tasks reach their waiting point
+        await asyncio.sleep(0)
+
+    duration = time.perf_counter() - started
+
+    for task in tasks.values():
+        task.cancel()
+    await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    return duration
+
+
+async def benchmark_runtime(watchers, updates: int) -> float:
+    """Queue based WatcherRuntime."""
+    loop = asyncio.get_event_loop()
+    runtime = WatcherRuntime(watchers)
+    runtime.start()
+    await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    for i in range(updates):
+        loop.call_soon(push_random_update, watchers)
+        await runtime.wait_updates()
+
+        # Let the watch loop reach its waiting point
+        await asyncio.sleep(0)
+
+    duration = time.perf_counter() - started
+
+    await runtime.stop()
+    return duration
+
+
+async def main():
+    random.seed(1)
+    updates = 5000
+
+    for count in (8, 50, 200):
+        old = await benchmark_wait_first_completed(create_watchers(count), updates)
+        new = await benchmark_runtime(create_watchers(count), updates)
+        print(f"Watchers {count:4}: "
+              f"wait(FIRST_COMPLETED) {old / updates * 1_000_000:8.1f} µs/update, "
+              f"runtime {new / updates * 1_000_000:8.1f} µs/update, "
+              f"speedup {old / new:5.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
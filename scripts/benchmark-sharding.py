@@ -0,0 +1,122 @@
+"""Benchmark how order book throughput scales with the number of worker processes.
+
+Exchanges are faked: each watch_order_book() call parses a synthetic JSON order book,
+like CCXT Pro does for websocket messages, and returns it immediately.
+The coordinator evaluates opportunities on every update, like the main loop.
+
+Throughput only scales up to the number of CPU cores.
+
+Run:
+
+    python scripts/benchmark-sharding.py
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import random
+import time
+from typing import List
+
+from order_book_recorder.config import EXCHANGE_FACTORIES, MARKETS, MARKET_DEPTHS
+from order_book_recorder.main import create_opportunity_evaluator, update_opportunities
+from order_book_recorder.runtime import WatcherRuntime, create_watchers
+from order_book_recorder.sharding import ShardedRuntime, assign_shards
+from order_book_recorder.synthetic import MID_PRICES, generate_order_book
+
+
+#: How long to measure each configuration, seconds
+DURATION = 10.0
+
+#: Order book levels in the fake websocket messages
+LEVELS = 500
+
+
+class FakeExchange:
+    """Return pre-serialised order books as fast as they are asked for."""
+
+    rateLimit = 100
+
+    def __init__(self, name: str):
+        rng = random.Random(name)
+        self.symbols = MARKETS
+        self.nonce = 0
+        self.messages = {}
+        for market in MARKETS:
+            mid_price = MID_PRICES[market.split("/")[0]]
+            self.messages[market] = [json.dumps(generate_order_book(LEVELS, mid_price * (1 + rng.gauss(0, 0.001)), rng)) for i in range(10)]
+
+    async def load_markets(self):
+        pass
+
+    async def watch_order_book(self, market, limit=None):
+        # Let other watchers run, like waiting for a websocket message
+        await asyncio.sleep(0)
+        self.nonce += 1
+        book = json.loads(self.messages[market][self.nonce % len(self.messages[market])])
+        book["nonce"] = self.nonce
+        return book
+
+    async def close(self):
+        pass
+
+
+async def setup_fake_exchanges(names: List[str] = None):
+    return {name: FakeExchange(name) for name in (names or EXCHANGE_FACTORIES.keys())}
+
+
+async def benchmark_single_process() -> float:
+    exchanges = await setup_fake_exchanges()
+    watchers, watchers_by_market = create_watchers(exchanges)
+    evaluator = create_opportunity_evaluator(watchers_by_market, MARKET_DEPTHS)
+    runtime = WatcherRuntime(watchers)
+    runtime.start()
+
+    books = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < DURATION:
+        updates = await runtime.wait_updates()
+        updated_watchers = [u.watcher for u in updates if u.watcher.refresh_depths()]
+        update_opportunities(evaluator, updated_watchers)
+        books += len(updated_watchers)
+
+    await runtime.stop()
+    return books / (time.perf_counter() - started)
+
+
+async def benchmark_sharded(worker_count: int) -> float:
+    runtime = ShardedRuntime(assign_shards(list(EXCHANGE_FACTORIES.keys()), worker_count), setup_fake_exchanges, logging.WARNING)
+    watchers, watchers_by_market = await runtime.connect()
+    evaluator = create_opportunity_evaluator(watchers_by_market, MARKET_DEPTHS)
+    runtime.start()
+
+    received_at_start = runtime.received
+    started = time.perf_counter()
+    while time.perf_counter() - started < DURATION:
+        updates = await runtime.wait_updates()
+        update_opportunities(evaluator, [u.watcher for u in updates])
+
+    books = runtime.received - received_at_start
+    duration = time.perf_counter() - started
+    await runtime.stop()
+    return books / duration
+
+
+async def run_all():
+    print(f"CPU cores: {multiprocessing.cpu_count()}")
+
+    single = await benchmark_single_process()
+    print(f"Single process: {single:10,.0f} books/s")
+
+    for worker_count in (1, 2, 4, 8):
+        throughput = await benchmark_sharded(worker_count)
+        print(f"Workers {worker_count}:      {throughput:10,.0f} books/s, {throughput / single:5.2f}x")
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.get_event_loop().run_until_complete(run_all())
+
+
+if __name__ == "__main__":
+    main()
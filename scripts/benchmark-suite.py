@@ -0,0 +1,162 @@
+"""Microbenchmarks for the depth, opportunity and alert hot paths.
+
+Times each function over synthetic order books and writes ops/sec and p50/p99 latency
+as JSON, so results can be compared between commits.
+
+Run:
+
+    python scripts/benchmark-suite.py --output benchmark-results.json
+"""
+import asyncio
+import json
+import logging
+import platform
+import random
+import time
+from typing import Callable, List
+
+import numpy as np
+import typer
+
+from order_book_recorder.alert import AlertBook
+from order_book_recorder.config import ALERT_THRESHOLD, RETRIGGER_THRESHOLD, OPPORTUNITY_TOP_K
+from order_book_recorder.depth import calculate_price_at_depths
+from order_book_recorder.main import create_opportunity_evaluator, update_opportunities
+from order_book_recorder.opportunity import find_opportunities
+from order_book_recorder.side import Side
+from order_book_recorder.synthetic import ORDER_BOOK_SIZES, generate_order_book, generate_target_levels, generate_watchers
+
+
+MARKETS = ["BTC/GBP", "ETH/GBP", "BTC/EUR", "ETH/EUR", "BTC/USD", "ETH/USD", "BTC/USDT", "ETH/USDT"]
+
+
+def summarise(name: str, params: dict, samples_ns: List[int]) -> dict:
+    samples = np.asarray(samples_ns, dtype=np.float64) / 1000
+    total_seconds = samples.sum() / 1_000_000
+    return {
+        "benchmark": name,
+        "params": params,
+        "rounds": len(samples),
+        "ops_per_sec": len(samples) / total_seconds if total_seconds else 0.0,
+        "p50_us": float(np.percentile(samples, 50)),
+        "p99_us": float(np.percentile(samples, 99)),
+    }
+
+
+def measure(func: Callable, rounds: int) -> List[int]:
+    samples = []
+    for i in range(rounds):
+        started = time.perf_counter_ns()
+        func()
+        samples.append(time.perf_counter_ns() - started)
+    return samples
+
+
+async def measure_async(func: Callable, rounds: int) -> List[int]:
+    samples = []
+    for i in range(rounds):
+        started = time.perf_counter_ns()
+        await func(i)
+        samples.append(time.perf_counter_ns() - started)
+    return samples
+
+
+def benchmark_depths(rng: random.Random, rounds: int) -> List[dict]:
+    results = []
+    for levels in ORDER_BOOK_SIZES:
+        book = generate_order_book(levels, 42_000.0, rng)
+        for depth_count in (1, 4, 16):
+            targets = generate_target_levels(depth_count)
+            samples = measure(lambda: calculate_price_at_depths(book["asks"], Side.ask, targets), rounds)
+            results.append(summarise("calculate_price_at_depths", {"levels": levels, "depths": depth_count}, samples))
+    return results
+
+
+def benchmark_find_opportunities(rng: random.Random, rounds: int) -> List[dict]:
+    results = []
+    for exchange_count in (2, 8, 16):
+        asks = {f"Exchange {i}": 42_000.0 * (1 + rng.gauss(0, 0.001)) for i in range(exchange_count)}
+        bids = {f"Exchange {i}": 42_000.0 * (1 + rng.gauss(0, 0.001)) for i in range(exchange_count)}
+        samples = measure(lambda: find_opportunities("BTC/EUR", 0.04, asks, bids, OPPORTUNITY_TOP_K, ALERT_THRESHOLD), rounds)
+        results.append(summarise("find_opportunities", {"exchanges": exchange_count}, samples))
+    return results
+
+
+def benchmark_update_opportunities(rng: random.Random, rounds: int) -> List[dict]:
+    results = []
+    for market_count in (1, 4, 8):
+        for exchange_count in (2, 8, 16):
+            for depth_count in (1, 4):
+                markets = MARKETS[:market_count]
+                depths = generate_target_levels(depth_count)
+                watchers_by_market = generate_watchers(exchange_count, markets, depths, 100, rng)
+                evaluator = create_opportunity_evaluator(watchers_by_market, {m: depths for m in markets})
+                watchers = [w for market_watchers in watchers_by_market.values() for w in market_watchers.values()]
+
+                # One changed book per update, like a single websocket message
+                samples = measure(lambda: update_opportunities(evaluator, [rng.choice(watchers)]), rounds)
+                results.append(summarise("update_opportunities", {"markets": market_count, "exchanges": exchange_count, "depths": depth_count}, samples))
+    return results
+
+
+async def benchmark_update_alerts(rng: random.Random, rounds: int) -> List[dict]:
+    results = []
+    for market_count in (1, 4, 8):
+        for depth_count in (1, 4):
+            markets = MARKETS[:market_count]
+            depths = generate_target_levels(depth_count)
+            watchers_by_market = generate_watchers(8, markets, depths, 100, rng)
+            evaluator = create_opportunity_evaluator(watchers_by_market, {m: depths for m in markets})
+            watchers = [w for market_watchers in watchers_by_market.values() for w in market_watchers.values()]
+
+            # Precompute a sequence of evaluations, so that alerts start, upgrade and end
+            cycles = []
+            for i in range(50):
+                w = rng.choice(watchers)
+                w.orderbook = generate_order_book(100, w.bid_price * (1 + rng.gauss(0, 0.002)), rng, nonce=i + 2)
+                w.refresh_depths()
+                cycles.append(update_opportunities(evaluator, [w]))
+                # Take a copy, as the evaluator reuses its result dictionary
+                cycles[-1] = {market: dict(depth_opportunities) for market, depth_opportunities in cycles[-1].items()}
+
+            alert_book = AlertBook(ALERT_THRESHOLD, RETRIGGER_THRESHOLD, {m: depths for m in markets})
+
+            samples = await measure_async(lambda i: alert_book.update(cycles[i % len(cycles)]), rounds)
+            results.append(summarise("update_alerts", {"markets": market_count, "depths": depth_count}, samples))
+
+    return results
+
+
+async def run_all(rounds: int) -> List[dict]:
+    rng = random.Random(1)
+    results = []
+    results += benchmark_depths(rng, rounds)
+    results += benchmark_find_opportunities(rng, rounds)
+    results += benchmark_update_opportunities(rng, rounds)
+    results += await benchmark_update_alerts(rng, rounds)
+    return results
+
+
+def main(output: str = "benchmark-results.json", rounds: int = 2000):
+    # Alerts log every start and end
+    logging.basicConfig(level=logging.WARNING)
+
+    results = asyncio.get_event_loop().run_until_complete(run_all(rounds))
+
+    for r in results:
+        params = " ".join(f"{k}={v}" for k, v in r["params"].items())
+        print(f"{r['benchmark']:28} {params:36} {r['ops_per_sec']:12,.0f} ops/s  p50 {r['p50_us']:9.1f} µs  p99 {r['p99_us']:9.1f} µs")
+
+    with open(output, "wt") as out:
+        json.dump({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "rounds": rounds,
+            "results": results,
+        }, out, indent=2)
+
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
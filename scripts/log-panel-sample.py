@@ -1,27 +1,26 @@
 import logging
-from typing import List
 
 from rich.layout import Layout
 from rich.panel import Panel
 from rich import print
 
-from order_book_recorder.logger import setup_logging
+from order_book_recorder.logger import setup_logging, stop_listener
 from order_book_recorder.logtable import BufferedOutputHandler, refresh_log_messages
 
 logger = logging.getLogger()
 
-captured_log: List[str] = []
+live_log_handler = BufferedOutputHandler()
 
 
 def generate_log_panel():
-    table = refresh_log_messages(captured_log)
+    table = refresh_log_messages(live_log_handler)
     return table
 
 
 def setup_log():
     global logger
     logger = setup_logging()
-    live_log_handler = BufferedOutputHandler(captured_log)
+    stop_listener()
     logger.handlers.clear()
     logger.handlers.append(live_log_handler)
 
@@ -0,0 +1,105 @@
+"""Cross currency arbitrage with negative cycle detection."""
+import asyncio
+import datetime
+import json
+
+import pytest
+
+from order_book_recorder.alert import AlertBook
+from order_book_recorder.currencygraph import CrossCurrencyEvaluator, CrossCurrencyOpportunity, CurrencyGraph
+from order_book_recorder.history import AlertHistory, AlertKind, AlertStore
+from order_book_recorder.side import Side
+
+
+MARKET_DEPTHS = {"BTC/GBP": 0.04, "BTC/EUR": 0.04, "EUR/GBP": 2000}
+
+
+def create_graph(btc_eur_bid: float) -> CurrencyGraph:
+    """BTC is 35,000 GBP on Kraken and EUR/GBP 0.85/0.86, BTC/EUR bid on Bitstamp decides if the cycle pays."""
+    graph = CurrencyGraph(MARKET_DEPTHS, ["EUR", "GBP"])
+    graph.update("Kraken", "BTC/GBP", {0.04: 35_000.0}, {0.04: 34_990.0})
+    graph.update("Bitstamp", "BTC/EUR", {0.04: 42_100.0}, {0.04: btc_eur_bid})
+    graph.update("Kraken", "EUR/GBP", {2000: 0.86}, {2000: 0.85})
+    return graph
+
+
+def test_profitable_cycle():
+    graph = create_graph(42_000.0)
+
+    cycles = graph.find_cycles()
+    assert len(cycles) == 1
+
+    opportunity = graph.cycle_to_opportunity(cycles[0])
+    assert isinstance(opportunity, CrossCurrencyOpportunity)
+    assert opportunity.market == "BTC/GBP"
+    assert opportunity.buy_exchange == "Kraken"
+    assert opportunity.sell_exchange == "Bitstamp"
+    assert opportunity.buy_price == 35_000.0
+
+    # Sell the coin for 42,000 EUR and convert the euros at 0.85
+    assert opportunity.sell_price == pytest.approx(42_000.0 * 0.85)
+    assert opportunity.profit_without_fees == pytest.approx(0.02)
+
+    assert [(leg.exchange_name, leg.market, leg.side) for leg in opportunity.legs] == [
+        ("Kraken", "BTC/GBP", Side.ask),
+        ("Bitstamp", "BTC/EUR", Side.bid),
+        ("Kraken", "EUR/GBP", Side.bid),
+    ]
+    assert opportunity.route == "Bitstamp BTC/EUR, Kraken EUR/GBP"
+
+
+def test_no_cycle():
+    # 41,000 EUR * 0.85 is less than we paid
+    graph = create_graph(41_000.0)
+    assert graph.find_negative_cycle("GBP") is None
+    assert graph.find_negative_cycle("EUR") is None
+    assert graph.find_cycles() == []
+    assert not graph.dirty
+
+
+def test_conversion_quotes_from_one_exchange():
+    graph = CurrencyGraph({"EUR/GBP": 2000}, ["EUR", "GBP"])
+
+    # Buying EUR on Kraken and selling it on Bitstamp would pay, but both legs come from the tightest spread
+    graph.update("Kraken", "EUR/GBP", {2000: 0.80}, {2000: 0.70})
+    graph.update("Bitstamp", "EUR/GBP", {2000: 0.90}, {2000: 0.85})
+
+    assert graph.edges[("EUR", "GBP")].exchange_name == "Bitstamp"
+    assert graph.edges[("GBP", "EUR")].exchange_name == "Bitstamp"
+    assert graph.find_cycles() == []
+
+
+def test_evaluator_only_searches_changed_graphs():
+    evaluator = CrossCurrencyEvaluator({market: [depth] for market, depth in MARKET_DEPTHS.items()}, ["EUR", "GBP"])
+    evaluator.update_prices("BTC/GBP", "Kraken", {0.04: 35_000.0}, {0.04: 34_990.0})
+    evaluator.update_prices("BTC/EUR", "Bitstamp", {0.04: 42_100.0}, {0.04: 42_000.0})
+    evaluator.update_prices("EUR/GBP", "Kraken", {2000: 0.86}, {2000: 0.85})
+
+    opportunities = evaluator.evaluate()
+    assert [o.route for o in opportunities["BTC/GBP"][0.04]] == ["Bitstamp BTC/EUR, Kraken EUR/GBP"]
+    assert opportunities["BTC/EUR"][0.04] == []
+
+    # Nothing changed, the same lists are returned
+    first = opportunities["BTC/GBP"]
+    assert evaluator.evaluate()["BTC/GBP"] is first
+
+    # The conversion rate moves against us
+    evaluator.update_prices("EUR/GBP", "Kraken", {2000: 0.83}, {2000: 0.82})
+    assert evaluator.evaluate()["BTC/GBP"][0.04] == []
+
+
+def test_legs_written_to_history(tmp_path):
+    graph = create_graph(42_000.0)
+    opportunity = graph.cycle_to_opportunity(graph.find_cycles()[0])
+
+    store = AlertStore(str(tmp_path / "alert-history.sqlite"))
+    alert_book = AlertBook(0.001, 0.0005, history=AlertHistory(10, store), kind=AlertKind.cross_currency)
+
+    started = datetime.datetime(2021, 11, 1, 12, 0)
+    asyncio.run(alert_book.update({"BTC/GBP": {0.04: [opportunity]}}, now=started))
+    asyncio.run(alert_book.update({"BTC/GBP": {0.04: []}}, now=started + datetime.timedelta(seconds=30)))
+
+    sell_exchange, legs = store.connection.execute("SELECT sell_exchange, legs FROM alerts").fetchone()
+    assert sell_exchange == "Bitstamp"
+    assert [leg["market"] for leg in json.loads(legs)] == ["BTC/GBP", "BTC/EUR", "EUR/GBP"]
+    store.close()
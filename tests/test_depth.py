@@ -0,0 +1,84 @@
+"""Order book depth calculation and liquidity queries."""
+import random
+
+import pytest
+
+from order_book_recorder.depth import LiquidityIndex, calculate_price_at_depths, calculate_price_at_depths_python, search_depth_profile, walk_depth_profile
+from order_book_recorder.side import Side
+from order_book_recorder.synthetic import generate_side
+from order_book_recorder.watcher import Watcher
+
+
+def test_walk_and_search_agree():
+    rng = random.Random(1)
+    for i in range(100):
+        asks = generate_side(rng.randint(1, 300), 42_000.0, 1, rng)
+        total = sum(q for p, q in asks)
+        # Some targets are deeper than the book
+        targets = [rng.uniform(0, total * 1.2) for j in range(rng.randint(1, 20))]
+
+        assert walk_depth_profile(asks, targets) == search_depth_profile(asks, targets)
+        assert calculate_price_at_depths(asks, Side.ask, targets) == calculate_price_at_depths_python(asks, Side.ask, targets)
+
+
+def test_walk_stops_at_deepest_target():
+    asks = [[100.0, 1.0], [101.0, 1.0], [102.0, 1.0], [103.0, 1.0]]
+    success, levels, max_level, level_count = walk_depth_profile(asks, [1.5, 0.5])
+    assert success
+    assert levels == {1.5: 100.5, 0.5: 100.0}
+    assert max_level == 2.0
+    assert level_count == 2
+
+
+def test_liquidity_partial_last_level():
+    index = LiquidityIndex([[100.0, 1.0], [102.0, 1.0], [104.0, 2.0]], Side.ask)
+
+    assert index.price_at_quantity(1.0) == 100.0
+    # Half of the second level
+    assert index.price_at_quantity(1.5) == pytest.approx((100.0 + 0.5 * 102.0) / 1.5)
+    assert index.price_at_quantity(3.0) == pytest.approx((100.0 + 102.0 + 104.0) / 3.0)
+    assert index.price_at_quantity(0) == 100.0
+
+
+def test_liquidity_beyond_book():
+    index = LiquidityIndex([[100.0, 1.0], [102.0, 1.0]], Side.ask)
+    assert index.total_quantity == 2.0
+    assert index.price_at_quantity(2.0) == pytest.approx(101.0)
+    assert index.price_at_quantity(2.5) is None
+
+    empty = LiquidityIndex([], Side.bid)
+    assert empty.total_quantity == 0
+    assert empty.price_at_quantity(1.0) is None
+    assert empty.quantity_at_price(100.0) == 0
+
+
+def test_liquidity_asks_and_bids():
+    asks = LiquidityIndex([[100.0, 1.0], [101.0, 2.0], [102.0, 3.0]], Side.ask)
+    bids = LiquidityIndex([[99.0, 1.0], [98.0, 2.0], [97.0, 3.0]], Side.bid)
+
+    # Buying up to a limit takes the levels at or below it
+    assert asks.quantity_at_price(99.5) == 0
+    assert asks.quantity_at_price(101.0) == 3.0
+    assert asks.quantity_at_price(150.0) == 6.0
+
+    # Selling down to a limit takes the levels at or above it
+    assert bids.quantity_at_price(99.5) == 0
+    assert bids.quantity_at_price(98.0) == 3.0
+    assert bids.quantity_at_price(50.0) == 6.0
+
+    assert bids.price_at_quantity(2.0) == pytest.approx((99.0 + 98.0) / 2)
+
+
+def test_watcher_liquidity_follows_book_version():
+    watcher = Watcher("Kraken", "BTC/EUR", None, [0.04])
+    book = {"asks": [[100.0, 1.0], [102.0, 1.0]], "bids": [[99.0, 1.0]], "nonce": 1, "timestamp": None}
+    watcher.orderbook = book
+    assert watcher.price_at_quantity(Side.ask, 2.0) == pytest.approx(101.0)
+
+    # Exchange client updates the book in place
+    book["asks"][1] = [104.0, 1.0]
+    book["nonce"] = 2
+    assert watcher.price_at_quantity(Side.ask, 2.0) == pytest.approx(102.0)
+
+    # Same version, same index
+    assert watcher.get_liquidity_index(Side.ask) is watcher.get_liquidity_index(Side.ask)
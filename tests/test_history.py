@@ -0,0 +1,68 @@
+"""Alert history spills ended alerts to SQLite."""
+import asyncio
+import datetime
+
+from order_book_recorder.alert import AlertBook
+from order_book_recorder.history import AlertHistory, AlertKind, AlertStore
+from order_book_recorder.opportunity import Opportunity
+
+
+def test_ended_alert_written_to_store(tmp_path):
+    store = AlertStore(str(tmp_path / "alert-history.sqlite"))
+    history = AlertHistory(10, store)
+    alert_book = AlertBook(0.001, 0.0005, {"BTC/EUR": [0.04]}, history)
+
+    started = datetime.datetime(2021, 11, 1, 12, 0)
+    profitable = Opportunity("BTC/EUR", "Kraken", "Bitstamp", 0.04, 50_000.0, 50_200.0)
+    unprofitable = Opportunity("BTC/EUR", "Kraken", "Bitstamp", 0.04, 50_000.0, 50_010.0)
+
+    asyncio.run(alert_book.update({"BTC/EUR": {0.04: [profitable]}}, now=started))
+    asyncio.run(alert_book.update({"BTC/EUR": {0.04: [unprofitable]}}, now=started + datetime.timedelta(seconds=30)))
+
+    assert alert_book.history is history
+    assert history.total == 1
+    assert store.connection.execute("SELECT COUNT(*) FROM alerts").fetchone()[0] == 1
+
+    summaries = store.summarise()
+    assert summaries[0].market == "BTC/EUR"
+    assert summaries[0].total_duration == 30
+    store.close()
+
+
+def test_cross_currency_alerts_summarised_separately(tmp_path):
+    store = AlertStore(str(tmp_path / "alert-history.sqlite"))
+    history = AlertHistory(10, store)
+    alert_book = AlertBook(0.001, 0.0005, {"BTC/EUR": [0.04]}, history)
+    cross_alert_book = AlertBook(0.001, 0.0005, {"BTC/EUR": [0.04]}, history, kind=AlertKind.cross_currency)
+
+    started = datetime.datetime(2021, 11, 1, 12, 0)
+    ended = started + datetime.timedelta(seconds=30)
+    profitable = Opportunity("BTC/EUR", "Kraken", "Bitstamp", 0.04, 50_000.0, 50_200.0)
+    cross = Opportunity("BTC/EUR", "Kraken", "Bitstamp BTC/GBP, Kraken EUR/GBP", 0.04, 50_000.0, 50_200.0)
+
+    for book, opportunity in ((alert_book, profitable), (cross_alert_book, cross)):
+        asyncio.run(book.update({"BTC/EUR": {0.04: [opportunity]}}, now=started))
+        asyncio.run(book.update({"BTC/EUR": {0.04: []}}, now=ended))
+
+    summaries = store.summarise()
+    assert sorted((s.kind.value, s.count) for s in summaries) == [("cross_currency", 1), ("market", 1)]
+    assert [s.kind for s in store.summarise(kind=AlertKind.cross_currency)] == [AlertKind.cross_currency]
+    store.close()
+
+
+def test_background_writes_flushed_on_close(tmp_path):
+    path = str(tmp_path / "alert-history.sqlite")
+    store = AlertStore(path)
+    store.start()
+    alert_book = AlertBook(0.001, 0.0005, {"BTC/EUR": [0.04]}, AlertHistory(10, store))
+
+    started = datetime.datetime(2021, 11, 1, 12, 0)
+    profitable = Opportunity("BTC/EUR", "Kraken", "Bitstamp", 0.04, 50_000.0, 50_200.0)
+    for i in range(5):
+        asyncio.run(alert_book.update({"BTC/EUR": {0.04: [profitable]}}, now=started + datetime.timedelta(seconds=i * 60)))
+        asyncio.run(alert_book.update({"BTC/EUR": {0.04: []}}, now=started + datetime.timedelta(seconds=i * 60 + 30)))
+    store.close()
+
+    store = AlertStore(path)
+    assert store.summarise()[0].count == 5
+    store.close()
@@ -0,0 +1,37 @@
+"""Shared memory price board."""
+import math
+import os
+
+import pytest
+
+from order_book_recorder.priceboard import PriceBoard
+from order_book_recorder.side import Side
+
+
+@pytest.fixture
+def board():
+    board = PriceBoard.create(f"test-prices-{os.getpid()}", ["Kraken", "Bitstamp"], {"BTC/EUR": [0.04, 0.5]})
+    yield board
+    board.close()
+
+
+def test_read_written_prices(board):
+    board.write("Kraken", "BTC/EUR", {0.04: 50_000.0}, {0.04: 49_990.0, 0.5: 49_900.0})
+
+    reader = PriceBoard.attach(board.shm.name)
+    assert reader.get_price("Kraken", "BTC/EUR", Side.ask, 0.04) == 50_000.0
+    assert reader.get_price("Kraken", "BTC/EUR", Side.bid, 0.5) == 49_900.0
+    assert math.isnan(reader.get_price("Kraken", "BTC/EUR", Side.ask, 0.5))
+    assert reader.read().sequence == 2
+    reader.close()
+
+
+def test_reader_gives_up_on_unfinished_write(board):
+    # Writer died in the middle of a write
+    board.sequence[0] += 1
+
+    with pytest.raises(TimeoutError):
+        board.read_consistent(lambda: board.prices.copy(), timeout=0.05)
+
+    with pytest.raises(TimeoutError):
+        board.read()
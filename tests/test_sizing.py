@@ -0,0 +1,55 @@
+"""Fee-aware optimal trade size."""
+import pytest
+
+from order_book_recorder.sizing import calculate_optimal_size
+
+
+def test_crossed_books_across_levels():
+    asks = [[100.0, 1.0], [101.0, 1.0], [103.0, 5.0]]
+    bids = [[104.0, 0.5], [102.0, 2.0], [100.0, 5.0]]
+
+    quantity, profit = calculate_optimal_size(asks, bids, 0, 0)
+
+    # 0.5 @ 100 -> 104, 0.5 @ 100 -> 102, 1.0 @ 101 -> 102, then 103 -> 102 loses
+    assert quantity == pytest.approx(2.0)
+    assert profit == pytest.approx(0.5 * 4 + 0.5 * 2 + 1.0 * 1)
+
+
+def test_partial_level():
+    # The bid level runs out in the middle of the first ask level
+    asks = [[100.0, 2.0], [105.0, 1.0]]
+    bids = [[102.0, 0.75], [99.0, 3.0]]
+
+    quantity, profit = calculate_optimal_size(asks, bids, 0, 0)
+
+    assert quantity == pytest.approx(0.75)
+    assert profit == pytest.approx(0.75 * 2)
+
+
+def test_fees_stop_the_walk():
+    asks = [[100.0, 1.0], [100.5, 1.0]]
+    bids = [[101.0, 1.0], [100.9, 1.0]]
+
+    # Without fees both levels are profitable
+    assert calculate_optimal_size(asks, bids, 0, 0)[0] == pytest.approx(2.0)
+
+    # 0.4% on both sides leaves only the first level profitable
+    quantity, profit = calculate_optimal_size(asks, bids, 0.004, 0.004)
+    assert quantity == pytest.approx(1.0)
+    assert profit == pytest.approx(101.0 * 0.996 - 100.0 * 1.004)
+
+    # Fees bigger than the spread kill the trade completely
+    assert calculate_optimal_size(asks, bids, 0.005, 0.005) == (0, 0)
+
+
+def test_empty_sides():
+    levels = [[100.0, 1.0]]
+    assert calculate_optimal_size([], levels, 0, 0) == (0, 0)
+    assert calculate_optimal_size(levels, [], 0, 0) == (0, 0)
+    assert calculate_optimal_size([], [], 0, 0) == (0, 0)
+
+
+def test_books_not_crossed():
+    asks = [[101.0, 1.0]]
+    bids = [[100.0, 1.0]]
+    assert calculate_optimal_size(asks, bids, 0, 0) == (0, 0)
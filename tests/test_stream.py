@@ -0,0 +1,27 @@
+"""JSON-lines opportunity stream."""
+import json
+
+from order_book_recorder.opportunity import Opportunity
+from order_book_recorder.stream import OpportunityStream
+from order_book_recorder.watcher import Watcher
+
+
+def test_stream_writes_both_kinds(tmp_path):
+    path = str(tmp_path / "opportunities.jsonl")
+    watcher = Watcher("Kraken", "BTC/EUR", None, [0.04])
+    watcher.ask_price = 50_000.0
+
+    same_market = Opportunity("BTC/EUR", "Kraken", "Bitstamp", 0.04, 50_000.0, 50_200.0)
+    cross = Opportunity("BTC/EUR", "Kraken", "Bitstamp BTC/GBP, Kraken EUR/GBP", 0.04, 50_000.0, 50_300.0)
+
+    stream = OpportunityStream(path, max_bytes=1_000_000, backup_count=1, queue_size=10, top_n=3)
+    stream.start()
+    stream.put([watcher], {"BTC/EUR": {0.04: [same_market]}}, timestamp=1.0, cross_opportunities={"BTC/EUR": {0.04: [cross]}})
+    stream.close()
+
+    with open(path) as inp:
+        lines = [json.loads(line) for line in inp]
+
+    assert len(lines) == 1
+    assert lines[0]["tickers"] == [{"exchange": "Kraken", "market": "BTC/EUR", "ask": 50_000.0, "bid": None}]
+    assert [(o["kind"], o["sell_price"]) for o in lines[0]["opportunities"]] == [("market", 50_200.0), ("cross_currency", 50_300.0)]
@@ -0,0 +1,91 @@
+"""Telegram notifier against a local Bot API stand-in."""
+import asyncio
+
+from aiohttp import web
+
+from order_book_recorder.telegram import MAX_MESSAGE_LENGTH, Message, TelegramNotifier, merge_messages
+
+
+async def run_stand_in(responses: list, received: list) -> web.AppRunner:
+    """Answer sendMessage with the given (status, json) responses, then with 200."""
+
+    async def send_message(request):
+        received.append((await request.json())["text"])
+        status, data = responses.pop(0) if responses else (200, {"ok": True})
+        return web.json_response(data, status=status)
+
+    app = web.Application()
+    app.router.add_post("/bottoken/sendMessage", send_message)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner
+
+
+def get_url(runner: web.AppRunner) -> str:
+    host, port = runner.addresses[0][:2]
+    return f"http://{host}:{port}"
+
+
+async def wait_idle(notifier: TelegramNotifier, requests: int, received: list):
+    for i in range(200):
+        if len(received) >= requests and not notifier.pending:
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_throttled_message_retried():
+    async def run():
+        received = []
+        runner = await run_stand_in([(429, {"ok": False, "parameters": {"retry_after": 0.05}})], received)
+        notifier = TelegramNotifier(get_url(runner), "token", "1")
+        notifier.start()
+        notifier.submit("Title", "Text")
+        await wait_idle(notifier, 2, received)
+        await notifier.close()
+        await runner.cleanup()
+        return notifier, received
+
+    notifier, received = asyncio.run(run())
+    assert received == ["Title\nText", "Title\nText"]
+    assert notifier.sent == 2
+    assert notifier.failed == 0
+
+
+def test_queued_messages_merged():
+    async def run():
+        received = []
+        runner = await run_stand_in([], received)
+        # One message now, the next one only after a long wait
+        notifier = TelegramNotifier(get_url(runner), "token", "1", rate=5, burst=1)
+        notifier.start()
+        notifier.submit("Alert 0", "Text")
+        await wait_idle(notifier, 1, received)
+        # These queue up while the bucket refills
+        for i in range(1, 5):
+            notifier.submit(f"Alert {i}", "Text")
+        await wait_idle(notifier, 2, received)
+        await notifier.close()
+        await runner.cleanup()
+        return notifier, received
+
+    notifier, received = asyncio.run(run())
+    assert len(received) == 2
+    assert received[0] == "Alert 0\nText"
+    assert received[1].startswith("📋 4 notifications")
+    assert notifier.merged == 4
+
+
+def test_full_digest_counts_left_out_notifications():
+    messages = [Message(f"Alert {i}", "x" * 100) for i in range(100)]
+    digest = merge_messages(messages)
+
+    assert len(digest.format()) <= MAX_MESSAGE_LENGTH
+    assert digest.count + digest.dropped == 100
+    assert digest.dropped > 0
+    assert digest.format().endswith(f"+{digest.dropped} more")
+
+    # Merging a full digest again keeps the count of what was left out
+    again = merge_messages([digest, Message("Alert 100", "Text")])
+    assert again.count + again.dropped == 101
+    assert len(again.format()) <= MAX_MESSAGE_LENGTH